@@ -0,0 +1,88 @@
+import argparse
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+import database
+
+#
+# Аутентификация API (AUTH_MODE=token; в режиме single - по умолчанию -
+# все запросы относятся к DEFAULT_OWNER_ID и токены не нужны).
+#
+# Владелец задач (tenant) берется только из подписанного токена
+# (Authorization: Bearer <token>), а не из того, что прислал клиент.
+# Токен - {"sub": id пользователя}, подписанный AUTH_SECRET (HMAC, itsdangerous);
+# подделать или поменять в нем id без секрета нельзя.
+# Без AUTH_SECRET сервер отклоняет все запросы (fail closed).
+# Токены выдаются каждому пользователю отдельно и хранятся у клиента
+# (скрипт, интеграция); общий токен, вшитый в публичный фронтенд, делает
+# всех его пользователей одним владельцем - для этого есть режим single.
+#
+# Выдать токен (пользователи - таблица users):
+#   python auth.py create-user "Alice"   -> id нового пользователя и токен
+#   python auth.py token 1               -> новый токен пользователя 1
+#
+SALT = "task-api-token"
+
+
+class InvalidToken(ValueError):
+    """Токена нет, он поврежден, просрочен или подписан другим ключом"""
+
+
+def _serializer(secret: str) -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(secret, salt=SALT)
+
+
+def issue_token(user_id: int, secret: str | None = None) -> str:
+    secret = secret or database.settings.AUTH_SECRET
+    if not secret:
+        raise RuntimeError("AUTH_SECRET is not configured")
+    return _serializer(secret).dumps({"sub": user_id})
+
+
+def verify_token(token: str, secret: str | None, max_age: int = 0) -> int:
+    """id пользователя из токена; max_age - срок жизни в секундах (0 = без срока)"""
+    if not secret:
+        raise InvalidToken("AUTH_SECRET is not configured")
+    try:
+        data = _serializer(secret).loads(token, max_age=max_age or None)
+        user_id = int(data["sub"])
+    except (BadSignature, KeyError, TypeError, ValueError) as e:
+        raise InvalidToken(str(e)) from e
+    if user_id < 1:
+        raise InvalidToken(f"Invalid user id {user_id}")
+    return user_id
+
+
+def bearer_owner_id(authorization: str | None) -> int:
+    """Владелец из заголовка Authorization: Bearer <token>"""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        raise InvalidToken("Missing bearer token")
+    settings = database.settings
+    return verify_token(token.strip(), settings.AUTH_SECRET, settings.AUTH_TOKEN_MAX_AGE_SECONDS)
+
+
+def main():
+    import crud
+
+    parser = argparse.ArgumentParser(description="Пользователи и токены API")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create-user", help="создать пользователя и выдать токен")
+    create.add_argument("name")
+    token = commands.add_parser("token", help="выдать токен существующему пользователю")
+    token.add_argument("user_id", type=int)
+    args = parser.parse_args()
+
+    with database.SessionLocal() as db:
+        if args.command == "create-user":
+            user = crud.create_user(db, args.name)
+        else:
+            user = crud.get_user(db, args.user_id)
+            if user is None:
+                parser.error(f"User {args.user_id} not found")
+    print(f"user_id: {user.id}")
+    print(f"token:   {issue_token(user.id)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+# Бенчмарки запускаются из папки backend:
+#   python -m benchmarks.bench_pagination --rows 1000000
+# Нагрузочный набор с JSON-отчетом и регрессионным гейтом:
+#   python -m benchmarks.load --output current.json
+#   python -m benchmarks.compare baseline.json current.json
+# Холодный старт (время до первого ответа и разбор -X importtime):
+#   python -m benchmarks.bench_startup --repeat 5
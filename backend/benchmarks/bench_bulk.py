@@ -0,0 +1,90 @@
+"""
+Пропускная способность: поштучные эндпоинты против /tasks/bulk.
+
+    python -m benchmarks.bench_bulk --items 5000 --batch 500
+
+Запросы идут в приложение in-process (TestClient), база - временный
+SQLite-файл (или --url), поэтому разница - это именно число
+запросов/транзакций, а не сеть.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("AUTH_SECRET", "bench-secret")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import auth  # noqa: E402
+import crud  # noqa: E402
+from database import Base  # noqa: E402
+from main import app, get_session_factory  # noqa: E402
+
+
+def make_client(url: str) -> TestClient:
+    engine = create_engine(url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with Session() as db:
+        crud.create_user(db, "bench")
+
+    app.dependency_overrides[get_session_factory] = lambda: Session
+    return TestClient(app, headers={"Authorization": f"Bearer {auth.issue_token(1)}"})
+
+
+def rate(label: str, items: int, fn):
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<24} {items / elapsed:>10.0f} items/s  ({elapsed:.2f} s)")
+
+
+def chunks(seq, size):
+    for start in range(0, len(seq), size):
+        yield seq[start:start + size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--url", default=None)
+    args = parser.parse_args()
+    payload = [{"title": f"Task {i}", "description": "bench"} for i in range(args.items)]
+
+    def url():
+        return args.url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+    with make_client(url()) as client:
+        ids = []
+        rate("POST /tasks/", args.items,
+             lambda: ids.extend(client.post("/tasks/", json=t).json()["id"] for t in payload))
+        rate("PUT /tasks/{id}", args.items,
+             lambda: [client.put(f"/tasks/{i}", json={"status": "done"}) for i in ids])
+        rate("DELETE /tasks/{id}", args.items,
+             lambda: [client.delete(f"/tasks/{i}") for i in ids])
+
+    with make_client(url()) as client:
+        ids = []
+        rate("POST /tasks/bulk", args.items, lambda: ids.extend(
+            item["id"]
+            for batch in chunks(payload, args.batch)
+            for item in client.post("/tasks/bulk", json=batch).json()
+        ))
+        rate("PATCH /tasks/bulk", args.items, lambda: [
+            client.patch("/tasks/bulk", json=[{"id": i, "status": "done"} for i in batch])
+            for batch in chunks(ids, args.batch)
+        ])
+        rate("DELETE /tasks/bulk", args.items, lambda: [
+            client.request("DELETE", "/tasks/bulk", json={"ids": batch})
+            for batch in chunks(ids, args.batch)
+        ])
+
+
+if __name__ == "__main__":
+    main()
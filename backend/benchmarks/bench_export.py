@@ -0,0 +1,50 @@
+"""
+Пиковая память потокового экспорта при росте таблицы.
+
+    python -m benchmarks.bench_export --rows 10000 100000 1000000
+    python -m benchmarks.bench_export --url postgresql://... --rows 10000 10000000
+
+Пик считается через tracemalloc (только Python-аллокации) и должен
+оставаться примерно одинаковым: в памяти живет одна пачка строк.
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import export  # noqa: E402
+from benchmarks.bench_pagination import seed  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--format", choices=sorted(export.FORMATS), default="ndjson")
+    parser.add_argument("--url", default=None)
+    args = parser.parse_args()
+
+    url = args.url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(url)
+    Session = sessionmaker(bind=engine)
+
+    print(f"{'rows':>10} {'MB out':>8} {'seconds':>8} {'peak MB':>8}")
+    for rows in args.rows:
+        seed(engine, rows)
+        with Session() as db:
+            tracemalloc.start()
+            started = time.perf_counter()
+            size = sum(len(chunk) for chunk in export.stream_export(db, 1, args.format))
+            elapsed = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        print(f"{rows:>10} {size / 2**20:>8.1f} {elapsed:>8.2f} {peak / 2**20:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Скорость импорта POST /tasks/import (строк в секунду).
+
+    python -m benchmarks.bench_import --rows 200000
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_import --rows 1000000
+
+Тело отправляется через TestClient в приложение; по умолчанию БД -
+временный SQLite-файл (executemany), с PostgreSQL работает COPY.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+)
+os.environ.setdefault("AUTH_SECRET", "bench-secret")
+
+import orjson  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+import auth  # noqa: E402
+import crud  # noqa: E402
+import database  # noqa: E402
+from main import app  # noqa: E402
+
+
+def ndjson_body(rows: int) -> bytes:
+    return b"".join(
+        orjson.dumps({"title": f"Legacy {i}", "description": "imported"}) + b"\n"
+        for i in range(rows)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    database.Base.metadata.drop_all(bind=database.engine)
+    database.Base.metadata.create_all(bind=database.engine)
+    with database.SessionLocal() as db:
+        crud.create_user(db, "bench")
+    body = ndjson_body(args.rows)
+
+    with TestClient(app, headers={"Authorization": f"Bearer {auth.issue_token(1)}"}) as client:
+        started = time.perf_counter()
+        response = client.post("/tasks/import", content=body)
+        elapsed = time.perf_counter() - started
+
+    result = response.json()
+    print(f"driver: {database.engine.dialect.driver}")
+    print(f"imported {result['imported']} rows ({result['failed']} failed) "
+          f"in {elapsed:.2f} s -> {result['imported'] / elapsed:,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
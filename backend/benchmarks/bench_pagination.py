@@ -0,0 +1,76 @@
+"""
+Сравнение задержки страницы: OFFSET против курсора (keyset).
+
+    python -m benchmarks.bench_pagination --rows 1000000
+    python -m benchmarks.bench_pagination --url postgresql://... --rows 1000000
+
+По умолчанию данные сидируются во временный SQLite-файл.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import crud  # noqa: E402
+import models  # noqa: E402
+from database import Base  # noqa: E402
+
+
+def seed(engine, rows: int, chunk: int = 10_000, owners: int = 1):
+    """Задача с id = i + 1 принадлежит владельцу i % owners + 1"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [{"name": f"Owner {i}"} for i in range(1, owners + 1)])
+        for start in range(0, rows, chunk):
+            conn.execute(
+                insert(models.Task),
+                [{"title": f"Task {i}", "description": "bench", "owner_id": i % owners + 1}
+                 for i in range(start, min(start + chunk, rows))],
+            )
+
+
+def timed(fn, repeat: int) -> float:
+    """Медиана времени вызова в миллисекундах"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--url", default=None)
+    args = parser.parse_args()
+
+    url = args.url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(url)
+    print(f"Seeding {args.rows} rows into {engine.url.render_as_string()} ...")
+    seed(engine, args.rows)
+
+    Session = sessionmaker(bind=engine)
+    print(f"{'depth':>10} {'offset, ms':>12} {'cursor, ms':>12}")
+    for depth in (0, args.rows // 100, args.rows // 10, args.rows // 2, args.rows - args.limit):
+        with Session() as db:
+            # Курсор "последней строки предыдущей страницы" для этой глубины
+            anchor = db.get(models.Task, depth) if depth else None
+            cursor = crud.encode_cursor("id", anchor) if anchor else None
+
+            offset_ms = timed(lambda: crud.get_tasks_page(db, 1, limit=args.limit, skip=depth), args.repeat)
+            cursor_ms = timed(lambda: crud.get_tasks_page(db, 1, limit=args.limit, cursor=cursor), args.repeat)
+        print(f"{depth:>10} {offset_ms:>12.2f} {cursor_ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
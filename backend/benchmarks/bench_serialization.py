@@ -0,0 +1,70 @@
+"""
+Стоимость сериализации списка задач на одну строку: старый путь против быстрого.
+
+    python -m benchmarks.bench_serialization --rows 5000
+
+  - orm+jsonable:  ORM-объекты -> response_model (from_attributes) -> jsonable_encoder + json
+                   (как FastAPI делал для List[schemas.Task])
+  - orm+adapter:   ORM-объекты -> TaskList.validate_python -> dump_json
+  - rows+orjson:   кортежи колонок -> schemas.dump_task_rows (текущий GET /tasks/)
+
+Время включает чтение из БД (SQLite в памяти), ведь быстрый путь экономит
+и на построении ORM-объектов.
+"""
+import argparse
+import json
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+import crud  # noqa: E402
+import schemas  # noqa: E402
+from benchmarks.bench_pagination import seed, timed  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    seed(engine, args.rows)
+    Session = sessionmaker(bind=engine)
+
+    def orm_jsonable():
+        with Session() as db:
+            tasks, _ = crud.get_tasks_page(db, 1, limit=args.rows)
+            models_ = [schemas.Task.model_validate(t) for t in tasks]
+            return json.dumps(jsonable_encoder(models_)).encode()
+
+    def orm_adapter():
+        with Session() as db:
+            tasks, _ = crud.get_tasks_page(db, 1, limit=args.rows)
+            return schemas.TaskList.dump_json(
+                schemas.TaskList.validate_python(tasks, from_attributes=True)
+            )
+
+    def rows_orjson():
+        with Session() as db:
+            rows, _ = crud.get_task_rows_page(db, 1, limit=args.rows)
+            return schemas.dump_task_rows(rows)
+
+    # Контракт ответа одинаковый (jsonable_encoder пишет UTC иначе, поэтому сравниваем как данные)
+    assert orm_adapter() == rows_orjson()
+    assert json.loads(orm_jsonable()) == json.loads(rows_orjson())
+
+    print(f"{'path':>14} {'total, ms':>10} {'per row, us':>12}")
+    for name, fn in (("orm+jsonable", orm_jsonable), ("orm+adapter", orm_adapter),
+                     ("rows+orjson", rows_orjson)):
+        ms = timed(fn, args.repeat)
+        print(f"{name:>14} {ms:>10.2f} {ms * 1000 / args.rows:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
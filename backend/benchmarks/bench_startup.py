@@ -0,0 +1,216 @@
+"""
+Холодный старт: время до первого ответа и разбор импорта (python -X importtime).
+
+    python -m benchmarks.bench_startup --repeat 5
+    python -m benchmarks.bench_startup --warmup-connections 2 --init-schema
+    python -m benchmarks.bench_startup --target uvicorn --url postgresql://...
+
+Каждый прогон - новый процесс интерпретатора (как после "пробуждения"
+инстанса на хостинге). Цели (--target):
+  asgi    - процесс импортирует main, выполняет lifespan и первый запрос
+            через httpx.ASGITransport; фазы меряются внутри процесса;
+  uvicorn - настоящий сервер, первый запрос опрашивается снаружи.
+
+time_to_first_response_ms - от запуска процесса до получения первого ответа
+(включая старт интерпретатора). imports - самые тяжелые прямые импорты
+модуля main по данным -X importtime: с них стоит начинать оптимизацию.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+
+
+def parse_importtime(stderr: str, module: str = "main", top: int = 10) -> dict:
+    """
+    Суммарное время импорта module и его самые тяжелые прямые импорты.
+    Python пишет дочерние модули перед родителем, с отступом на 2 пробела больше
+    """
+    entries = [
+        (int(self_us), int(cumulative_us), len(indent), name)
+        for self_us, cumulative_us, indent, name in IMPORT_LINE.findall(stderr)
+    ]
+    for index, (self_us, cumulative_us, depth, name) in enumerate(entries):
+        if name != module:
+            continue
+        children = []
+        for _, child_us, child_depth, child in reversed(entries[:index]):
+            if child_depth <= depth:
+                break
+            if child_depth == depth + 2:
+                children.append({"module": child, "cumulative_ms": round(child_us / 1000, 1)})
+        children.sort(key=lambda item: item["cumulative_ms"], reverse=True)
+        return {
+            "total_ms": round(cumulative_us / 1000, 1),
+            "self_ms": round(self_us / 1000, 1),
+            "imports": children[:top],
+        }
+    return {"total_ms": None, "self_ms": None, "imports": []}
+
+
+#
+# Дочерний процесс (--child): импорт -> lifespan -> первый запрос
+#
+def child(path: str) -> None:
+    import asyncio
+
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    # Клиент и токен нужны только бенчмарку - в фазы не входят
+    import httpx
+
+    import auth
+
+    async def first_response():
+        startup_started = time.perf_counter()
+        async with main.app.router.lifespan_context(main.app):
+            ready = time.perf_counter()
+            transport = httpx.ASGITransport(app=main.app)
+            headers = {"Authorization": f"Bearer {auth.issue_token(1)}"}
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://bench", headers=headers
+            ) as client:
+                response = await client.get(path)
+            done = time.perf_counter()
+            print(json.dumps({
+                "status": response.status_code,
+                "import_ms": round((imported - started) * 1000, 1),
+                "startup_ms": round((ready - startup_started) * 1000, 1),
+                "first_request_ms": round((done - ready) * 1000, 1),
+            }), flush=True)
+
+    asyncio.run(first_response())
+
+
+def run_asgi(path: str) -> tuple[dict, str]:
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-X", "importtime", "-m", "benchmarks.bench_startup", "--child", "--path", path],
+        cwd=BACKEND_DIR, env=os.environ.copy(),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+    )
+    line = process.stdout.readline()
+    elapsed = time.perf_counter() - started
+    _, stderr = process.communicate()
+    if process.returncode or not line:
+        raise RuntimeError(f"startup child failed:\n{stderr[-2000:]}")
+    return {**json.loads(line), "time_to_first_response_ms": round(elapsed * 1000, 1)}, stderr
+
+
+def run_uvicorn(path: str, timeout: float = 60) -> tuple[dict, str]:
+    import httpx
+
+    from benchmarks.load import free_port
+
+    port = free_port()
+    url = f"http://127.0.0.1:{port}{path}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-X", "importtime", "-m", "uvicorn", "main:app",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=os.environ.copy(),
+        stderr=subprocess.PIPE, text=True,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError("uvicorn exited during startup")
+            try:
+                response = httpx.get(url, timeout=timeout)
+                break
+            except httpx.TransportError:
+                time.sleep(0.005)
+        else:
+            raise RuntimeError(f"no response within {timeout} s")
+        elapsed = time.perf_counter() - started
+    finally:
+        process.terminate()
+        _, stderr = process.communicate()
+    return {"status": response.status_code, "time_to_first_response_ms": round(elapsed * 1000, 1)}, stderr
+
+
+def median_of(runs: list[dict]) -> dict:
+    keys = [key for key in runs[0] if key.endswith("_ms")]
+    return {key: round(statistics.median(run[key] for run in runs), 1) for key in keys}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--target", choices=("asgi", "uvicorn"), default="asgi")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--path", default="/tasks/?limit=1", help="первый запрос (идет в БД)")
+    parser.add_argument("--url", default=None, help="БД (по умолчанию - временный SQLite-файл)")
+    parser.add_argument("--db-async", action="store_true", help="DB_ASYNC=true")
+    parser.add_argument("--init-schema", action="store_true", help="DB_INIT_SCHEMA=true")
+    parser.add_argument("--warmup-connections", type=int, default=0, help="DB_WARMUP_CONNECTIONS")
+    parser.add_argument("--top", type=int, default=10, help="сколько импортов показать")
+    parser.add_argument("--output", default=None, help="файл для JSON (иначе stdout)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.path)
+        return
+
+    os.environ["DATABASE_URL"] = args.url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["DB_ASYNC"] = str(args.db_async).lower()
+    os.environ["DB_INIT_SCHEMA"] = str(args.init_schema).lower()
+    os.environ["DB_WARMUP_CONNECTIONS"] = str(args.warmup_connections)
+    os.environ.setdefault("AUTH_SECRET", "bench-secret")
+    sys.path.insert(0, BACKEND_DIR)
+
+    # Схема создается один раз заранее: перезапуск инстанса видит готовую БД
+    import database
+    import models  # noqa: F401
+
+    database.Base.metadata.create_all(bind=database.engine)
+    database.engine.dispose()
+
+    run = run_uvicorn if args.target == "uvicorn" else run_asgi
+    runs, imports = [], None
+    for attempt in range(args.repeat):
+        result, stderr = run(args.path)
+        runs.append(result)
+        imports = imports or parse_importtime(stderr, top=args.top)
+        print(f"run {attempt + 1}: " + "  ".join(
+            f"{key}={value}" for key, value in result.items()
+        ), file=sys.stderr)
+
+    report = {
+        "meta": {
+            "target": args.target,
+            "database": database.engine.dialect.name,
+            "db_async": args.db_async,
+            "init_schema": args.init_schema,
+            "warmup_connections": args.warmup_connections,
+            "path": args.path,
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "median": median_of(runs),
+        "runs": runs,
+        "import_main": imports,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Регрессионный гейт: сравнивает два отчета benchmarks.load.
+
+    python -m benchmarks.load --output baseline.json        # на main
+    python -m benchmarks.load --output current.json         # на ветке
+    python -m benchmarks.compare baseline.json current.json --tolerance 0.15
+
+Строки сопоставляются по (target, scenario, rows, concurrency). Регрессия -
+если задержка (--latency, по умолчанию p95) выросла или пропускная
+способность упала больше чем на --tolerance, либо появились ошибки.
+Код выхода 1 при регрессии - шаг CI падает.
+
+Сравнивать имеет смысл только прогоны на одной машине с одинаковыми
+параметрами: абсолютные числа между машинами несопоставимы.
+"""
+import argparse
+import json
+import sys
+
+KEY_FIELDS = ("target", "scenario", "rows", "concurrency")
+
+
+def load_results(path: str) -> dict[tuple, dict]:
+    with open(path) as fh:
+        report = json.load(fh)
+    return {tuple(result[field] for field in KEY_FIELDS): result for result in report["results"]}
+
+
+def compare(baseline: dict, current: dict, tolerance: float, latency: str = "p95_ms",
+            min_delta_ms: float = 0.5) -> list[dict]:
+    """
+    Строки сравнения для общих ключей. min_delta_ms - порог шума:
+    на субмиллисекундных задержках +20% - это случайность, а не регрессия
+    """
+    rows = []
+    for key in sorted(baseline.keys() & current.keys()):
+        before, after = baseline[key], current[key]
+        latency_change = after[latency] / before[latency] - 1 if before[latency] else 0.0
+        rps_change = after["throughput_rps"] / before["throughput_rps"] - 1
+        reasons = []
+        if latency_change > tolerance and after[latency] - before[latency] >= min_delta_ms:
+            reasons.append(f"{latency} +{latency_change:.0%}")
+        if rps_change < -tolerance:
+            reasons.append(f"throughput {rps_change:.0%}")
+        if after["errors"] > before["errors"]:
+            reasons.append(f"errors {before['errors']} -> {after['errors']}")
+        rows.append({
+            "key": key,
+            "latency_before": before[latency],
+            "latency_after": after[latency],
+            "latency_change": latency_change,
+            "rps_change": rps_change,
+            "regressions": reasons,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="допустимое ухудшение (0.15 = 15%%)")
+    parser.add_argument("--latency", choices=("p50_ms", "p95_ms", "p99_ms"), default="p95_ms")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5)
+    args = parser.parse_args()
+
+    baseline, current = load_results(args.baseline), load_results(args.current)
+    rows = compare(baseline, current, args.tolerance, args.latency, args.min_delta_ms)
+
+    print(f"{'target':<8} {'scenario':<12} {'rows':>8} {'c':>3} "
+          f"{args.latency + ' before':>14} {'after':>9} {'change':>8} {'rps':>7}")
+    for row in rows:
+        target, scenario, size, concurrency = row["key"]
+        flag = "  REGRESSION: " + ", ".join(row["regressions"]) if row["regressions"] else ""
+        print(f"{target:<8} {scenario:<12} {size:>8} {concurrency:>3} "
+              f"{row['latency_before']:>14.2f} {row['latency_after']:>9.2f} "
+              f"{row['latency_change']:>+8.0%} {row['rps_change']:>+7.0%}{flag}")
+
+    missing = baseline.keys() - current.keys()
+    if missing:
+        print(f"{len(missing)} baseline results have no counterpart in the current run", file=sys.stderr)
+    regressions = [row for row in rows if row["regressions"]]
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}", file=sys.stderr)
+        sys.exit(1)
+    print("No regressions", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
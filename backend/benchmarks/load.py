@@ -0,0 +1,377 @@
+"""
+Нагрузочный набор: функции crud.py и HTTP-эндпоинты под конкурентной нагрузкой.
+
+    python -m benchmarks.load --rows 1000 100000 --concurrency 1 16 --output current.json
+    python -m benchmarks.load --url postgresql://... --rows 1000000
+    python -m benchmarks.load --target uvicorn --workers 4
+    python -m benchmarks.load --rows 1000000 --owners 1000
+    python -m benchmarks.compare baseline.json current.json
+
+Цели (--target):
+  crud    - функции crud.py напрямую, каждый поток со своей сессией;
+  asgi    - приложение in-process через httpx.ASGITransport (без сети);
+  uvicorn - отдельный процесс uvicorn с --workers N, запросы по HTTP.
+
+На каждый объем данных (--rows) база пересоздается и сидируется, затем
+каждый сценарий выполняется --requests раз с --concurrency параллельными
+клиентами. Результат - JSON: пропускная способность и p50/p95/p99 задержки.
+Случайные id выбираются генератором с фиксированным --seed, так что два
+прогона выполняют одинаковую последовательность запросов.
+
+--owners N раскладывает задачи по N владельцам, каждый запрос идет
+с токеном (auth.py) владельца выбранной задачи. При росте --rows с пропорциональным
+--owners задержка не должна расти: запросы читают только строки владельца.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+STATUSES = ("todo", "in_progress", "done")
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    """Nearest-rank перцентиль по отсортированной выборке"""
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(ordered) / elapsed, 1),
+        "p50_ms": round(percentile(ordered, 0.50), 3),
+        "p95_ms": round(percentile(ordered, 0.95), 3),
+        "p99_ms": round(percentile(ordered, 0.99), 3),
+    }
+
+
+#
+# Сценарии. Каждый получает генератор случайных чисел клиента, число
+# строк в таблице и число владельцев; id выбираются из уже засеянных
+# 1..rows, владелец - тот, кому сид отдал задачу (см. bench_pagination.seed)
+#
+def pick_task(rng, rows: int, owners: int) -> tuple[int, int]:
+    task_id = rng.randint(1, rows)
+    return (task_id - 1) % owners + 1, task_id
+
+
+def pick_owner(rng, owners: int) -> int:
+    return rng.randint(1, owners)
+
+
+def _search_args(rng, rows: int, owners: int) -> tuple[int, str]:
+    owner_id, task_id = pick_task(rng, rows, owners)
+    return owner_id, str(task_id)
+
+
+def crud_scenarios():
+    import crud
+    import schemas
+
+    return {
+        "get_task": lambda db, rng, rows, owners: crud.get_task(db, *pick_task(rng, rows, owners)),
+        "list_page": lambda db, rng, rows, owners: crud.get_task_rows_page(
+            db, pick_owner(rng, owners), limit=50,
+            filters=schemas.TaskFilter(status=rng.choice(STATUSES)),
+        ),
+        "summary": lambda db, rng, rows, owners: crud.get_summary(db, pick_owner(rng, owners)),
+        "search": lambda db, rng, rows, owners: crud.search_tasks(
+            db, *_search_args(rng, rows, owners)
+        ),
+        "create_task": lambda db, rng, rows, owners: crud.create_task(
+            db, pick_owner(rng, owners),
+            schemas.TaskCreate(title=f"Load {rng.random()}", description="bench"),
+        ),
+        "update_task": lambda db, rng, rows, owners: crud.update_task(
+            db, *pick_task(rng, rows, owners), schemas.TaskUpdate(status=rng.choice(STATUSES))
+        ),
+    }
+
+
+def _get_task(rng, rows, owners):
+    owner_id, task_id = pick_task(rng, rows, owners)
+    return owner_id, "GET", f"/tasks/{task_id}", None
+
+
+def _search(rng, rows, owners):
+    # Сид пишет названия "Task <i>" - поиск по номеру находит одну задачу
+    owner_id, task_id = pick_task(rng, rows, owners)
+    return owner_id, "GET", f"/tasks/search?q={task_id}", None
+
+
+def _update_task(rng, rows, owners):
+    owner_id, task_id = pick_task(rng, rows, owners)
+    return owner_id, "PUT", f"/tasks/{task_id}", {"status": rng.choice(STATUSES)}
+
+
+# Сценарий -> (владелец, метод, путь, тело)
+HTTP_SCENARIOS = {
+    "get_task": _get_task,
+    "list_page": lambda rng, rows, owners: (
+        pick_owner(rng, owners), "GET", f"/tasks/?limit=50&status={rng.choice(STATUSES)}", None
+    ),
+    "summary": lambda rng, rows, owners: (pick_owner(rng, owners), "GET", "/tasks/summary", None),
+    "search": _search,
+    "create_task": lambda rng, rows, owners: (
+        pick_owner(rng, owners), "POST", "/tasks/", {"title": f"Load {rng.random()}"}
+    ),
+    "update_task": _update_task,
+}
+
+
+def run_crud(fn, rows: int, owners: int, requests: int, concurrency: int, seed: int) -> dict:
+    """Потоки, у каждого своя сессия - как sync-CRUD в threadpool FastAPI"""
+    import database
+
+    remaining = itertools.count()
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def worker(index: int):
+        rng = random.Random(seed + index)
+        local = []
+        with database.SessionLocal() as db:
+            while next(remaining) < requests:
+                started = time.perf_counter()
+                try:
+                    fn(db, rng, rows, owners)
+                except Exception:
+                    db.rollback()
+                    with lock:
+                        errors[0] += 1
+                local.append((time.perf_counter() - started) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+
+async def run_http(client, scenario, rows: int, owners: int, requests: int, concurrency: int,
+                   seed: int) -> dict:
+    import auth
+
+    remaining = itertools.count()
+    latencies, errors = [], 0
+    # Токены выдаем заранее: подпись не должна попадать в задержку запроса
+    tokens = {owner_id: f"Bearer {auth.issue_token(owner_id)}" for owner_id in range(1, owners + 1)}
+
+    async def worker(index: int):
+        nonlocal errors
+        rng = random.Random(seed + index)
+        while next(remaining) < requests:
+            owner_id, method, path, body = scenario(rng, rows, owners)
+            started = time.perf_counter()
+            try:
+                response = await client.request(
+                    method, path, json=body, headers={"Authorization": tokens[owner_id]}
+                )
+                errors += response.status_code >= 400
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+#
+# Сервер uvicorn в отдельном процессе (та же БД через DATABASE_URL)
+#
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_uvicorn(workers: int, timeout: float = 30):
+    import httpx
+
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=os.environ.copy(),
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("uvicorn exited during startup")
+        try:
+            httpx.get(base_url + "/", timeout=1)
+            return process, base_url
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"uvicorn did not start within {timeout} s")
+
+
+def run_crud_target(args, rows: int, scenarios: list[str]) -> list[dict]:
+    results = []
+    available = crud_scenarios()
+    for name in scenarios:
+        for concurrency in args.concurrency:
+            run_crud(available[name], rows, args.owners, args.warmup, 1, args.seed)
+            result = run_crud(
+                available[name], rows, args.owners, args.requests, concurrency, args.seed
+            )
+            results.append({"scenario": name, "concurrency": concurrency, **result})
+    return results
+
+
+async def run_http_target(args, rows: int, scenarios: list[str]) -> list[dict]:
+    import httpx
+
+    import database
+
+    results = []
+    process = None
+    if args.target == "uvicorn":
+        process, base_url = start_uvicorn(args.workers)
+        client = httpx.AsyncClient(base_url=base_url, limits=httpx.Limits(
+            max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency)
+        ))
+    else:
+        from main import app
+
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+    try:
+        async with client:
+            for name in scenarios:
+                for concurrency in args.concurrency:
+                    await run_http(
+                        client, HTTP_SCENARIOS[name], rows, args.owners, args.warmup, 1, args.seed
+                    )
+                    result = await run_http(
+                        client, HTTP_SCENARIOS[name], rows, args.owners,
+                        args.requests, concurrency, args.seed,
+                    )
+                    results.append({"scenario": name, "concurrency": concurrency, **result})
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        # Соединения async-пула привязаны к этому event loop (и держат потоки
+        # aiosqlite) - закрываем, следующий объем данных запустит новый loop
+        if database.async_engine is not None:
+            await database.async_engine.dispose()
+    return results
+
+
+def seed_database(rows: int, owners: int) -> None:
+    import crud
+    import database
+    from benchmarks.bench_pagination import seed
+
+    seed(database.engine, rows, owners=owners)
+    # Сид пишет в tasks напрямую - пересчитываем счетчики для /tasks/summary
+    with database.SessionLocal() as db:
+        for owner_id in range(1, owners + 1):
+            crud.rebuild_summary(db, owner_id)
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--target", choices=("crud", "asgi", "uvicorn"), default="asgi")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 100_000])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--requests", type=int, default=2000, help="запросов на сценарий")
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--owners", type=int, default=1, help="число владельцев задач")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(HTTP_SCENARIOS),
+                        default=list(HTTP_SCENARIOS))
+    parser.add_argument("--workers", type=int, default=2, help="воркеры uvicorn")
+    parser.add_argument("--url", default=None, help="БД (по умолчанию - временный SQLite-файл)")
+    parser.add_argument("--db-async", action="store_true", help="DB_ASYNC=true для приложения")
+    parser.add_argument("--cache", choices=("memory", "redis", "none"), default="none",
+                        help="CACHE_BACKEND (по умолчанию выключен - меряем путь до БД)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="файл для JSON (иначе stdout)")
+    args = parser.parse_args()
+
+    # Настройки читаются при импорте database.py - окружение задаем до него.
+    # uvicorn-процесс наследует то же окружение
+    os.environ["DATABASE_URL"] = args.url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["DB_ASYNC"] = str(args.db_async).lower()
+    os.environ["CACHE_BACKEND"] = args.cache
+    # Несколько владельцев - нужен режим токенов
+    os.environ.setdefault("AUTH_MODE", "token")
+    os.environ.setdefault("AUTH_SECRET", "bench-secret")
+    sys.path.insert(0, BACKEND_DIR)
+    import database
+
+    report = {
+        "meta": {
+            "target": args.target,
+            "database": database.engine.dialect.name,
+            "driver": database.engine.dialect.driver,
+            "db_async": args.db_async,
+            "cache": args.cache,
+            "workers": args.workers if args.target == "uvicorn" else None,
+            "requests": args.requests,
+            "owners": args.owners,
+            "seed": args.seed,
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        },
+        "results": [],
+    }
+    for rows in args.rows:
+        print(f"Seeding {rows} rows ...", file=sys.stderr)
+        seed_database(rows, args.owners)
+        if args.target == "crud":
+            results = run_crud_target(args, rows, args.scenarios)
+        else:
+            results = asyncio.run(run_http_target(args, rows, args.scenarios))
+        for result in results:
+            result = {"target": args.target, "rows": rows, **result}
+            report["results"].append(result)
+            print(f"{result['scenario']:<12} rows={rows:<8} c={result['concurrency']:<3} "
+                  f"{result['throughput_rps']:>9.1f} rps  p50={result['p50_ms']:.2f} "
+                  f"p95={result['p95_ms']:.2f} p99={result['p99_ms']:.2f} ms  "
+                  f"errors={result['errors']}", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
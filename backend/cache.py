@@ -0,0 +1,303 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from database import get_settings
+
+#
+# Кэш чтения (read-through) для GET /tasks/{id} и GET /tasks/.
+#
+# Бэкенд хранит готовые JSON-строки ответов, поэтому попадание в кэш
+# не требует ни запроса в БД, ни сериализации.
+#   - MemoryCache: LRU + TTL внутри процесса (по умолчанию)
+#   - RedisCache:  любой Redis-совместимый клиент (общий для всех воркеров)
+#
+# Ключи разделены по владельцу задач (owner_id), одинаковые id и
+# параметры списков у разных владельцев никогда не пересекаются.
+#
+# Инвалидация (см. crud.py):
+#   - задача: ключ task:{owner}:{id} удаляется точечно при каждой записи,
+#     а "поколение" задачи растет. Чтение, начатое до записи, кладет
+#     в кэш свой (уже старый) ответ, только если поколение не изменилось;
+#   - списки: ключ включает "поколение" списков владельца, запись
+#     увеличивает его, и все старые списки этого владельца становятся
+#     недостижимыми (их вытеснят LRU/TTL). Списки других владельцев
+#     остаются в кэше.
+#
+
+class MemoryCache:
+    def __init__(self, max_entries: int = 10_000, ttl: float = 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._counters: dict[str, int] = {}
+        # Синхронный CRUD работает в threadpool - нужен замок
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float | None = None) -> None:
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def add(self, key: str, value: str, ttl: float | None = None) -> bool:
+        """Записать, только если ключа нет (атомарно); False - ключ уже есть"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] >= time.monotonic():
+                return False
+            self._set(key, value, ttl)
+            return True
+
+    def _set(self, key: str, value: str, ttl: float | None) -> None:
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def delete(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def counter(self, key: str) -> int:
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._counters.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class RedisCache:
+    """
+    Обертка над Redis-совместимым клиентом (redis.Redis или локальная
+    заглушка в тестах): нужны только get / set(ex=, nx=) / delete / incr.
+    """
+
+    def __init__(self, client, ttl: float = 60, prefix: str = "taskman:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> str | None:
+        value = self.client.get(self.prefix + key)
+        return value.decode() if isinstance(value, bytes) else value
+
+    def set(self, key: str, value: str, ttl: float | None = None) -> None:
+        self.client.set(self.prefix + key, value, ex=self._expire(ttl))
+
+    def add(self, key: str, value: str, ttl: float | None = None) -> bool:
+        # SET NX: между воркерами ключ получит только один
+        return bool(self.client.set(self.prefix + key, value, ex=self._expire(ttl), nx=True))
+
+    def _expire(self, ttl: float | None) -> int:
+        return max(1, int(self.ttl if ttl is None else ttl))
+
+    def delete(self, *keys: str) -> None:
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def incr(self, key: str) -> int:
+        return int(self.client.incr(self.prefix + key))
+
+    def counter(self, key: str) -> int:
+        return int(self.get(key) or 0)
+
+    def clear(self) -> None:
+        # Без FLUSHDB: сбрасываем общее поколение списков всех владельцев.
+        # Ключи задач истекут по TTL
+        self.incr(TaskCache.GENERATION_KEY)
+
+
+def params_digest(**params) -> str:
+    """Короткий стабильный отпечаток параметров запроса списка"""
+    raw = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+class TaskCache:
+    # Общее поколение (clear()) + поколение каждого владельца (запись)
+    GENERATION_KEY = "tasks:generation"
+    # Поколения задач хранятся в фиксированном числе "полос": память не растет
+    # с числом задач, а запись в соседнюю по полосе задачу лишь пропустит
+    # одно заполнение кэша
+    TASK_STRIPES = 4096
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        # Чтения идут и из threadpool (синхронный CRUD): += без замка теряет счет
+        self._stats_lock = threading.Lock()
+
+    # --- Одна задача ---
+    def get_task(self, owner_id: int, task_id: int) -> str | None:
+        return self._count(self.backend.get(f"task:{owner_id}:{task_id}"))
+
+    def _task_generation_key(self, owner_id: int, task_id: int) -> str:
+        stripe = zlib.crc32(f"{owner_id}:{task_id}".encode()) % self.TASK_STRIPES
+        return f"{self.GENERATION_KEY}:task:{stripe}"
+
+    def task_token(self, owner_id: int, task_id: int) -> int:
+        """Поколение задачи - читать ДО запроса в БД и передать в set_task"""
+        return self.backend.counter(self._task_generation_key(owner_id, task_id))
+
+    def set_task(self, owner_id: int, task_id: int, body: str, token: int) -> bool:
+        """Положить ответ, если задачу не меняли с момента task_token()"""
+        generation_key = self._task_generation_key(owner_id, task_id)
+        if self.backend.counter(generation_key) != token:
+            return False
+        key = f"task:{owner_id}:{task_id}"
+        self.backend.set(key, body)
+        # Запись могла закоммититься между проверкой и set(): invalidate()
+        # сначала меняет поколение, потом удаляет ключ - значит, либо ее
+        # удаление сотрет наш ответ, либо мы увидим новое поколение здесь
+        if self.backend.counter(generation_key) != token:
+            self.backend.delete(key)
+            return False
+        return True
+
+    # --- Списки ---
+    def _owner_generation_key(self, owner_id: int) -> str:
+        return f"{self.GENERATION_KEY}:{owner_id}"
+
+    def list_key(self, owner_id: int, digest: str) -> str:
+        # Поколение читаем ДО запроса в БД: если во время запроса
+        # случится запись, ответ ляжет под уже устаревший ключ
+        generation = self.backend.counter(self.GENERATION_KEY)
+        owner_generation = self.backend.counter(self._owner_generation_key(owner_id))
+        return f"tasks:list:{owner_id}:{generation}.{owner_generation}:{digest}"
+
+    def get_list(self, key: str) -> str | None:
+        return self._count(self.backend.get(key))
+
+    def set_list(self, key: str, body: str) -> None:
+        self.backend.set(key, body)
+
+    # --- Инвалидация (вызывается из crud.py после commit) ---
+    def invalidate(self, owner_id: int, task_ids) -> None:
+        # Порядок важен (см. set_task): поколения, затем ключи
+        for generation_key in {self._task_generation_key(owner_id, task_id) for task_id in task_ids}:
+            self.backend.incr(generation_key)
+        self.backend.delete(*[f"task:{owner_id}:{task_id}" for task_id in task_ids])
+        self.backend.incr(self._owner_generation_key(owner_id))
+
+    def clear(self) -> None:
+        self.backend.clear()
+        with self._stats_lock:
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / total, 4) if total else None,
+        }
+
+    def _count(self, value):
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+
+class NullCache(MemoryCache):
+    """Кэш выключен: ничего не хранит, но счетчики поколений работают"""
+
+    def set(self, key: str, value: str, ttl: float | None = None) -> None:
+        pass
+
+    def add(self, key: str, value: str, ttl: float | None = None) -> bool:
+        return True
+
+
+class SingleFlight:
+    """
+    Схлопывание одинаковых конкурентных запросов (single-flight): пока
+    выполняется fn() для ключа, остальные запросы с тем же ключом ждут его
+    результат, а не идут в БД сами. После завершения ключ освобождается -
+    это не кэш, устаревших данных он не отдает.
+    """
+
+    def __init__(self):
+        self._calls: dict = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.coalesced += 1
+        # shield: отмена одного ожидающего (клиент ушел) не отменяет запрос для остальных
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "coalesced": self.coalesced}
+
+
+# Одновременные GET /tasks/{id} одной задачи - один запрос в БД
+task_reads = SingleFlight()
+
+
+def build_cache(settings) -> TaskCache:
+    if settings.CACHE_BACKEND == "redis":
+        # redis - необязательная зависимость, нужна только в этом режиме
+        import redis
+
+        client = redis.Redis.from_url(settings.REDIS_URL)
+        return TaskCache(RedisCache(client, ttl=settings.CACHE_TTL_SECONDS))
+    if settings.CACHE_BACKEND == "none":
+        return TaskCache(NullCache())
+    return TaskCache(MemoryCache(settings.CACHE_MAX_ENTRIES, settings.CACHE_TTL_SECONDS))
+
+
+# Кэш создается при первом обращении (cache.task_cache), а не при импорте:
+# импорт модуля не читает настройки и не подключается к Redis
+_lock = threading.Lock()
+
+def get_task_cache() -> TaskCache:
+    global task_cache
+    with _lock:
+        if "task_cache" not in globals():
+            task_cache = build_cache(get_settings())
+    return task_cache
+
+def __getattr__(name: str):
+    if name == "task_cache":
+        return get_task_cache()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,56 +1,1185 @@
+import base64
+import io
+import json
+import re
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import (
+    Column, Integer, MetaData, String, Table,
+    case, delete, func, insert, literal, literal_column, or_, select, tuple_, update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
 
+import cache
+import events
 import models
 import schemas
 
-def get_task(db: Session, task_id: int):
-    return db.query(models.Task).filter(models.Task.id == task_id).first()
+#
+# Ключи сортировки для постраничной выдачи.
+# Последним всегда идет id, чтобы порядок был однозначным
+# и строки не повторялись/не пропадали между страницами.
+# Префикс "-" в параметре sort означает сортировку по убыванию.
+# Под каждый ключ (и под status + ключ) есть составной индекс в models.Task.
+#
+SORT_KEYS = {
+    "id": (models.Task.id,),
+    "created_at": (models.Task.created_at, models.Task.id),
+    "updated_at": (models.Task.updated_at, models.Task.id),
+}
+
+
+class InvalidCursor(ValueError):
+    """Курсор поврежден или не подходит к выбранной сортировке"""
+
+
+def _sort_key(sort: str):
+    descending = sort.startswith("-")
+    return SORT_KEYS[sort.lstrip("-")], descending
+
+
+def encode_cursor(sort: str, task: models.Task) -> str:
+    values = []
+    for column in _sort_key(sort)[0]:
+        value = getattr(task, column.key)
+        values.append(value.isoformat() if isinstance(value, datetime) else value)
+    raw = json.dumps({"s": sort, "v": values}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(sort: str, cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values = data["v"]
+        if data["s"] != sort or len(values) != len(_sort_key(sort)[0]):
+            raise InvalidCursor(cursor)
+        # Все ключи, кроме последнего (id), - это даты
+        return tuple(datetime.fromisoformat(v) for v in values[:-1]) + (int(values[-1]),)
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def _filter_conditions(filters: schemas.TaskFilter | None) -> list:
+    if filters is None:
+        return []
+    Task = models.Task
+    conditions = []
+    if filters.status is not None:
+        conditions.append(Task.status == filters.status)
+    if filters.created_after is not None:
+        conditions.append(Task.created_at >= filters.created_after)
+    if filters.created_before is not None:
+        conditions.append(Task.created_at < filters.created_before)
+    if filters.updated_after is not None:
+        conditions.append(Task.updated_at >= filters.updated_after)
+    if filters.updated_before is not None:
+        conditions.append(Task.updated_at < filters.updated_before)
+    if filters.title_prefix:
+        # LIKE 'префикс%' (спецсимволы экранируются) - идет по индексу на title
+        conditions.append(Task.title.startswith(filters.title_prefix, autoescape=True))
+    return conditions
+
+
+#
+# Каждая операция есть в двух вариантах:
+#   get_task(db: Session)              - синхронный (обычный движок)
+#   get_task_async(db: AsyncSession)   - асинхронный (async-движок)
+# SQL-запросы у них общие и строятся функциями _..._stmt,
+# отличается только выполнение (await или нет).
+#
+# Все операции работают в пределах одного владельца (owner_id - второй
+# аргумент везде): чужие задачи для запроса просто не существуют.
+#
+
+def _owned(owner_id: int):
+    return models.Task.owner_id == owner_id
+
+def _get_stmt(owner_id: int, task_id: int):
+    return select(models.Task).where(models.Task.id == task_id, _owned(owner_id))
+
+def get_task(db: Session, owner_id: int, task_id: int):
+    return db.scalars(_get_stmt(owner_id, task_id)).first()
+
+async def get_task_async(db: AsyncSession, owner_id: int, task_id: int):
+    return (await db.scalars(_get_stmt(owner_id, task_id))).first()
+
+def get_tasks(db: Session, owner_id: int, skip: int = 0, limit: int = 100):
+    stmt = select(models.Task).where(_owned(owner_id)).order_by(models.Task.id)
+    return db.scalars(stmt.offset(skip).limit(limit)).all()
+
+#
+# Постраничная выдача по курсору (keyset pagination) с фильтрами.
+# Вместо OFFSET (который сканирует все пропущенные строки) продолжаем
+# с ключа последней строки предыдущей страницы - любая страница стоит
+# одинаково, как бы глубоко она ни была.
+# Возвращает (задачи, next_cursor); next_cursor = None на последней странице.
+#
+def _tasks_page_stmt(owner_id: int, limit: int, cursor: str | None, sort: str, skip: int,
+                     filters: schemas.TaskFilter | None, columns=None):
+    key, descending = _sort_key(sort)
+
+    stmt = select(*(columns or [models.Task])).where(_owned(owner_id), *_filter_conditions(filters))
+    stmt = stmt.order_by(*[c.desc() for c in key] if descending else key)
+    if cursor:
+        # literal() с типом колонки, чтобы дата ушла в БД в ее формате
+        values = tuple_(*[literal(v, c.type) for c, v in zip(key, decode_cursor(sort, cursor))])
+        stmt = stmt.where(tuple_(*key) < values if descending else tuple_(*key) > values)
+    elif skip:
+        stmt = stmt.offset(skip)
+
+    # Берем на одну строку больше, чтобы понять, есть ли следующая страница
+    return stmt.limit(limit + 1)
+
+def _tasks_page_result(tasks: list, limit: int, sort: str):
+    if len(tasks) <= limit:
+        return tasks, None
+    tasks = tasks[:limit]
+    # limit < 1: пустая страница, продолжать не с чего
+    return tasks, encode_cursor(sort, tasks[-1]) if tasks else None
+
+def get_tasks_page(db: Session, owner_id: int, limit: int = 100, cursor: str | None = None,
+                   sort: str = "id", skip: int = 0,
+                   filters: schemas.TaskFilter | None = None):
+    stmt = _tasks_page_stmt(owner_id, limit, cursor, sort, skip, filters)
+    return _tasks_page_result(db.scalars(stmt).all(), limit, sort)
+
+async def get_tasks_page_async(db: AsyncSession, owner_id: int, limit: int = 100, cursor: str | None = None,
+                               sort: str = "id", skip: int = 0,
+                               filters: schemas.TaskFilter | None = None):
+    stmt = _tasks_page_stmt(owner_id, limit, cursor, sort, skip, filters)
+    return _tasks_page_result((await db.scalars(stmt)).all(), limit, sort)
+
+#
+# Быстрый путь для GET /tasks/: те же страницы, но строками-кортежами
+# только с полями ответа (без ORM-объектов и identity map).
+# Строки сериализует schemas.dump_task_rows, next_cursor считается так же
+#
+TASK_COLUMNS = [getattr(models.Task, field) for field in schemas.TASK_FIELDS]
+
+def get_task_rows_page(db: Session, owner_id: int, limit: int = 100, cursor: str | None = None,
+                       sort: str = "id", skip: int = 0,
+                       filters: schemas.TaskFilter | None = None):
+    stmt = _tasks_page_stmt(owner_id, limit, cursor, sort, skip, filters, TASK_COLUMNS)
+    return _tasks_page_result(db.execute(stmt).all(), limit, sort)
+
+async def get_task_rows_page_async(db: AsyncSession, owner_id: int, limit: int = 100, cursor: str | None = None,
+                                   sort: str = "id", skip: int = 0,
+                                   filters: schemas.TaskFilter | None = None):
+    stmt = _tasks_page_stmt(owner_id, limit, cursor, sort, skip, filters, TASK_COLUMNS)
+    return _tasks_page_result((await db.execute(stmt)).all(), limit, sort)
+
+#
+# Потоковый экспорт всей таблицы (GET /tasks/export).
+# yield_per включает серверный курсор (stream_results): строки приходят
+# пачками по batch_size, и память не зависит от размера таблицы.
+# Один SELECT - один снимок данных, даже если экспорт идет минуты.
+#
+EXPORT_BATCH_SIZE = 1000
+
+def _export_stmt(owner_id: int, filters: schemas.TaskFilter | None, batch_size: int):
+    return (
+        select(*TASK_COLUMNS)
+        .where(_owned(owner_id), *_filter_conditions(filters))
+        .order_by(models.Task.id)
+        .execution_options(yield_per=batch_size)
+    )
+
+def iter_task_rows(db: Session, owner_id: int, filters: schemas.TaskFilter | None = None,
+                   batch_size: int | None = None):
+    """Генератор пачек строк (кортежи в порядке schemas.TASK_FIELDS)"""
+    stmt = _export_stmt(owner_id, filters, batch_size or EXPORT_BATCH_SIZE)
+    yield from db.execute(stmt).partitions()
+
+async def iter_task_rows_async(db: AsyncSession, owner_id: int,
+                               filters: schemas.TaskFilter | None = None,
+                               batch_size: int | None = None):
+    result = await db.stream(_export_stmt(owner_id, filters, batch_size or EXPORT_BATCH_SIZE))
+    async for rows in result.partitions():
+        yield rows
+
+
+#
+# Версия задач владельца (ETag для списков).
+# Читать ее нужно ДО чтения списка: если между запросами случится запись,
+# ответ получит старую версию и просто не совпадет при следующем запросе.
+# У каждого владельца своя строка: запись одного не сбрасывает ETag другим
+#
+TASKS_TABLE = "tasks"
+
+def _version_name(owner_id: int) -> str:
+    return f"{TASKS_TABLE}:{owner_id}"
+
+def _tasks_version_stmt(owner_id: int):
+    return select(models.TableVersion.version).where(
+        models.TableVersion.name == _version_name(owner_id)
+    )
+
+def get_tasks_version(db: Session, owner_id: int) -> int:
+    return db.scalar(_tasks_version_stmt(owner_id)) or 0
 
-def get_tasks(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Task).offset(skip).limit(limit).all()
+async def get_tasks_version_async(db: AsyncSession, owner_id: int) -> int:
+    return (await db.scalar(_tasks_version_stmt(owner_id))) or 0
 
-def create_task(db: Session, task: schemas.TaskCreate):
-    # 1. Создаем ОБЪЕКТ SQLAlchemy
-    db_task = models.Task(**task.model_dump())
 
-    # 2. Добавляем в сессию
-    db.add(db_task)
+#
+# Общий "хвост" всех операций записи.
+# До commit() - служебные записи в той же транзакции (версия таблицы,
+# журнал изменений, NOTIFY), после commit() - сброс кэша и push-события.
+# op: "created" | "updated" | "deleted"
+#
+def _detach(db: Session | AsyncSession, tasks: list) -> list:
+    # Отвязываем объекты от сессии ДО commit(): иначе commit() пометит их
+    # устаревшими и первое же чтение поля сделает лишний SELECT
+    for db_task in tasks:
+        db.expunge(db_task)
+    return tasks
+
+def _upsert(db: Session | AsyncSession, table):
+    # INSERT ... ON CONFLICT есть и в PostgreSQL, и в SQLite, но конструкция диалектная
+    dialect = db.get_bind().dialect.name
+    return (postgresql.insert if dialect == "postgresql" else sqlite.insert)(table)
+
+def _bump_version_stmt(db: Session | AsyncSession, owner_id: int):
+    stmt = _upsert(db, models.TableVersion).values(name=_version_name(owner_id), version=1)
+    return stmt.on_conflict_do_update(
+        index_elements=[models.TableVersion.name],
+        set_={"version": models.TableVersion.version + 1},
+    )
+
+def _change_log_stmt(owner_id: int, op: str, task_ids: list[int]):
+    # executemany, а не VALUES (...), (...): такой запрос один и тот же
+    # для любого числа строк и берется из кэша компиляции
+    rows = [{"owner_id": owner_id, "task_id": task_id, "op": op} for task_id in task_ids]
+    return insert(models.TaskChange), rows
+
+def _task_events(op: str, tasks: list) -> list[dict]:
+    # Сериализуем задачи, только если события кому-то нужны.
+    # owner_id - чтобы брокер доставил событие только подписчикам владельца
+    if not tasks or not events.broker.active:
+        return []
+    if op == "deleted":
+        return [{"op": op, "id": db_task.id, "owner_id": db_task.owner_id} for db_task in tasks]
+    return [
+        {"op": op, "id": db_task.id, "owner_id": db_task.owner_id,
+         "task": schemas.Task.model_validate(db_task).model_dump(mode="json")}
+        for db_task in tasks
+    ]
+
+#
+# Счетчики для GET /tasks/summary: сдвиги по статусам и почасовая активность.
+# Для обновления нужен статус ДО записи (см. _old_status)
+#
+def _status_deltas(op: str, tasks: list, old_statuses: dict | None = None) -> dict[str, int]:
+    deltas: dict[str, int] = {}
+
+    def shift(status, delta):
+        if status is not None:
+            deltas[status.value] = deltas.get(status.value, 0) + delta
+
+    for db_task in tasks:
+        if op == "created":
+            shift(db_task.status, 1)
+        elif op == "deleted":
+            shift(db_task.status, -1)
+        elif old_statuses[db_task.id] != db_task.status:
+            shift(old_statuses[db_task.id], -1)
+            shift(db_task.status, 1)
+    return {status: delta for status, delta in deltas.items() if delta}
+
+def _hour(moment: datetime) -> datetime:
+    # SQLite отдает даты без пояса - в них UTC
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+def _counter_stmts(db: Session | AsyncSession, owner_id: int, op: str, count: int,
+                   status_deltas: dict[str, int]) -> list:
+    counter = models.TaskCounter
+    # Строки счетчиков блокируются всегда в одном порядке - без взаимоблокировок
+    stmts = [
+        _upsert(db, counter).values(owner_id=owner_id, status=status, count=delta)
+        .on_conflict_do_update(
+            index_elements=[counter.owner_id, counter.status],
+            set_={"count": counter.count + delta},
+        )
+        for status, delta in sorted(status_deltas.items())
+    ]
+    activity = models.TaskActivity
+    stmts.append(
+        _upsert(db, activity)
+        .values(owner_id=owner_id, bucket=_hour(datetime.now(timezone.utc)), **{op: count})
+        .on_conflict_do_update(
+            index_elements=[activity.owner_id, activity.bucket],
+            set_={op: getattr(activity, op) + count},
+        )
+    )
+    return stmts
 
-    # 3. Сохраняем в БД
+def _write_stmts(db: Session | AsyncSession, owner_id: int, op: str, task_ids: list[int],
+                 task_events: list, status_deltas: dict[str, int]) -> list:
+    if not task_ids:
+        return []
+    # Порядок важен: UPSERT версии таблицы блокирует ее строку до commit(),
+    # поэтому id в журнале изменений выдаются строго в порядке commit() -
+    # и клиент, читающий журнал "после id N", не пропустит запись,
+    # которая закоммитилась позже, но получила меньший id
+    # Пары (запрос, параметры)
+    return [
+        (_bump_version_stmt(db, owner_id), None),
+        _change_log_stmt(owner_id, op, task_ids),
+        *[(stmt, None) for stmt in _counter_stmts(db, owner_id, op, len(task_ids), status_deltas)],
+        *[(stmt, None) for stmt in events.broker.before_commit(task_events)],
+    ]
+
+def _invalidate(owner_id: int, op: str, task_ids: list[int]) -> None:
+    # Кэш сбрасываем только ПОСЛЕ commit(), иначе параллельное чтение
+    # успело бы положить в кэш еще старые данные.
+    # Новых задач в кэше быть не может - им нужен только сброс списков
+    if task_ids:
+        cache.task_cache.invalidate(owner_id, [] if op == "created" else task_ids)
+
+def _commit_write(db: Session, owner_id: int, op: str, task_ids: list[int], task_events: list,
+                  status_deltas: dict[str, int]) -> None:
+    for stmt, params in _write_stmts(db, owner_id, op, task_ids, task_events, status_deltas):
+        db.execute(stmt, params)
     db.commit()
+    _invalidate(owner_id, op, task_ids)
+    events.broker.after_commit(task_events)
+
+async def _commit_write_async(db: AsyncSession, owner_id: int, op: str, task_ids: list[int],
+                              task_events: list, status_deltas: dict[str, int]) -> None:
+    for stmt, params in _write_stmts(db, owner_id, op, task_ids, task_events, status_deltas):
+        await db.execute(stmt, params)
+    await db.commit()
+    _invalidate(owner_id, op, task_ids)
+    events.broker.after_commit(task_events)
+
+def _finish_write(db: Session, owner_id: int, op: str, tasks: list,
+                  old_statuses: dict | None = None) -> list:
+    _detach(db, tasks)
+    _commit_write(
+        db, owner_id, op, [db_task.id for db_task in tasks], _task_events(op, tasks),
+        _status_deltas(op, tasks, old_statuses),
+    )
+    return tasks
+
+async def _finish_write_async(db: AsyncSession, owner_id: int, op: str, tasks: list,
+                              old_statuses: dict | None = None) -> list:
+    _detach(db, tasks)
+    await _commit_write_async(
+        db, owner_id, op, [db_task.id for db_task in tasks], _task_events(op, tasks),
+        _status_deltas(op, tasks, old_statuses),
+    )
+    return tasks
+
+# Для UPDATE/DELETE ... RETURNING сессию синхронизировать не нужно
+_NO_SYNC = {"synchronize_session": False}
 
-    # 4. Обновляем объект (чтобы получить id)
-    db.refresh(db_task)
 
-    # 5. ВОЗВРАЩАЕМ созданный объект (ОБЯЗАТЕЛЬНО!)
+def _create_stmt(owner_id: int, task: schemas.TaskCreate):
+    return insert(models.Task).values(**task.model_dump(), owner_id=owner_id).returning(models.Task)
+
+def create_task(db: Session, owner_id: int, task: schemas.TaskCreate):
+    # 1. Один INSERT ... RETURNING: id и даты (server_default)
+    #    приходят из БД сразу, без отдельного refresh()
+    db_task = db.scalars(_create_stmt(owner_id, task)).one()
+
+    # 2. Сохраняем в БД (объект отвязывается от сессии, чтобы
+    #    commit() не заставил перечитывать его) и сбрасываем кэш
+    _finish_write(db, owner_id, "created", [db_task])
+
+    # 3. ВОЗВРАЩАЕМ созданный объект (ОБЯЗАТЕЛЬНО!)
+    return db_task
+
+async def create_task_async(db: AsyncSession, owner_id: int, task: schemas.TaskCreate):
+    db_task = (await db.scalars(_create_stmt(owner_id, task))).one()
+    await _finish_write_async(db, owner_id, "created", [db_task])
     return db_task
 
 #
 # 4. Функция для ОБНОВЛЕНИЯ задачи
+# Один запрос UPDATE ... WHERE id = :id RETURNING * вместо SELECT + UPDATE + SELECT.
+# updated_at по-прежнему ставит БД (onupdate=func.now()), version растет на 1.
+# Если строки нет - RETURNING пуст, и мы возвращаем None (-> 404).
+# expected_version (из If-Match) превращает запрос в оптимистичную
+# блокировку: строка обновится, только если ее версия не изменилась.
+# Пустое обновление ничего не меняет - тогда просто отдаем задачу.
 #
-def update_task(db: Session, task_id: int, task: schemas.TaskUpdate):
-    db_task = db.query(models.Task).filter(models.Task.id == task_id).first()
-    
-    if db_task:
-        update_data = task.model_dump(exclude_unset=True)
-        
-        for key, value in update_data.items():
-            setattr(db_task, key, value)
-            
-        db.commit()
-        db.refresh(db_task)
-        
+def _old_statuses(tasks: list) -> dict:
+    # Статус ДО обновления (для счетчиков GET /tasks/summary): UPDATE
+    # сохраняет его в previous_status, и RETURNING уже вернул его
+    return {db_task.id: db_task.previous_status for db_task in tasks}
+
+def _update_stmt(owner_id: int, task_id: int, update_data: dict, expected_version: int | None):
+    stmt = (
+        update(models.Task)
+        .where(models.Task.id == task_id, _owned(owner_id))
+        .values(**update_data, version=models.Task.version + 1,
+                previous_status=models.Task.status)
+        .returning(models.Task)
+    )
+    if expected_version is not None:
+        stmt = stmt.where(models.Task.version == expected_version)
+    return stmt
+
+def _unchanged(db_task, expected_version: int | None):
+    # Пустое обновление с If-Match тоже должно проверить версию
+    if db_task is not None and expected_version not in (None, db_task.version):
+        return None
+    return db_task
+
+def update_task(db: Session, owner_id: int, task_id: int, task: schemas.TaskUpdate,
+                expected_version: int | None = None):
+    update_data = task.model_dump(exclude_unset=True)
+    if not update_data:
+        return _unchanged(get_task(db, owner_id, task_id), expected_version)
+
+    stmt = _update_stmt(owner_id, task_id, update_data, expected_version)
+    db_task = db.scalars(stmt, execution_options=_NO_SYNC).first()
+    updated = [db_task] if db_task else []
+    _finish_write(db, owner_id, "updated", updated, _old_statuses(updated))
+
+    return db_task
+
+async def update_task_async(db: AsyncSession, owner_id: int, task_id: int,
+                            task: schemas.TaskUpdate, expected_version: int | None = None):
+    update_data = task.model_dump(exclude_unset=True)
+    if not update_data:
+        return _unchanged(await get_task_async(db, owner_id, task_id), expected_version)
+
+    stmt = _update_stmt(owner_id, task_id, update_data, expected_version)
+    db_task = (await db.scalars(stmt, execution_options=_NO_SYNC)).first()
+    updated = [db_task] if db_task else []
+    await _finish_write_async(db, owner_id, "updated", updated, _old_statuses(updated))
+
     return db_task
 
 #
 # 5. Функция для УДАЛЕНИЯ задачи
+# Один запрос DELETE ... RETURNING * - удаленная строка возвращается сразу.
+#
+def _delete_stmt(owner_id: int, task_ids: list[int]):
+    return (
+        delete(models.Task)
+        .where(models.Task.id.in_(set(task_ids)), _owned(owner_id))
+        .returning(models.Task)
+    )
+
+def delete_task(db: Session, owner_id: int, task_id: int):
+    db_task = db.scalars(_delete_stmt(owner_id, [task_id]), execution_options=_NO_SYNC).first()
+    _finish_write(db, owner_id, "deleted", [db_task] if db_task else [])
+
+    return db_task
+
+async def delete_task_async(db: AsyncSession, owner_id: int, task_id: int):
+    stmt = _delete_stmt(owner_id, [task_id])
+    db_task = (await db.scalars(stmt, execution_options=_NO_SYNC)).first()
+    await _finish_write_async(db, owner_id, "deleted", [db_task] if db_task else [])
+
+    return db_task
+
 #
-def delete_task(db: Session, task_id: int):
-    
-    db_task = db.query(models.Task).filter(models.Task.id == task_id).first()
-    
-    if db_task:
-        db.delete(db_task)
+# 6. МАССОВЫЕ операции (bulk)
+# Весь пакет - это один-два SQL-запроса в ОДНОЙ транзакции:
+# многострочный INSERT ... RETURNING и set-based UPDATE/DELETE ... RETURNING.
+# Возвращают задачи в виде, удобном для отчета по каждому элементу.
+#
+
+# render_nulls - чтобы строки с description=None не разбили пакет
+# на несколько INSERT с разным набором колонок
+_BULK_INSERT = {"render_nulls": True}
+
+def _bulk_insert_stmt():
+    # Строки RETURNING приходят в порядке пакета: SQLAlchemy сопоставляет их
+    # с параметрами по Task.insert_ordinal (номер строки в VALUES), а не по id -
+    # порядок выдачи id при многострочном INSERT база не гарантирует.
+    # Пакет по-прежнему один INSERT, и на SQLite тоже
+    return insert(models.Task).returning(models.Task, sort_by_parameter_order=True)
+
+def create_tasks(db: Session, owner_id: int, tasks: list[schemas.TaskCreate]) -> list[models.Task]:
+    if not tasks:
+        return []
+    rows = [{**task.model_dump(), "owner_id": owner_id} for task in tasks]
+    db_tasks = db.scalars(_bulk_insert_stmt(), rows, execution_options=_BULK_INSERT).all()
+    return _finish_write(db, owner_id, "created", db_tasks)
+
+async def create_tasks_async(db: AsyncSession, owner_id: int,
+                             tasks: list[schemas.TaskCreate]) -> list[models.Task]:
+    if not tasks:
+        return []
+    rows = [{**task.model_dump(), "owner_id": owner_id} for task in tasks]
+    result = await db.scalars(_bulk_insert_stmt(), rows, execution_options=_BULK_INSERT)
+    return await _finish_write_async(db, owner_id, "created", result.all())
+
+
+def _bulk_changes(items: list[schemas.TaskBulkUpdate]):
+    # {id: изменения}; если id повторяется, побеждает последний элемент
+    changes = {item.id: item.model_dump(exclude_unset=True, exclude={"id"}) for item in items}
+    changed_ids = [task_id for task_id, data in changes.items() if data]
+    untouched_ids = [task_id for task_id, data in changes.items() if not data]
+    return changes, changed_ids, untouched_ids
+
+def _bulk_update_stmt(owner_id: int, changes: dict, changed_ids: list[int]):
+    # Для каждой колонки: CASE id WHEN 1 THEN 'a' WHEN 2 THEN 'b' ELSE колонка END.
+    # literal() с типом колонки - чтобы Enum статуса сохранился правильно
+    columns = {key for task_id in changed_ids for key in changes[task_id]}
+    values = {"version": models.Task.version + 1, "previous_status": models.Task.status}
+    for key in columns:
+        column = getattr(models.Task, key)
+        whens = [
+            (models.Task.id == task_id, literal(changes[task_id][key], column.type))
+            for task_id in changed_ids if key in changes[task_id]
+        ]
+        values[key] = case(*whens, else_=column)
+
+    return (
+        update(models.Task)
+        .where(models.Task.id.in_(changed_ids), _owned(owner_id))
+        .values(values)
+        .returning(models.Task)
+    )
+
+def _select_by_ids_stmt(owner_id: int, task_ids: list[int]):
+    return (
+        select(models.Task)
+        .where(models.Task.id.in_(task_ids), _owned(owner_id))
+        .order_by(models.Task.id)
+    )
+
+def update_tasks(db: Session, owner_id: int,
+                 items: list[schemas.TaskBulkUpdate]) -> dict[int, models.Task]:
+    changes, changed_ids, untouched_ids = _bulk_changes(items)
+
+    updated, untouched = [], []
+    if changed_ids:
+        stmt = _bulk_update_stmt(owner_id, changes, changed_ids)
+        updated = db.scalars(stmt, execution_options=_NO_SYNC).all()
+    if untouched_ids:
+        # Пустое обновление ничего не меняет - просто отдаем текущие данные
+        stmt = _select_by_ids_stmt(owner_id, untouched_ids)
+        untouched = _detach(db, db.scalars(stmt).all())
+
+    _finish_write(db, owner_id, "updated", updated, _old_statuses(updated))
+    return {db_task.id: db_task for db_task in [*updated, *untouched]}
+
+async def update_tasks_async(db: AsyncSession, owner_id: int,
+                             items: list[schemas.TaskBulkUpdate]) -> dict[int, models.Task]:
+    changes, changed_ids, untouched_ids = _bulk_changes(items)
+
+    updated, untouched = [], []
+    if changed_ids:
+        stmt = _bulk_update_stmt(owner_id, changes, changed_ids)
+        updated = (await db.scalars(stmt, execution_options=_NO_SYNC)).all()
+    if untouched_ids:
+        stmt = _select_by_ids_stmt(owner_id, untouched_ids)
+        untouched = _detach(db, (await db.scalars(stmt)).all())
+
+    await _finish_write_async(db, owner_id, "updated", updated, _old_statuses(updated))
+    return {db_task.id: db_task for db_task in [*updated, *untouched]}
+
+
+def delete_tasks(db: Session, owner_id: int, task_ids: list[int]) -> dict[int, models.Task]:
+    if not task_ids:
+        return {}
+    deleted = db.scalars(_delete_stmt(owner_id, task_ids), execution_options=_NO_SYNC).all()
+    _finish_write(db, owner_id, "deleted", deleted)
+    return {db_task.id: db_task for db_task in deleted}
+
+async def delete_tasks_async(db: AsyncSession, owner_id: int,
+                             task_ids: list[int]) -> dict[int, models.Task]:
+    if not task_ids:
+        return {}
+    stmt = _delete_stmt(owner_id, task_ids)
+    deleted = (await db.scalars(stmt, execution_options=_NO_SYNC)).all()
+    await _finish_write_async(db, owner_id, "deleted", deleted)
+    return {db_task.id: db_task for db_task in deleted}
+
+
+#
+# 7. Журнал изменений (GET /tasks/changes?since=N)
+# Каждая запись в tasks оставляет строку в task_changes (id = токен).
+# Запрос - диапазон по первичному ключу "id > since", поэтому стоит
+# пропорционально числу изменений, а не размеру таблицы.
+# Удаления видны благодаря строкам с op="deleted" (tombstones).
+#
+# Журнал хранится не вечно (prune_changes). Первая синхронизация (since=0)
+# и токен старше оставшегося журнала отдаются снимком: задачи владельца
+# страницами по id (keyset, курсор), reset=true на первой странице -
+# клиент выбрасывает локальные данные. Граница снимка W - последний id
+# журнала этого владельца на его начало: next_since = W, и все, что
+# изменится во время чтения снимка, клиент получит уже обычной лентой после W.
+# W читается ДО строк снимка и только по своему владельцу: записи одного
+# владельца сериализованы блокировкой его строки версии (_write_stmts), и
+# его id в журнале идут в порядке commit(). Общий max(id) по всем владельцам
+# мог бы "перепрыгнуть" еще не закоммиченную запись этого владельца
+# с меньшим id - и клиент бы ее не получил.
+#
+CHANGES_PRUNED = "task_changes:pruned"
+
+def _changes_stmt(owner_id: int, since: int, limit: int):
+    return (
+        select(models.TaskChange.id, models.TaskChange.task_id, models.TaskChange.op)
+        .where(models.TaskChange.owner_id == owner_id, models.TaskChange.id > since)
+        .order_by(models.TaskChange.id)
+        .limit(limit + 1)
+    )
+
+def _pruned_through_stmt():
+    # Строки журнала с id <= этого значения удалены
+    return select(models.TableVersion.version).where(models.TableVersion.name == CHANGES_PRUNED)
+
+def _last_change_stmt(owner_id: int):
+    # Конец диапазона индекса (owner_id, id)
+    return select(func.max(models.TaskChange.id)).where(models.TaskChange.owner_id == owner_id)
+
+def _snapshot_stmt(owner_id: int, after: int, limit: int):
+    # Диапазон индекса (owner_id, id)
+    Task = models.Task
+    return select(Task).where(_owned(owner_id), Task.id > after).order_by(Task.id).limit(limit + 1)
+
+def encode_changes_cursor(watermark: int, after: int) -> str:
+    raw = json.dumps({"w": watermark, "a": after}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_changes_cursor(cursor: str) -> tuple[int, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return int(data["w"]), int(data["a"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+
+def _snapshot_result(tasks: list, watermark: int, limit: int, reset: bool):
+    has_more = len(tasks) > limit
+    tasks = tasks[:limit]
+    cursor = encode_changes_cursor(watermark, tasks[-1].id) if has_more else None
+    return schemas.TaskChanges(
+        upserted=tasks, deleted=[], next_since=watermark, has_more=has_more,
+        reset=reset, cursor=cursor,
+    )
+
+def _compact_changes(rows: list, since: int, limit: int):
+    # Несколько изменений одной задачи схлопываются в последнее
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    last_op = {}
+    for row in rows:
+        last_op[row.task_id] = row.op
+    upsert_ids = sorted(task_id for task_id, op in last_op.items() if op != "deleted")
+    deleted_ids = sorted(task_id for task_id, op in last_op.items() if op == "deleted")
+    next_since = rows[-1].id if rows else since
+    return upsert_ids, deleted_ids, next_since, has_more
+
+def _changes_result(upserted: list, deleted_ids: list, next_since: int, has_more: bool):
+    # Задача могла быть удалена уже после этой страницы журнала:
+    # ее строки нет, а tombstone клиент получит на следующей странице
+    return schemas.TaskChanges(
+        upserted=upserted, deleted=deleted_ids, next_since=next_since, has_more=has_more
+    )
+
+def get_changes(db: Session, owner_id: int, since: int = 0, limit: int = 1000,
+                cursor: str | None = None) -> schemas.TaskChanges:
+    if cursor is None and since > 0:
+        rows = db.execute(_changes_stmt(owner_id, since, limit)).all()
+        # Границу очистки читаем ПОСЛЕ журнала: если очистка успела
+        # удалить часть прочитанного диапазона, мы это увидим
+        pruned = db.scalar(_pruned_through_stmt()) or 0
+        if since >= pruned:
+            upsert_ids, deleted_ids, next_since, has_more = _compact_changes(rows, since, limit)
+            upserted = db.scalars(_select_by_ids_stmt(owner_id, upsert_ids)).all() if upsert_ids else []
+            return _changes_result(upserted, deleted_ids, next_since, has_more)
+    if cursor is None:
+        last_change = db.scalar(_last_change_stmt(owner_id)) or 0
+        watermark = max(last_change, db.scalar(_pruned_through_stmt()) or 0)
+        after = 0
+    else:
+        watermark, after = decode_changes_cursor(cursor)
+    tasks = db.scalars(_snapshot_stmt(owner_id, after, limit)).all()
+    return _snapshot_result(tasks, watermark, limit, reset=cursor is None)
+
+async def get_changes_async(db: AsyncSession, owner_id: int, since: int = 0, limit: int = 1000,
+                            cursor: str | None = None) -> schemas.TaskChanges:
+    if cursor is None and since > 0:
+        rows = (await db.execute(_changes_stmt(owner_id, since, limit))).all()
+        pruned = (await db.scalar(_pruned_through_stmt())) or 0
+        if since >= pruned:
+            upsert_ids, deleted_ids, next_since, has_more = _compact_changes(rows, since, limit)
+            upserted = []
+            if upsert_ids:
+                upserted = (await db.scalars(_select_by_ids_stmt(owner_id, upsert_ids))).all()
+            return _changes_result(upserted, deleted_ids, next_since, has_more)
+    if cursor is None:
+        last_change = (await db.scalar(_last_change_stmt(owner_id))) or 0
+        watermark = max(last_change, (await db.scalar(_pruned_through_stmt())) or 0)
+        after = 0
+    else:
+        watermark, after = decode_changes_cursor(cursor)
+    tasks = (await db.scalars(_snapshot_stmt(owner_id, after, limit))).all()
+    return _snapshot_result(tasks, watermark, limit, reset=cursor is None)
+
+
+#
+# 8. Импорт больших объемов (POST /tasks/import)
+# Вызывается для каждой проверенной пачки строк; одна пачка - одна транзакция.
+#   - PostgreSQL: COPY во временную таблицу, затем INSERT ... SELECT ... RETURNING id
+#     (COPY не умеет ни DEFAULT из Python, ни RETURNING);
+#   - остальные БД: executemany одного INSERT, SQLAlchemy склеивает его
+#     в многострочные VALUES ("insertmanyvalues").
+# Журнал изменений получает "created" на каждую задачу, а push-подписчики -
+# одно событие "imported" на пачку (догонять - через GET /tasks/changes).
+#
+IMPORT_COLUMNS = ("title", "description")
+
+# ON COMMIT DELETE ROWS: таблица живет в соединении, но пуста в каждой транзакции
+_import_staging = Table(
+    "tasks_import_staging", MetaData(),
+    Column("seq", Integer),
+    *[Column(name, String) for name in IMPORT_COLUMNS],
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DELETE ROWS",
+)
+
+def _import_from_staging_stmt(owner_id: int):
+    staging = _import_staging.c
+    # status по умолчанию задан в Python (models.Task), поэтому передаем его явно
+    default_status = literal(models.TaskStatus.TODO, models.Task.status.type)
+    return (
+        insert(models.Task)
+        .from_select(
+            [*IMPORT_COLUMNS, "status", "owner_id"],
+            select(*[staging[name] for name in IMPORT_COLUMNS], default_status, literal(owner_id))
+            .order_by(staging.seq),
+        )
+        .returning(models.Task.id)
+    )
+
+def _copy_text(value: str | None) -> str:
+    # Текстовый формат COPY: \N - NULL, спецсимволы экранируются обратной чертой
+    if value is None:
+        return "\\N"
+    return (value.replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+def _copy_buffer(rows: list[dict]) -> io.StringIO:
+    buffer = io.StringIO()
+    for seq, row in enumerate(rows):
+        buffer.write("\t".join([str(seq), *[_copy_text(row[name]) for name in IMPORT_COLUMNS]]))
+        buffer.write("\n")
+    buffer.seek(0)
+    return buffer
+
+def _import_events(owner_id: int, task_ids: list[int]) -> list[dict]:
+    if not task_ids or not events.broker.active:
+        return []
+    return [{"op": "imported", "id": task_ids[0], "owner_id": owner_id, "count": len(task_ids)}]
+
+def _import_deltas(task_ids: list[int]) -> dict[str, int]:
+    # Импортированные задачи всегда создаются в статусе по умолчанию
+    return {models.TaskStatus.TODO.value: len(task_ids)} if task_ids else {}
+
+def _insert_many_stmt():
+    return insert(models.Task).returning(models.Task.id)
+
+def _insert_many_rows(owner_id: int, rows: list[dict]) -> list[dict]:
+    return [{**row, "status": models.TaskStatus.TODO, "owner_id": owner_id} for row in rows]
+
+def import_tasks(db: Session, owner_id: int, rows: list[dict]) -> list[int]:
+    if not rows:
+        return []
+    if db.get_bind().dialect.driver == "psycopg2":
+        db.execute(CreateTable(_import_staging, if_not_exists=True))
+        raw = db.connection().connection.driver_connection
+        with raw.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {_import_staging.name} (seq, {', '.join(IMPORT_COLUMNS)}) FROM STDIN",
+                _copy_buffer(rows),
+            )
+        task_ids = db.scalars(_import_from_staging_stmt(owner_id)).all()
+    else:
+        task_ids = db.scalars(
+            _insert_many_stmt(), _insert_many_rows(owner_id, rows), execution_options=_BULK_INSERT
+        ).all()
+    task_ids = sorted(task_ids)
+    _commit_write(
+        db, owner_id, "created", task_ids,
+        _import_events(owner_id, task_ids), _import_deltas(task_ids),
+    )
+    return task_ids
+
+async def import_tasks_async(db: AsyncSession, owner_id: int, rows: list[dict]) -> list[int]:
+    if not rows:
+        return []
+    if db.get_bind().dialect.driver == "asyncpg":
+        await db.execute(CreateTable(_import_staging, if_not_exists=True))
+        raw = await (await db.connection()).get_raw_connection()
+        # Бинарный COPY asyncpg: без текстового экранирования вовсе
+        await raw.driver_connection.copy_records_to_table(
+            _import_staging.name,
+            records=[(seq, *[row[name] for name in IMPORT_COLUMNS]) for seq, row in enumerate(rows)],
+            columns=["seq", *IMPORT_COLUMNS],
+        )
+        task_ids = (await db.scalars(_import_from_staging_stmt(owner_id))).all()
+    else:
+        result = await db.scalars(
+            _insert_many_stmt(), _insert_many_rows(owner_id, rows), execution_options=_BULK_INSERT
+        )
+        task_ids = result.all()
+    task_ids = sorted(task_ids)
+    await _commit_write_async(
+        db, owner_id, "created", task_ids,
+        _import_events(owner_id, task_ids), _import_deltas(task_ids),
+    )
+    return task_ids
+
+
+#
+# 9. Сводка по доске (GET /tasks/summary)
+# Читает только счетчики: task_counters (строка на статус) и почасовую
+# активность за 7 дней (не более 168 строк) - время ответа не зависит
+# от размера tasks. rebuild_summary пересчитывает счетчики по самой таблице
+# и журналу изменений и сообщает, насколько они разошлись.
+#
+ACTIVITY_WINDOWS = {"last_24h": timedelta(hours=24), "last_7d": timedelta(days=7)}
+ACTIVITY_OPS = ("created", "updated", "deleted")
+
+def _activity_since(now: datetime) -> dict[str, datetime]:
+    # Текущий (неполный) час входит в окно
+    return {name: _hour(now) - window + timedelta(hours=1)
+            for name, window in ACTIVITY_WINDOWS.items()}
+
+def _stored_counts_stmt(owner_id: int):
+    counter = models.TaskCounter
+    return select(counter.status, counter.count).where(counter.owner_id == owner_id)
+
+def _summary_stmts(owner_id: int, now: datetime):
+    activity = models.TaskActivity
+    since = _activity_since(now)
+    columns = [
+        func.coalesce(func.sum(case((activity.bucket >= since[name], getattr(activity, op)), else_=0)), 0)
+        for name in ACTIVITY_WINDOWS for op in ACTIVITY_OPS
+    ]
+    return (
+        _stored_counts_stmt(owner_id),
+        select(*columns).where(activity.owner_id == owner_id, activity.bucket >= min(since.values())),
+    )
+
+def _summary_result(counters, activity_row) -> schemas.TaskSummary:
+    by_status = {status: 0 for status in models.TaskStatus}
+    for status, count in counters:
+        by_status[models.TaskStatus(status)] = count
+    totals = iter(activity_row)
+    activity = {
+        name: schemas.ActivityTotals(**{op: next(totals) for op in ACTIVITY_OPS})
+        for name in ACTIVITY_WINDOWS
+    }
+    return schemas.TaskSummary(total=sum(by_status.values()), by_status=by_status, **activity)
+
+def get_summary(db: Session, owner_id: int) -> schemas.TaskSummary:
+    counters_stmt, activity_stmt = _summary_stmts(owner_id, datetime.now(timezone.utc))
+    return _summary_result(db.execute(counters_stmt).all(), db.execute(activity_stmt).one())
+
+async def get_summary_async(db: AsyncSession, owner_id: int) -> schemas.TaskSummary:
+    counters_stmt, activity_stmt = _summary_stmts(owner_id, datetime.now(timezone.utc))
+    counters = (await db.execute(counters_stmt)).all()
+    return _summary_result(counters, (await db.execute(activity_stmt)).one())
+
+
+def _lock_counters_stmt(db: Session | AsyncSession, owner_id: int):
+    # Создает недостающие строки и блокирует все строки владельца: записи,
+    # меняющие статусы, подождут конца пересчета и добавят свой сдвиг
+    # уже к новому значению
+    counter = models.TaskCounter
+    return _upsert(db, counter).values(
+        [{"owner_id": owner_id, "status": status.value, "count": 0} for status in models.TaskStatus]
+    ).on_conflict_do_update(
+        index_elements=[counter.owner_id, counter.status], set_={"count": counter.count}
+    )
+
+def _actual_counts_stmt(owner_id: int):
+    return (
+        select(models.Task.status, func.count())
+        .where(_owned(owner_id))
+        .group_by(models.Task.status)
+    )
+
+def _changes_since_stmt(owner_id: int, since: datetime):
+    change = models.TaskChange
+    return select(change.op, change.changed_at).where(
+        change.owner_id == owner_id, change.changed_at >= since
+    )
+
+def _rebuild_stmts(db: Session | AsyncSession, owner_id: int, stored, actual, changes):
+    stored = {status: count for status, count in stored}
+    actual = {status.value: count for status, count in actual if status is not None}
+    counts = {status.value: actual.get(status.value, 0) for status in models.TaskStatus}
+    drift = {status: stored.get(status, 0) - count for status, count in counts.items()}
+
+    buckets: dict[datetime, dict[str, int]] = {}
+    for op, changed_at in changes:
+        if op in ACTIVITY_OPS:
+            bucket = buckets.setdefault(_hour(changed_at), dict.fromkeys(ACTIVITY_OPS, 0))
+            bucket[op] += 1
+
+    counter, activity = models.TaskCounter, models.TaskActivity
+    set_counts = _upsert(db, counter).values(
+        [{"owner_id": owner_id, "status": status, "count": count} for status, count in counts.items()]
+    )
+    stmts = [
+        set_counts.on_conflict_do_update(
+            index_elements=[counter.owner_id, counter.status],
+            set_={"count": set_counts.excluded.count},
+        ),
+        # Активность старше окна больше не нужна - заодно чистим ее
+        delete(activity).where(activity.owner_id == owner_id),
+    ]
+    if buckets:
+        stmts.append(insert(activity).values(
+            [{"owner_id": owner_id, "bucket": bucket, **totals} for bucket, totals in buckets.items()]
+        ))
+    return stmts, {status: delta for status, delta in drift.items() if delta}
+
+def rebuild_summary(db: Session, owner_id: int) -> schemas.SummaryRebuild:
+    since = min(_activity_since(datetime.now(timezone.utc)).values())
+    db.execute(_lock_counters_stmt(db, owner_id))
+    stored = db.execute(_stored_counts_stmt(owner_id)).all()
+    actual = db.execute(_actual_counts_stmt(owner_id)).all()
+    changes = db.execute(_changes_since_stmt(owner_id, since)).all()
+    stmts, drift = _rebuild_stmts(db, owner_id, stored, actual, changes)
+    for stmt in stmts:
+        db.execute(stmt)
+    db.commit()
+    summary = get_summary(db, owner_id)
+    return schemas.SummaryRebuild(consistent=not drift, drift=drift, summary=summary)
+
+async def rebuild_summary_async(db: AsyncSession, owner_id: int) -> schemas.SummaryRebuild:
+    since = min(_activity_since(datetime.now(timezone.utc)).values())
+    await db.execute(_lock_counters_stmt(db, owner_id))
+    stored = (await db.execute(_stored_counts_stmt(owner_id))).all()
+    actual = (await db.execute(_actual_counts_stmt(owner_id))).all()
+    changes = (await db.execute(_changes_since_stmt(owner_id, since))).all()
+    stmts, drift = _rebuild_stmts(db, owner_id, stored, actual, changes)
+    for stmt in stmts:
+        await db.execute(stmt)
+    await db.commit()
+    summary = await get_summary_async(db, owner_id)
+    return schemas.SummaryRebuild(consistent=not drift, drift=drift, summary=summary)
+
+
+#
+# 10. Полнотекстовый поиск (GET /tasks/search)
+# Структуры поиска создаются вместе с таблицей tasks (см. models.SEARCH_DDL).
+#   PostgreSQL: search_vector @@ websearch_to_tsquery(q) по GIN-индексу,
+#               ранг - ts_rank; fuzzy добавляет триграммы по title (title % q).
+#   SQLite:     FTS5 MATCH, ранг - bm25; fuzzy = поиск по префиксам слов.
+# Результат отсортирован по релевантности, поэтому страницы - через skip:
+# ранг не монотонный ключ, курсор по нему не построить.
+# Возвращает (кортежи TASK_COLUMNS, next_skip); next_skip = None на последней странице
+#
+SEARCH_WORD = re.compile(r"\w+")
+
+# FTS5-таблица (создается DDL из models.py) - описание только для запросов
+_tasks_fts = Table("tasks_fts", MetaData(), Column("rowid", Integer), Column("rank"))
+
+def _fts5_query(q: str, prefix: bool) -> str:
+    # Каждое слово в кавычках: операторы FTS5 (AND, NEAR, *, ...) из ввода
+    # пользователя не интерпретируются. Пробел между словами - это AND
+    return " ".join(f'"{word}"*' if prefix else f'"{word}"' for word in SEARCH_WORD.findall(q))
+
+def _search_stmt(db: Session | AsyncSession, owner_id: int, q: str, limit: int, skip: int,
+                 fuzzy: bool, filters: schemas.TaskFilter | None):
+    Task = models.Task
+    stmt = select(*TASK_COLUMNS).where(_owned(owner_id), *_filter_conditions(filters))
+    if db.get_bind().dialect.name == "postgresql":
+        vector = literal_column("tasks.search_vector")
+        query = func.websearch_to_tsquery(models.SEARCH_CONFIG, q)
+        match, rank = vector.bool_op("@@")(query), func.ts_rank(vector, query)
+        if fuzzy:
+            match = or_(match, Task.title.bool_op("%")(q))
+            rank = rank + func.similarity(Task.title, q)
+        stmt = stmt.where(match).order_by(rank.desc(), Task.id)
+    else:
+        stmt = (
+            stmt.join(_tasks_fts, _tasks_fts.c.rowid == Task.id)
+            .where(literal_column("tasks_fts").bool_op("MATCH")(_fts5_query(q, fuzzy)))
+            .order_by(_tasks_fts.c.rank, Task.id)
+        )
+    return stmt.offset(skip).limit(limit + 1)
+
+def _search_result(rows: list, limit: int, skip: int):
+    if len(rows) <= limit:
+        return rows, None
+    return rows[:limit], skip + limit
+
+def search_tasks(db: Session, owner_id: int, q: str, limit: int = 20, skip: int = 0,
+                 fuzzy: bool = False, filters: schemas.TaskFilter | None = None):
+    # В запросе нет ни одного слова - искать нечего (и FTS5 отверг бы пустой MATCH)
+    if not SEARCH_WORD.search(q):
+        return [], None
+    stmt = _search_stmt(db, owner_id, q, limit, skip, fuzzy, filters)
+    return _search_result(db.execute(stmt).all(), limit, skip)
+
+async def search_tasks_async(db: AsyncSession, owner_id: int, q: str, limit: int = 20,
+                             skip: int = 0, fuzzy: bool = False,
+                             filters: schemas.TaskFilter | None = None):
+    if not SEARCH_WORD.search(q):
+        return [], None
+    stmt = _search_stmt(db, owner_id, q, limit, skip, fuzzy, filters)
+    return _search_result((await db.execute(stmt)).all(), limit, skip)
+
+
+#
+# 11. Архив выполненных задач (фоновое задание archive_done_tasks, см. jobs.py)
+# DONE-задачи, не менявшиеся older_than_days дней, переезжают в tasks_archive.
+# Владельцы с выполненными задачами берутся из task_counters, кандидаты
+# владельца - диапазоном индекса (owner_id, status, updated_at, id),
+# так что полного просмотра tasks нет.
+# Пачка одного владельца - одна транзакция: DELETE ... RETURNING отдает
+# ровно удаленные строки, и в архив попадают именно они (задача, которую
+# успели изменить, под условие уже не подходит и остается).
+# Для клиентов архивирование - удаление: журнал, счетчики, кэш и события
+# идут через общий хвост записи.
+# Возвращает число перенесенных задач
+#
+ARCHIVE_FIELDS = [
+    column.name for column in models.TaskArchive.__table__.columns if column.name != "archived_at"
+]
+
+def _archive_owners_stmt():
+    counter = models.TaskCounter
+    return (
+        select(counter.owner_id)
+        .where(counter.status == models.TaskStatus.DONE.value, counter.count > 0)
+        .order_by(counter.owner_id)
+    )
+
+def _archive_batch_stmt(owner_id: int, cutoff: datetime, batch_size: int):
+    Task = models.Task
+    archivable = [_owned(owner_id), Task.status == models.TaskStatus.DONE, Task.updated_at < cutoff]
+    candidates = select(Task.id).where(*archivable).order_by(Task.updated_at, Task.id).limit(batch_size)
+    return (
+        delete(Task)
+        .where(Task.id.in_(candidates.scalar_subquery()), *archivable)
+        .returning(Task)
+    )
+
+def _archive_rows(tasks: list) -> list[dict]:
+    return [{field: getattr(db_task, field) for field in ARCHIVE_FIELDS} for db_task in tasks]
+
+def _archive_cutoff(older_than_days: float) -> datetime:
+    return datetime.now(timezone.utc) - timedelta(days=older_than_days)
+
+def archive_done_tasks(db: Session, older_than_days: float, batch_size: int = 1000) -> int:
+    cutoff = _archive_cutoff(older_than_days)
+    archived = 0
+    for owner_id in db.scalars(_archive_owners_stmt()).all():
+        while True:
+            stmt = _archive_batch_stmt(owner_id, cutoff, batch_size)
+            tasks = db.scalars(stmt, execution_options=_NO_SYNC).all()
+            if tasks:
+                db.execute(insert(models.TaskArchive), _archive_rows(tasks))
+            _finish_write(db, owner_id, "deleted", tasks)
+            archived += len(tasks)
+            if len(tasks) < batch_size:
+                break
+    return archived
+
+async def archive_done_tasks_async(db: AsyncSession, older_than_days: float,
+                                   batch_size: int = 1000) -> int:
+    cutoff = _archive_cutoff(older_than_days)
+    archived = 0
+    for owner_id in (await db.scalars(_archive_owners_stmt())).all():
+        while True:
+            stmt = _archive_batch_stmt(owner_id, cutoff, batch_size)
+            tasks = (await db.scalars(stmt, execution_options=_NO_SYNC)).all()
+            if tasks:
+                await db.execute(insert(models.TaskArchive), _archive_rows(tasks))
+            await _finish_write_async(db, owner_id, "deleted", tasks)
+            archived += len(tasks)
+            if len(tasks) < batch_size:
+                break
+    return archived
+
+
+#
+# 12. Очистка журнала изменений (фоновое задание prune_task_changes, см. jobs.py)
+# Удаляет строки task_changes старше older_than_days дней пачками по
+# первичному ключу: старые строки лежат в начале диапазона, поэтому
+# каждая пачка - короткий просмотр индекса, а не всей таблицы.
+# Вместе с пачкой в той же транзакции сдвигается граница очистки:
+# клиенты с токеном до нее получат снимок (см. get_changes).
+# Пересчет сводки читает журнал за окно активности - его не трогаем.
+# Возвращает число удаленных строк
+#
+def _prune_cutoff(older_than_days: float) -> datetime:
+    keep = max(timedelta(days=older_than_days), max(ACTIVITY_WINDOWS.values()))
+    return datetime.now(timezone.utc) - keep
+
+def _prune_batch_stmt(cutoff: datetime, batch_size: int):
+    change = models.TaskChange
+    return (
+        select(change.id).where(change.changed_at < cutoff)
+        .order_by(change.id).limit(batch_size)
+    )
+
+def _prune_stmts(db: Session | AsyncSession, cutoff: datetime, ids: list[int]):
+    change = models.TaskChange
+    upper = max(ids)
+    mark = _upsert(db, models.TableVersion).values(name=CHANGES_PRUNED, version=upper)
+    return [
+        delete(change).where(change.id <= upper, change.changed_at < cutoff),
+        # Граница только растет
+        mark.on_conflict_do_update(
+            index_elements=[models.TableVersion.name],
+            set_={"version": case(
+                (mark.excluded.version > models.TableVersion.version, mark.excluded.version),
+                else_=models.TableVersion.version,
+            )},
+        ),
+    ]
+
+def prune_changes(db: Session, older_than_days: float, batch_size: int = 10_000) -> int:
+    cutoff = _prune_cutoff(older_than_days)
+    pruned = 0
+    while True:
+        ids = db.scalars(_prune_batch_stmt(cutoff, batch_size)).all()
+        if not ids:
+            return pruned
+        for stmt in _prune_stmts(db, cutoff, ids):
+            db.execute(stmt)
         db.commit()
-        
-    return db_task
\ No newline at end of file
+        pruned += len(ids)
+        if len(ids) < batch_size:
+            return pruned
+
+async def prune_changes_async(db: AsyncSession, older_than_days: float,
+                              batch_size: int = 10_000) -> int:
+    cutoff = _prune_cutoff(older_than_days)
+    pruned = 0
+    while True:
+        ids = (await db.scalars(_prune_batch_stmt(cutoff, batch_size))).all()
+        if not ids:
+            return pruned
+        for stmt in _prune_stmts(db, cutoff, ids):
+            await db.execute(stmt)
+        await db.commit()
+        pruned += len(ids)
+        if len(ids) < batch_size:
+            return pruned
+
+
+#
+# 13. Пользователи (владельцы задач). Токены выдает auth.py
+#
+def create_user(db: Session, name: str) -> models.User:
+    db_user = models.User(name=name)
+    db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
+def get_user(db: Session, user_id: int) -> models.User | None:
+    return db.get(models.User, user_id)
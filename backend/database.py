@@ -1,27 +1,359 @@
-from sqlalchemy import create_engine
+import asyncio
+import os
+import threading
+from functools import lru_cache
+from typing import Literal
+from uuid import uuid4
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
 # --- 1. ІМПОРТУЄМО НАЛАШТУВАННЯ ---
 from pydantic_settings import BaseSettings
 
+import metrics
+
 # --- 2. СТВОРЮЄМО КЛАС ДЛЯ ЧИТАННЯ .env ---
 class Settings(BaseSettings):
     # Ця змінна "автоматично" завантажить 
     # 'DATABASE_URL' з вашого файлу .env
     DATABASE_URL: str
 
+    # Асинхронний режим: async-движок + AsyncSession для всіх ендпоінтів.
+    # За замовчуванням вимкнено - працює звичайний (синхронний) шлях,
+    # тож обидва режими можна навантажувально порівняти, змінивши лише .env
+    DB_ASYNC: bool = False
+    # URL для async-драйвера. Якщо не задано - виводиться з DATABASE_URL
+    # (postgresql -> postgresql+asyncpg, sqlite -> sqlite+aiosqlite)
+    ASYNC_DATABASE_URL: str | None = None
+
+    # Налаштування пулу з'єднань (для PostgreSQL; SQLite їх не потребує)
+    DB_POOL_SIZE: int = 5            # постійні з'єднання
+    DB_MAX_OVERFLOW: int = 10        # додаткові з'єднання на час піку
+    DB_POOL_TIMEOUT: float = 30      # скільки чекати вільне з'єднання, сек
+    # Перевідкривати з'єднання, старші за N сек (-1 = ніколи).
+    # Хостинг закриває "сплячі" з'єднання - краще зробити це раніше за нього
+    DB_POOL_RECYCLE: int = 1800
+    # Перевіряти з'єднання легким пінгом перед видачею з пулу,
+    # щоб після простою не отримати "server closed the connection"
+    DB_POOL_PRE_PING: bool = True
+    # Ліміт часу на один SQL-запит у мс (None = без ліміту)
+    DB_STATEMENT_TIMEOUT_MS: int | None = None
+    # Сумісність з PgBouncer (transaction pooling): вимикає кеш
+    # prepared statements asyncpg і не передає startup-параметри
+    DB_PGBOUNCER: bool = False
+
+    # Кеш читання (cache.py): memory - LRU/TTL у процесі,
+    # redis - спільний для всіх воркерів (потрібен пакет redis), none - вимкнено
+    CACHE_BACKEND: Literal["memory", "redis", "none"] = "memory"
+    CACHE_TTL_SECONDS: float = 60
+    CACHE_MAX_ENTRIES: int = 10_000
+    REDIS_URL: str = "redis://localhost:6379/0"
+
+    # Ідемпотентні записи (idempotency.py, заголовок Idempotency-Key):
+    # memory - у процесі (LRU), redis - спільно для всіх воркерів, none - вимкнено
+    IDEMPOTENCY_BACKEND: Literal["memory", "redis", "none"] = "memory"
+    # Скільки зберігати відповідь для повтору, сек
+    IDEMPOTENCY_TTL_SECONDS: float = 86400
+    IDEMPOTENCY_MAX_KEYS: int = 10_000
+    # Скільки діє позначка "запит виконується" (на випадок падіння процесу)
+    IDEMPOTENCY_LOCK_SECONDS: float = 60
+
+    # Push-події змін задач (events.py, GET /tasks/stream):
+    # local - лише в межах процесу, postgres - LISTEN/NOTIFY між усіма воркерами
+    EVENTS_BACKEND: Literal["local", "postgres"] = "local"
+    EVENTS_CHANNEL: str = "task_events"
+    # Скільки подій може чекати на повільного клієнта, перш ніж він отримає resync
+    EVENTS_QUEUE_SIZE: int = 100
+    # Інтервал keepalive-коментарів у SSE-потоці, сек
+    SSE_HEARTBEAT_SECONDS: float = 15
+
+    # Метрики (metrics.py, GET /metrics).
+    # Журнал повільних запросів: SQL, довші за N мс (None = вимкнено)
+    DB_SLOW_QUERY_MS: float | None = None
+    # Попередження "можливо, N+1", якщо один HTTP-запит зробив
+    # більше N SQL-запитів (0 = вимкнено)
+    DB_QUERY_WARN_THRESHOLD: int = 20
+
+    # Автентифікація (auth.py).
+    # single - один власник без входу: усі запити працюють із задачами
+    #   DEFAULT_OWNER_ID (одна команда/дошка; ізоляції між користувачами немає);
+    # token - власник (tenant) береться лише з підписаного токена
+    #   "Authorization: Bearer ..."; без AUTH_SECRET API відхиляє всі запити
+    AUTH_MODE: Literal["single", "token"] = "single"
+    AUTH_SECRET: str | None = None
+    # Скільки секунд дійсний токен (0 = без обмеження)
+    AUTH_TOKEN_MAX_AGE_SECONDS: int = 0
+    # Власник у режимі single і власник задач, створених до появи власників
+    DEFAULT_OWNER_ID: int = 1
+    # Декларативне секціонування tasks у PostgreSQL: HASH (owner_id)
+    # на N секцій (0 = вимкнено). Діє лише при створенні таблиці
+    TASK_PARTITIONS: int = 0
+
+    # Холодний старт (lifespan у main.py).
+    # Створити або оновити схему (міграції alembic) під час старту - замість ручного init_db.py
+    DB_INIT_SCHEMA: bool = False
+    # Скільки з'єднань відкрити у фоні одразу після старту (0 = не прогрівати).
+    # Не більше DB_POOL_SIZE: решта все одно закрилася б після повернення в пул
+    DB_WARMUP_CONNECTIONS: int = 0
+
+    # Фонові завдання (jobs.py): черга в таблиці jobs і пул воркерів у процесі.
+    # Скільки воркерів запускати в цьому процесі (0 = не виконувати завдання тут)
+    JOBS_WORKERS: int = 0
+    # Скільки завдань воркер забирає за один запит до черги
+    JOBS_BATCH_SIZE: int = 10
+    # Як часто перевіряти порожню чергу, сек
+    JOBS_POLL_SECONDS: float = 1
+    # Скільки завдання вважається зайнятим воркером (потім його візьме інший)
+    JOBS_LEASE_SECONDS: float = 300
+    JOBS_MAX_ATTEMPTS: int = 5
+    # Пауза перед повтором: BASE * 2^(спроба - 1), не більше MAX, сек
+    JOBS_RETRY_BASE_SECONDS: float = 10
+    JOBS_RETRY_MAX_SECONDS: float = 3600
+
+    # Архів виконаних задач: DONE, не змінені N днів, переносяться
+    # в tasks_archive (0 = вимкнено). Запускається воркерами кожні INTERVAL сек
+    ARCHIVE_DONE_AFTER_DAYS: int = 30
+    ARCHIVE_INTERVAL_SECONDS: float = 3600
+    # Скільки задач переносити за одну транзакцію
+    ARCHIVE_BATCH_SIZE: int = 1000
+
+    # Журнал змін (task_changes): рядки старші за N днів видаляються
+    # (0 = зберігати вічно). Не менше 7 днів - вікна активності зведення.
+    # Клієнт зі старішим токеном отримає знімок замість стрічки змін
+    CHANGES_RETENTION_DAYS: int = 30
+    CHANGES_PRUNE_INTERVAL_SECONDS: float = 3600
+    CHANGES_PRUNE_BATCH_SIZE: int = 10_000
+
     class Config:
         env_file = ".env"
 
-# --- 3. СТВОРЮЄМО ЕКЗЕМПЛЯР НАЛАШТУВАНЬ ---
-# Python прочитає .env та збереже DATABASE_URL тут
-settings = Settings()
 
-# --- 4. НАШ СТАРИЙ КОД, АЛЕ ТЕПЕР БЕЗПЕЧНИЙ ---
-# Ми використовуємо 'settings.DATABASE_URL' (з .env)
-# ЗАМІСТЬ "зашитого" рядка з паролем
-engine = create_engine(settings.DATABASE_URL)
+# Асинхронні драйвери для відомих баз
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def make_async_url(url: str) -> str:
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for '{backend}'")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+#
+# Параметри create_engine()/create_async_engine() з налаштувань
+#
+def engine_options(settings: "Settings", url: str) -> dict:
+    parsed = make_url(url)
+    options = {
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+    if parsed.get_backend_name() != "postgresql":
+        return options
+
+    options.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+    )
+    connect_args = {}
+    is_asyncpg = parsed.get_driver_name() == "asyncpg"
+
+    if settings.DB_PGBOUNCER and is_asyncpg:
+        # PgBouncer у режимі transaction віддає кожну транзакцію
+        # будь-якому серверному з'єднанню - іменовані prepared statements
+        # там "губляться". Вимикаємо кеші та робимо імена унікальними
+        connect_args.update(
+            statement_cache_size=0,
+            prepared_statement_cache_size=0,
+            prepared_statement_name_func=lambda: f"__asyncpg_{uuid4()}__",
+        )
+
+    # PgBouncer відхиляє невідомі startup-параметри, тому з ним
+    # statement_timeout варто задати на ролі: ALTER ROLE ... SET statement_timeout
+    if settings.DB_STATEMENT_TIMEOUT_MS and not settings.DB_PGBOUNCER:
+        if is_asyncpg:
+            connect_args["server_settings"] = {
+                "statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)
+            }
+        else:
+            connect_args["options"] = f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"
+
+    if connect_args:
+        options["connect_args"] = connect_args
+    return options
+
+#
+# Стан пулу для /health/db
+#
+def pool_status(engine) -> dict:
+    pool = engine.pool
+    status = {"class": type(pool).__name__}
+    # Лічильники є лише в QueuePool (SQLite у пам'яті/тести їх не мають).
+    # У SingletonThreadPool "size" - це атрибут-число, а не метод
+    for key, method in (("size", "size"), ("checked_in", "checkedin"),
+                        ("checked_out", "checkedout"), ("overflow", "overflow")):
+        if callable(getattr(pool, method, None)):
+            status[key] = getattr(pool, method)()
+    return status
+
+# --- 3. НАЛАШТУВАННЯ ТА ДВИЖКИ СТВОРЮЮТЬСЯ ЛІНИВО ---
+# Імпорт модуля нічого не читає і нікуди не підключається: .env
+# читається при першому зверненні до settings, а движок (і разом із ним
+# драйвер psycopg2/asyncpg) - при першому запиті до БД або на старті
+# застосунку (lifespan у main.py). Це скорочує холодний старт.
+# Старі імена (database.settings, database.engine, database.SessionLocal,
+# database.async_engine, database.AsyncSessionLocal) працюють як раніше
+Base = declarative_base()
+
+_lock = threading.Lock()
+
+@lru_cache
+def get_settings() -> Settings:
+    # Python прочитає .env та збереже DATABASE_URL тут
+    return Settings()
+
+def get_engine():
+    # --- 4. НАШ СТАРИЙ КОД, АЛЕ ТЕПЕР БЕЗПЕЧНИЙ ---
+    # Ми використовуємо 'settings.DATABASE_URL' (з .env)
+    # ЗАМІСТЬ "зашитого" рядка з паролем
+    global engine, SessionLocal
+    with _lock:
+        if "engine" not in globals():
+            settings = get_settings()
+            new_engine = create_engine(
+                settings.DATABASE_URL, **engine_options(settings, settings.DATABASE_URL)
+            )
+            # Час і кількість SQL-запитів для /metrics (події курсора движка)
+            metrics.instrument_engine(new_engine, settings.DB_SLOW_QUERY_MS)
+            SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=new_engine)
+            engine = new_engine
+    return engine
+
+def get_session_factory():
+    get_engine()
+    return SessionLocal
+
+# --- 5. АСИНХРОННИЙ ДВИЖОК (лише якщо DB_ASYNC=true) ---
+# Драйвер (asyncpg/aiosqlite) імпортується тільки в цьому режимі
+def get_async_engine():
+    global async_engine, AsyncSessionLocal
+    with _lock:
+        if "async_engine" not in globals():
+            settings = get_settings()
+            new_engine = None
+            AsyncSessionLocal = None
+            if settings.DB_ASYNC:
+                from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+                async_url = settings.ASYNC_DATABASE_URL or make_async_url(settings.DATABASE_URL)
+                new_engine = create_async_engine(async_url, **engine_options(settings, async_url))
+                metrics.instrument_engine(new_engine, settings.DB_SLOW_QUERY_MS)
+                # expire_on_commit=False: після commit() об'єкти не "протухають",
+                # інакше читання поля вимагало б прихованого (і неможливого в async) SELECT
+                AsyncSessionLocal = async_sessionmaker(
+                    new_engine, autoflush=False, expire_on_commit=False
+                )
+            async_engine = new_engine
+    return async_engine
+
+def get_async_session_factory():
+    get_async_engine()
+    return AsyncSessionLocal
+
+_LAZY = {
+    "settings": get_settings,
+    "engine": get_engine,
+    "SessionLocal": get_session_factory,
+    "async_engine": get_async_engine,
+    "AsyncSessionLocal": get_async_session_factory,
+}
+
+def __getattr__(name: str):
+    if name in _LAZY:
+        return _LAZY[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def created_engines() -> list:
+    """Уже створені движки (без створення нових)"""
+    return [value for name in ("engine", "async_engine") if (value := globals().get(name))]
+
+#
+# Старт і зупинка застосунку (lifespan у main.py)
+#
+# Міграції схеми (alembic, каталог migrations/)
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+
+def migrate_schema(connection, partitions: int = 0) -> None:
+    """
+    Доводить схему до останньої міграції в транзакції connection.
+    Порожня БД створюється з моделей одразу (з секціонуванням tasks,
+    якщо partitions > 0) і позначається останньою ревізією
+    """
+    from alembic import command
+    from alembic.config import Config
+    from sqlalchemy import inspect
+
+    import models
+
+    config = Config(ALEMBIC_INI)
+    config.attributes["connection"] = connection
+    if inspect(connection).has_table(models.Task.__tablename__):
+        command.upgrade(config, "head")
+    else:
+        models.create_schema(connection, partitions)
+        # Власник режиму AUTH_MODE=single (міграції додають його самі)
+        connection.execute(models.User.__table__.insert().values(
+            id=get_settings().DEFAULT_OWNER_ID, name="default"
+        ))
+        if connection.dialect.name == "postgresql":
+            connection.execute(text(
+                "SELECT setval(pg_get_serial_sequence('users', 'id'), (SELECT max(id) FROM users))"
+            ))
+        command.stamp(config, "head")
+
+async def init_schema(db_engine) -> None:
+    """Створює або оновлює схему БД міграціями (замість ручного init_db.py)"""
+    partitions = get_settings().TASK_PARTITIONS
+    if hasattr(db_engine, "sync_engine"):
+        async with db_engine.begin() as conn:
+            await conn.run_sync(migrate_schema, partitions)
+    else:
+        def migrate():
+            with db_engine.begin() as conn:
+                migrate_schema(conn, partitions)
+
+        await asyncio.to_thread(migrate)
+
+async def warm_up(db_engine, connections: int) -> None:
+    """
+    Відкриває connections з'єднань і повертає їх у пул: TCP/TLS, автентифікація
+    та перший запит діалекту відбуваються до першого запиту клієнта
+    """
+    if hasattr(db_engine, "sync_engine"):
+        opened = await asyncio.gather(*(db_engine.connect() for _ in range(connections)))
+        for conn in opened:
+            await conn.execute(text("SELECT 1"))
+            await conn.close()
+        return
+
+    def ping_all():
+        opened = [db_engine.connect() for _ in range(connections)]
+        for conn in opened:
+            conn.execute(text("SELECT 1"))
+            conn.close()
+
+    await asyncio.to_thread(ping_all)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+async def dispose_engines() -> None:
+    """Закриває з'єднання пулів (лише тих движків, що вже створені)"""
+    for db_engine in created_engines():
+        if hasattr(db_engine, "sync_engine"):
+            await db_engine.dispose()
+        else:
+            db_engine.dispose()
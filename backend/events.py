@@ -0,0 +1,324 @@
+import asyncio
+import json
+import logging
+import threading
+from contextlib import asynccontextmanager
+
+from sqlalchemy import func, select
+
+from database import get_settings
+
+logger = logging.getLogger(__name__)
+#
+# Push-уведомления об изменениях задач (GET /tasks/stream, Server-Sent Events).
+#
+# crud.py публикует события create/update/delete после каждой записи,
+# брокер раздает их подписчикам внутри процесса. Каждое событие несет
+# owner_id и доставляется только подписчикам того же владельца. Подписчик - это одна
+# asyncio.Queue; простаивающий подписчик ничего не стоит, кроме памяти,
+# поэтому тысячи открытых соединений на одном воркере - нормально.
+#
+# Бэкенды доставки:
+#   - LocalBackend: только текущий процесс (по умолчанию, один воркер)
+#   - PostgresNotifyBackend: NOTIFY в той же транзакции, что и запись,
+#     и LISTEN в каждом воркере - все uvicorn-воркеры видят все события
+#
+
+class Subscription:
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue_size: int):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def offer(self, event: dict | None) -> None:
+        if self.overflowed:
+            return
+        if event is None:
+            self.request_resync()
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Медленный клиент: вместо бесконечного буфера просим
+            # его пересинхронизироваться через GET /tasks/changes
+            self.request_resync()
+
+    def request_resync(self) -> None:
+        self.overflowed = True
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    async def get(self) -> dict | None:
+        return await self.queue.get()
+
+
+class EventBroker:
+    def __init__(self, backend=None, queue_size: int = 100):
+        self.queue_size = queue_size
+        # event loop -> owner_id -> подписки
+        self._subscribers: dict[asyncio.AbstractEventLoop, dict[int, set[Subscription]]] = {}
+        # Публикация идет и из threadpool (синхронный CRUD)
+        self._lock = threading.Lock()
+        self.backend = backend or LocalBackend()
+        self.backend.attach(self)
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(
+                len(subs) for owners in self._subscribers.values() for subs in owners.values()
+            )
+
+    @property
+    def active(self) -> bool:
+        # Для Postgres подписчики могут быть в других воркерах
+        return self.backend.always_active or self.subscriber_count > 0
+
+    @asynccontextmanager
+    async def subscribe(self, owner_id: int):
+        await self.backend.start()
+        loop = asyncio.get_running_loop()
+        subscription = Subscription(loop, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(loop, {}).setdefault(owner_id, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                owners = self._subscribers[loop]
+                owners[owner_id].discard(subscription)
+                if not owners[owner_id]:
+                    del owners[owner_id]
+
+    def resync(self) -> None:
+        """Попросить всех подписчиков процесса пересинхронизироваться (часть событий могла потеряться)"""
+        with self._lock:
+            groups = [
+                (loop, [(list(subscriptions), [None]) for subscriptions in owners.values()])
+                for loop, owners in self._subscribers.items() if owners
+            ]
+        for loop, batch in groups:
+            loop.call_soon_threadsafe(self._fan_out, batch)
+
+    async def close(self) -> None:
+        await self.backend.stop()
+
+    def dispatch(self, events: list[dict]) -> None:
+        """Раздать события подписчикам их владельцев в этом процессе (потокобезопасно)"""
+        by_owner: dict[int, list[dict]] = {}
+        for event in events:
+            by_owner.setdefault(event["owner_id"], []).append(event)
+        with self._lock:
+            groups = []
+            for loop, owners in self._subscribers.items():
+                batch = [
+                    (list(owners[owner_id]), owner_events)
+                    for owner_id, owner_events in by_owner.items() if owner_id in owners
+                ]
+                if batch:
+                    groups.append((loop, batch))
+        # Один вызов на event loop, а не на каждого подписчика
+        for loop, batch in groups:
+            loop.call_soon_threadsafe(self._fan_out, batch)
+
+    @staticmethod
+    def _fan_out(batch: list[tuple[list[Subscription], list[dict | None]]]) -> None:
+        for subscriptions, events in batch:
+            for subscription in subscriptions:
+                for event in events:
+                    subscription.offer(event)
+
+    # --- Вызывается из crud.py ---
+    def before_commit(self, events: list[dict]) -> list:
+        """SQL-запросы, которые нужно выполнить в транзакции записи"""
+        return self.backend.before_commit(events) if events else []
+
+    def after_commit(self, events: list[dict]) -> None:
+        if events:
+            self.backend.after_commit(events)
+
+
+class LocalBackend:
+    always_active = False
+
+    def attach(self, broker: EventBroker) -> None:
+        self.broker = broker
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def before_commit(self, events: list[dict]) -> list:
+        return []
+
+    def after_commit(self, events: list[dict]) -> None:
+        self.broker.dispatch(events)
+
+
+class PostgresNotifyBackend:
+    """
+    NOTIFY отправляется запросом в той же транзакции, что и запись:
+    PostgreSQL доставит его только после COMMIT (и не доставит при ROLLBACK).
+    Каждый воркер при первой подписке открывает отдельное asyncpg-соединение
+    с LISTEN и раздает пришедшие события своим подписчикам.
+    С PgBouncer в режиме transaction LISTEN не работает - нужен прямой DSN.
+    Если соединение с LISTEN оборвалось (рестарт БД, failover, сеть),
+    оно переоткрывается с растущей паузой; NOTIFY за время разрыва
+    потеряны, поэтому после переподключения подписчики получают resync.
+    """
+
+    always_active = True
+    # Лимит payload у NOTIFY - 8000 байт
+    MAX_PAYLOAD = 7900
+    # Пауза между попытками переподключения: от и до (секунды)
+    RECONNECT_MIN = 0.5
+    RECONNECT_MAX = 30.0
+
+    def __init__(self, dsn: str, channel: str = "task_events"):
+        self.dsn = dsn
+        self.channel = channel
+        self._connection = None
+        self._start_lock = None
+        self._reconnecting: asyncio.Task | None = None
+
+    def attach(self, broker: EventBroker) -> None:
+        self.broker = broker
+
+    @property
+    def connected(self) -> bool:
+        return self._connection is not None
+
+    async def start(self) -> None:
+        if self._connection is not None or self._reconnecting is not None:
+            return
+        self._start_lock = self._start_lock or asyncio.Lock()
+        async with self._start_lock:
+            if self._connection is None and self._reconnecting is None:
+                self._connection = await self._connect()
+
+    async def stop(self) -> None:
+        if self._reconnecting is not None:
+            self._reconnecting.cancel()
+            await asyncio.gather(self._reconnecting, return_exceptions=True)
+            self._reconnecting = None
+        # Сначала забываем соединение: свое закрытие - не обрыв
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            await connection.close()
+
+    async def _open_connection(self):
+        import asyncpg
+
+        return await asyncpg.connect(self.dsn)
+
+    async def _connect(self):
+        connection = await self._open_connection()
+        try:
+            await connection.add_listener(self.channel, self._on_notify)
+        except BaseException:
+            await connection.close()
+            raise
+        connection.add_termination_listener(self._on_terminate)
+        return connection
+
+    def _on_terminate(self, connection) -> None:
+        if connection is not self._connection:
+            return
+        logger.warning("LISTEN connection to %s lost, reconnecting", self.channel)
+        self._connection = None
+        self._reconnecting = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        delay = self.RECONNECT_MIN
+        try:
+            while True:
+                try:
+                    self._connection = await self._connect()
+                    break
+                except Exception as exc:
+                    logger.warning("LISTEN reconnect failed, retrying in %.1fs: %s", delay, exc)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.RECONNECT_MAX)
+        finally:
+            self._reconnecting = None
+        logger.info("LISTEN connection to %s restored", self.channel)
+        self.broker.resync()
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:
+        self.broker.dispatch([json.loads(payload)])
+
+    def before_commit(self, events: list[dict]) -> list:
+        stmts = []
+        for event in events:
+            payload = json.dumps(event, separators=(",", ":"))
+            if len(payload.encode()) > self.MAX_PAYLOAD:
+                # Слишком большая задача: отправляем только id, клиент дочитает ее сам
+                payload = json.dumps({
+                    "op": event["op"], "id": event["id"],
+                    "owner_id": event["owner_id"], "truncated": True,
+                })
+            stmts.append(select(func.pg_notify(self.channel, payload)))
+        return stmts
+
+    def after_commit(self, events: list[dict]) -> None:
+        # Доставка придет через LISTEN - в том числе в этот же воркер
+        pass
+
+
+#
+# Поток SSE для одного клиента.
+# Комментарий-пинг раз в heartbeat секунд не дает прокси закрыть
+# простаивающее соединение. При переполнении очереди клиент получает
+# событие resync и должен догнать изменения через GET /tasks/changes.
+#
+async def sse_stream(broker: EventBroker, heartbeat: float, owner_id: int):
+    async with broker.subscribe(owner_id) as subscription:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                yield "event: resync\ndata: {}\n\n"
+                return
+            yield f"event: {event['op']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+
+def build_broker(settings) -> EventBroker:
+    if settings.EVENTS_BACKEND == "postgres":
+        from sqlalchemy.engine import make_url
+
+        # asyncpg принимает обычный DSN без "+драйвер"
+        dsn = make_url(settings.DATABASE_URL).set(drivername="postgresql")
+        backend = PostgresNotifyBackend(
+            dsn.render_as_string(hide_password=False), settings.EVENTS_CHANNEL
+        )
+        return EventBroker(backend, settings.EVENTS_QUEUE_SIZE)
+    return EventBroker(LocalBackend(), settings.EVENTS_QUEUE_SIZE)
+
+
+# Брокер создается при первом обращении (events.broker)
+_lock = threading.Lock()
+
+def get_broker() -> EventBroker:
+    global broker
+    with _lock:
+        if "broker" not in globals():
+            broker = build_broker(get_settings())
+    return broker
+
+async def close_broker() -> None:
+    """Закрыть брокер, если он был создан (lifespan в main.py)"""
+    created = globals().get("broker")
+    if created is not None:
+        await created.close()
+
+def __getattr__(name: str):
+    if name == "broker":
+        return get_broker()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import threading
+
+from fastapi import Response
+
+from cache import MemoryCache, RedisCache
+from database import get_settings
+
+#
+# Идемпотентные записи (заголовок Idempotency-Key).
+#
+# Клиент, повторяющий POST/PUT после обрыва связи, передает тот же ключ.
+# Первый запрос выполняется и его ответ сохраняется; повтор получает
+# сохраненный ответ (с заголовком Idempotent-Replayed: true), а CRUD
+# не вызывается второй раз.
+#   - ключ действует в пределах владельца (owner_id) и живет
+#     IDEMPOTENCY_TTL_SECONDS; хранилище ограничено (LRU) или Redis;
+#   - тот же ключ с другим запросом (метод, путь, тело) -> IdempotencyMismatch;
+#   - повтор, пока первый запрос еще выполняется -> IdempotencyInProgress;
+#   - ошибки (исключения, 5xx) не сохраняются: повтор выполнится заново.
+#
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+# Заголовки ответа, которые повтор должен получить так же, как оригинал
+STORED_HEADERS = ("etag",)
+
+
+class IdempotencyMismatch(Exception):
+    pass
+
+
+class IdempotencyInProgress(Exception):
+    pass
+
+
+def request_fingerprint(method: str, path: str, payload: str) -> str:
+    return hashlib.sha256(f"{method} {path}\n{payload}".encode()).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, backend, lock_seconds: float = 60):
+        self.backend = backend
+        # Сколько держать отметку "выполняется", если процесс упадет посреди запроса
+        self.lock_seconds = lock_seconds
+
+    @staticmethod
+    def _key(owner_id: int, key: str) -> str:
+        return f"idempotency:{owner_id}:{key}"
+
+    def begin(self, owner_id: int, key: str, fingerprint: str) -> Response | None:
+        """None - запрос нужно выполнить; Response - сохраненный ответ для повтора"""
+        pending = json.dumps({"fingerprint": fingerprint})
+        if self.backend.add(self._key(owner_id, key), pending, ttl=self.lock_seconds):
+            return None
+        stored = self.backend.get(self._key(owner_id, key))
+        if stored is None:
+            # Запись истекла между add() и get() - считаем, что ключ занят
+            raise IdempotencyInProgress
+        record = json.loads(stored)
+        if record["fingerprint"] != fingerprint:
+            raise IdempotencyMismatch
+        if "status" not in record:
+            raise IdempotencyInProgress
+        return Response(
+            content=record["body"],
+            status_code=record["status"],
+            media_type=record["media_type"],
+            headers={**record["headers"], REPLAYED_HEADER: "true"},
+        )
+
+    def complete(self, owner_id: int, key: str, fingerprint: str, response: Response) -> None:
+        if response.status_code >= 500:
+            self.release(owner_id, key)
+            return
+        self.backend.set(self._key(owner_id, key), json.dumps({
+            "fingerprint": fingerprint,
+            "status": response.status_code,
+            "media_type": response.media_type,
+            "body": response.body.decode(),
+            "headers": {name: value for name, value in response.headers.items()
+                        if name in STORED_HEADERS},
+        }))
+
+    def release(self, owner_id: int, key: str) -> None:
+        self.backend.delete(self._key(owner_id, key))
+
+    async def run(self, owner_id: int, key: str, fingerprint: str, handler) -> Response:
+        """Выполнить handler() один раз для ключа; повторы получают его ответ"""
+        replay = self.begin(owner_id, key, fingerprint)
+        if replay is not None:
+            return replay
+        try:
+            response = await handler()
+        except BaseException:
+            self.release(owner_id, key)
+            raise
+        self.complete(owner_id, key, fingerprint, response)
+        return response
+
+
+def build_store(settings) -> IdempotencyStore | None:
+    if settings.IDEMPOTENCY_BACKEND == "none":
+        return None
+    if settings.IDEMPOTENCY_BACKEND == "redis":
+        # redis - необязательная зависимость, нужна только в этом режиме
+        import redis
+
+        client = redis.Redis.from_url(settings.REDIS_URL)
+        backend = RedisCache(client, ttl=settings.IDEMPOTENCY_TTL_SECONDS)
+    else:
+        backend = MemoryCache(settings.IDEMPOTENCY_MAX_KEYS, settings.IDEMPOTENCY_TTL_SECONDS)
+    return IdempotencyStore(backend, settings.IDEMPOTENCY_LOCK_SECONDS)
+
+
+# Хранилище создается при первом обращении (idempotency.store)
+_lock = threading.Lock()
+
+def get_store() -> IdempotencyStore | None:
+    global store
+    with _lock:
+        if "store" not in globals():
+            store = build_store(get_settings())
+    return store
+
+def __getattr__(name: str):
+    if name == "store":
+        return get_store()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,164 @@
+import csv
+
+import orjson
+from pydantic import ValidationError
+
+import schemas
+
+#
+# Потоковый импорт задач (POST /tasks/import): NDJSON или CSV.
+#
+# Тело запроса читается по кускам и режется на записи, записи собираются
+# в пачки по IMPORT_CHUNK_SIZE, каждая пачка проверяется schemas.TaskCreate
+# и загружается одним вызовом crud.import_tasks (COPY / executemany).
+# Ошибочные строки не останавливают импорт - они попадают в отчет
+# с номером строки во входном файле.
+#
+IMPORT_CHUNK_SIZE = 5000
+# Сколько ошибок перечислять в ответе (всего ошибок - в поле failed)
+IMPORT_MAX_ERRORS = 1000
+# Предел одной строки (для CSV - всей многострочной записи). Без него
+# одна огромная строка целиком копилась бы в памяти, и потоковое чтение
+# теряло бы смысл: такой импорт прерывается (413)
+IMPORT_MAX_LINE_BYTES = 1024 * 1024
+
+
+class RecordTooLarge(ValueError):
+    """Строка или запись длиннее IMPORT_MAX_LINE_BYTES"""
+
+    def __init__(self, line: int):
+        super().__init__(f"Line {line} exceeds {IMPORT_MAX_LINE_BYTES} bytes")
+        self.line = line
+
+
+async def iter_records(stream, fmt: str):
+    """
+    Куски байт -> (номер строки, запись). Для CSV запись может занимать
+    несколько строк (перевод строки внутри кавычек): строки склеиваются,
+    пока число кавычек нечетное. Строка, которая не декодируется как UTF-8,
+    приходит вместо текста ошибкой (ValueError) и попадает в отчет.
+    Строка или запись длиннее IMPORT_MAX_LINE_BYTES -> RecordTooLarge,
+    как только буфер превысит предел (не дожидаясь конца строки)
+    """
+    pending = b""
+    line_no = 0
+    record, record_line, record_size = None, 0, 0
+
+    async def lines():
+        nonlocal pending
+        async for chunk in stream:
+            pending += chunk
+            *complete, pending = pending.split(b"\n")
+            for line in complete:
+                yield line
+            if len(pending) > IMPORT_MAX_LINE_BYTES:
+                raise RecordTooLarge(line_no + 1 if record is None else record_line)
+        if pending:
+            yield pending
+
+    async for raw in lines():
+        line_no += 1
+        record_size = len(raw) if record is None else record_size + 1 + len(raw)
+        if record_size > IMPORT_MAX_LINE_BYTES:
+            raise RecordTooLarge(line_no if record is None else record_line)
+        try:
+            line = raw.decode("utf-8-sig" if line_no == 1 else "utf-8").rstrip("\r")
+        except UnicodeDecodeError:
+            # Для CSV битая строка обрывает и незаконченную многострочную запись
+            yield (line_no if record is None else record_line), ValueError("Invalid UTF-8")
+            record = None
+            continue
+        if fmt == "csv":
+            record, record_line = (line, line_no) if record is None else (f"{record}\n{line}", record_line)
+            if record.count('"') % 2:
+                continue
+            line, record = record, None
+        else:
+            record_line = line_no
+        if line.strip():
+            yield record_line, line
+    if record is not None:
+        yield record_line, record
+
+
+async def iter_chunks(records, size: int):
+    chunk = []
+    async for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _error(line: int, exc: Exception) -> dict:
+    if isinstance(exc, ValidationError):
+        first = exc.errors()[0]
+        loc = ".".join(str(part) for part in first["loc"])
+        return {"line": line, "error": f"{loc}: {first['msg']}" if loc else first["msg"]}
+    return {"line": line, "error": str(exc)}
+
+
+def _parse_ndjson(records):
+    for line, text in records:
+        if isinstance(text, Exception):
+            yield line, text
+            continue
+        try:
+            yield line, orjson.loads(text)
+        except orjson.JSONDecodeError:
+            yield line, ValueError("Invalid JSON")
+
+
+def _parse_csv(records, header: list[str]):
+    # Каждая запись уже целая, csv.reader только разбирает поля и кавычки.
+    # Читатель идет в ногу с циклом: записи-ошибки он пропускает
+    reader = csv.reader(text for _, text in records if not isinstance(text, Exception))
+    for line, text in records:
+        if isinstance(text, Exception):
+            yield line, text
+            continue
+        values = next(reader)
+        if len(values) != len(header):
+            yield line, ValueError(f"Expected {len(header)} columns, got {len(values)}")
+        else:
+            # Пустая ячейка = поле не задано (действует значение по умолчанию)
+            yield line, {key: value for key, value in zip(header, values) if value != ""}
+
+
+def validate_chunk(records, fmt: str, header: list[str] | None = None):
+    """Пачка записей -> (строки для crud.import_tasks, ошибки)"""
+    rows, errors = [], []
+    parsed = _parse_csv(records, header) if fmt == "csv" else _parse_ndjson(records)
+    for line, data in parsed:
+        try:
+            if isinstance(data, Exception):
+                raise data
+            rows.append(schemas.TaskCreate.model_validate(data).model_dump())
+        except (ValueError, ValidationError) as exc:
+            errors.append(_error(line, exc))
+    return rows, errors
+
+
+async def import_stream(stream, fmt: str, load, validate) -> dict:
+    """
+    load(rows) -> id созданных задач (crud.import_tasks в нужном режиме сессии),
+    validate(records, fmt, header) -> validate_chunk, возможно в threadpool
+    """
+    imported, failed, errors = 0, 0, []
+    header = None
+    records = iter_records(stream, fmt)
+    if fmt == "csv":
+        async for line, text in records:
+            if isinstance(text, Exception):
+                # Без заголовка строки не разобрать
+                return {"imported": 0, "failed": 1, "errors": [_error(line, text)]}
+            header = next(csv.reader([text]))
+            break
+    async for chunk in iter_chunks(records, IMPORT_CHUNK_SIZE):
+        rows, chunk_errors = await validate(chunk, fmt, header)
+        imported += len(await load(rows))
+        failed += len(chunk_errors)
+        errors.extend(chunk_errors[: IMPORT_MAX_ERRORS - len(errors)])
+    return {"imported": imported, "failed": failed, "errors": errors}
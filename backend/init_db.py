@@ -1,13 +1,15 @@
 # Это одноразовый скрипт для создания таблиц 
+# (или DB_INIT_SCHEMA=true в .env - таблицы создаются при старте сервера).
+# Существующая база обновляется миграциями (то же, что "alembic upgrade head")
 
-from database import engine, Base
-import models  # noqa: F401
+from database import engine, migrate_schema, settings
 
 print("Подключаемся к PostgreSQL...")
 print("Создаем таблицы (если их еще нет)...")
 
 try:
-    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        migrate_schema(conn, settings.TASK_PARTITIONS)
     
     print("Готово! Таблицы успешно созданы в PostgreSQL.")
     
@@ -0,0 +1,347 @@
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import crud
+import models
+from database import get_async_session_factory, get_session_factory, get_settings
+
+logger = logging.getLogger(__name__)
+
+#
+# Фоновые задания: долгая или побочная работа (архив, напоминания, ...)
+# выполняется не в обработчике запроса, а воркерами.
+#
+# Очередь - таблица jobs в той же БД (models.Job): задание переживает
+# перезапуск и видно всем процессам. Воркеры - задачи asyncio внутри
+# процесса приложения (JOBS_WORKERS на процесс, запускаются в lifespan).
+#   - воркер забирает пачку до JOBS_BATCH_SIZE готовых заданий одним
+#     UPDATE ... RETURNING; в PostgreSQL - FOR UPDATE SKIP LOCKED, так
+#     что воркеры разных процессов не берут одно задание дважды;
+#   - взятое задание "арендовано" на JOBS_LEASE_SECONDS: если процесс упал,
+#     после этого срока его возьмет другой воркер;
+#   - успех - строка удаляется; ошибка - повтор через
+#     JOBS_RETRY_BASE_SECONDS * 2^(попытка - 1) (не больше JOBS_RETRY_MAX_SECONDS),
+#     после max_attempts попыток - статус FAILED с текстом ошибки.
+#
+# Обработчик - пара функций (sync, async) как в crud.py: fn(db, **payload).
+# Каждое задание выполняется в своей сессии, в режиме БД приложения (DB_ASYNC).
+#
+
+HANDLERS: dict[str, tuple] = {}
+
+def register(kind: str, sync_fn, async_fn) -> None:
+    HANDLERS[kind] = (sync_fn, async_fn)
+
+# Встроенные задания
+ARCHIVE_JOB = "archive_done_tasks"
+register(ARCHIVE_JOB, crud.archive_done_tasks, crud.archive_done_tasks_async)
+PRUNE_CHANGES_JOB = "prune_task_changes"
+register(PRUNE_CHANGES_JOB, crud.prune_changes, crud.prune_changes_async)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def retry_delay(attempts: int, base: float, cap: float) -> float:
+    """Пауза перед следующей попыткой после attempts неудачных"""
+    return min(cap, base * 2 ** (attempts - 1))
+
+#
+# Операции с очередью: общие запросы _..._stmt и два варианта выполнения
+#
+def _enqueue_stmt(db: Session | AsyncSession, kind: str, payload: dict, run_at: datetime,
+                  key: str | None, max_attempts: int):
+    values = {
+        "kind": kind, "payload": payload, "key": key, "status": models.JobStatus.QUEUED,
+        "attempts": 0, "max_attempts": max_attempts, "run_at": run_at,
+    }
+    if key is None:
+        return insert(models.Job).values(**values).returning(models.Job.id)
+    # Задание с тем же ключом уже в очереди - второе не добавляем
+    dialect = db.get_bind().dialect.name
+    stmt = (postgresql.insert if dialect == "postgresql" else sqlite.insert)(models.Job)
+    return (
+        stmt.values(**values)
+        .on_conflict_do_nothing(index_elements=[models.Job.key])
+        .returning(models.Job.id)
+    )
+
+def _enqueue_args(kind: str, payload: dict | None, delay: float, max_attempts: int | None) -> dict:
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind '{kind}'")
+    return {
+        "kind": kind, "payload": payload or {}, "run_at": _now() + timedelta(seconds=delay),
+        "max_attempts": max_attempts or get_settings().JOBS_MAX_ATTEMPTS,
+    }
+
+def enqueue(db: Session, kind: str, payload: dict | None = None, *, delay: float = 0,
+            key: str | None = None, max_attempts: int | None = None) -> int | None:
+    """id нового задания; None - задание с таким key уже в очереди"""
+    args = _enqueue_args(kind, payload, delay, max_attempts)
+    job_id = db.scalar(_enqueue_stmt(db, key=key, **args))
+    db.commit()
+    return job_id
+
+async def enqueue_async(db: AsyncSession, kind: str, payload: dict | None = None, *,
+                        delay: float = 0, key: str | None = None,
+                        max_attempts: int | None = None) -> int | None:
+    args = _enqueue_args(kind, payload, delay, max_attempts)
+    job_id = await db.scalar(_enqueue_stmt(db, key=key, **args))
+    await db.commit()
+    return job_id
+
+def _claim_stmt(limit: int, lease_seconds: float):
+    Job = models.Job
+    now = _now()
+    ready = or_(
+        and_(Job.status == models.JobStatus.QUEUED, Job.run_at <= now),
+        # Воркер взял задание и пропал: аренда истекла - задание снова свободно
+        and_(Job.status == models.JobStatus.RUNNING, Job.locked_until < now),
+    )
+    # SKIP LOCKED: строки, которые прямо сейчас забирает другой воркер,
+    # пропускаются, а не ждут его commit(). SQLite FOR UPDATE не рендерит -
+    # там запись и так одна на всю БД
+    ready_ids = (
+        select(Job.id).where(ready).order_by(Job.run_at, Job.id).limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    return (
+        update(Job)
+        .where(Job.id.in_(ready_ids.scalar_subquery()))
+        .values(status=models.JobStatus.RUNNING, attempts=Job.attempts + 1,
+                locked_until=now + timedelta(seconds=lease_seconds))
+        .returning(Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts)
+        .execution_options(synchronize_session=False)
+    )
+
+def claim(db: Session, limit: int, lease_seconds: float) -> list:
+    jobs = db.execute(_claim_stmt(limit, lease_seconds)).all()
+    db.commit()
+    return sorted(jobs, key=lambda job: job.id)
+
+async def claim_async(db: AsyncSession, limit: int, lease_seconds: float) -> list:
+    jobs = (await db.execute(_claim_stmt(limit, lease_seconds))).all()
+    await db.commit()
+    return sorted(jobs, key=lambda job: job.id)
+
+# Условие "задание все еще наше": если аренда истекла и его взял другой
+# воркер, attempts уже другое - чужую попытку не трогаем
+def _claimed(job):
+    return and_(models.Job.id == job.id, models.Job.attempts == job.attempts)
+
+def _complete_stmt(job):
+    return delete(models.Job).where(_claimed(job)).execution_options(synchronize_session=False)
+
+def complete(db: Session, job) -> None:
+    db.execute(_complete_stmt(job))
+    db.commit()
+
+async def complete_async(db: AsyncSession, job) -> None:
+    await db.execute(_complete_stmt(job))
+    await db.commit()
+
+def _fail_stmt(job, error: str, retry_base: float, retry_max: float, permanent: bool):
+    values = {"locked_until": None, "last_error": error[:2000]}
+    if permanent or job.attempts >= job.max_attempts:
+        # Ключ освобождаем: периодическое задание сможет встать в очередь снова
+        values.update(status=models.JobStatus.FAILED, key=None)
+    else:
+        delay = retry_delay(job.attempts, retry_base, retry_max)
+        values.update(status=models.JobStatus.QUEUED, run_at=_now() + timedelta(seconds=delay))
+    return (
+        update(models.Job).where(_claimed(job)).values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+def fail(db: Session, job, error: str, retry_base: float, retry_max: float,
+         permanent: bool = False) -> None:
+    db.execute(_fail_stmt(job, error, retry_base, retry_max, permanent))
+    db.commit()
+
+async def fail_async(db: AsyncSession, job, error: str, retry_base: float, retry_max: float,
+                     permanent: bool = False) -> None:
+    await db.execute(_fail_stmt(job, error, retry_base, retry_max, permanent))
+    await db.commit()
+
+def _queue_stats_stmt():
+    return select(models.Job.status, func.count()).group_by(models.Job.status)
+
+def _queue_stats_result(rows) -> dict[str, int]:
+    counts = {status.value: 0 for status in models.JobStatus}
+    counts.update({status.value: count for status, count in rows})
+    return counts
+
+def queue_stats(db: Session) -> dict[str, int]:
+    return _queue_stats_result(db.execute(_queue_stats_stmt()).all())
+
+async def queue_stats_async(db: AsyncSession) -> dict[str, int]:
+    return _queue_stats_result((await db.execute(_queue_stats_stmt())).all())
+
+
+#
+# Пул воркеров в процессе приложения.
+# get_session_factory вызывается при первом обращении к БД: создание пула
+# (при импорте) не открывает соединений
+#
+class JobWorkerPool:
+    def __init__(self, get_session_factory, is_async: bool, workers: int = 1, batch_size: int = 10,
+                 poll_seconds: float = 1, lease_seconds: float = 300,
+                 retry_base: float = 10, retry_max: float = 3600):
+        self.get_session_factory = get_session_factory
+        self.is_async = is_async
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        # Периодические задания: (kind, payload, интервал)
+        self.schedule: list[tuple[str, dict, float]] = []
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup: asyncio.Event | None = None
+        self._stats = {"succeeded": 0, "retried": 0, "failed": 0}
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def stats(self) -> dict[str, int]:
+        return dict(self._stats)
+
+    def every(self, kind: str, seconds: float, payload: dict | None = None) -> None:
+        self.schedule.append((kind, payload or {}, seconds))
+
+    async def _call(self, sync_fn, async_fn, *args, **kwargs):
+        # Как main.run_crud: async-вариант на event loop, синхронный - в потоке.
+        # Своя сессия на каждый вызов: задания не делят транзакции
+        if self.is_async:
+            async with self.get_session_factory()() as db:
+                return await async_fn(db, *args, **kwargs)
+
+        def call():
+            with self.get_session_factory()() as db:
+                return sync_fn(db, *args, **kwargs)
+
+        return await asyncio.to_thread(call)
+
+    async def enqueue(self, kind: str, payload: dict | None = None, **options) -> int | None:
+        job_id = await self._call(enqueue, enqueue_async, kind, payload, **options)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    async def queue_stats(self) -> dict[str, int]:
+        return await self._call(queue_stats, queue_stats_async)
+
+    async def _execute(self, job) -> None:
+        handler = HANDLERS.get(job.kind)
+        try:
+            if handler is None:
+                raise LookupError(f"Unknown job kind '{job.kind}'")
+            await self._call(*handler, **job.payload)
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+            final = handler is None or job.attempts >= job.max_attempts
+            logger.warning("Job %s (%s) attempt %s failed: %s", job.id, job.kind, job.attempts, error)
+            await self._call(fail, fail_async, job, error, self.retry_base, self.retry_max,
+                             permanent=handler is None)
+            self._stats["failed" if final else "retried"] += 1
+            return
+        await self._call(complete, complete_async, job)
+        self._stats["succeeded"] += 1
+
+    async def run_once(self) -> int:
+        """Забрать и выполнить одну пачку заданий; возвращает ее размер"""
+        jobs = await self._call(claim, claim_async, self.batch_size, self.lease_seconds)
+        for job in jobs:
+            await self._execute(job)
+        return len(jobs)
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                if await self.run_once():
+                    continue
+            except Exception:
+                # БД недоступна и т.п. - воркер не умирает, а пробует позже
+                logger.exception("Job worker failed to poll the queue")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _scheduler(self, kind: str, payload: dict, seconds: float) -> None:
+        # key=kind: сколько бы процессов ни планировали задание,
+        # в очереди оно будет одно
+        while True:
+            try:
+                await self.enqueue(kind, payload, key=kind)
+            except Exception:
+                logger.exception("Failed to schedule job %s", kind)
+            await asyncio.sleep(seconds)
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks += [
+            asyncio.create_task(self._scheduler(kind, payload, seconds))
+            for kind, payload, seconds in self.schedule
+        ]
+
+    async def stop(self) -> None:
+        # Прерванное задание не потеряется: по истечении аренды его возьмут снова
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._wakeup = None
+
+
+def build_pool(settings) -> JobWorkerPool:
+    get_factory = get_async_session_factory if settings.DB_ASYNC else get_session_factory
+    pool = JobWorkerPool(
+        get_factory, settings.DB_ASYNC,
+        workers=settings.JOBS_WORKERS,
+        batch_size=settings.JOBS_BATCH_SIZE,
+        poll_seconds=settings.JOBS_POLL_SECONDS,
+        lease_seconds=settings.JOBS_LEASE_SECONDS,
+        retry_base=settings.JOBS_RETRY_BASE_SECONDS,
+        retry_max=settings.JOBS_RETRY_MAX_SECONDS,
+    )
+    if settings.ARCHIVE_DONE_AFTER_DAYS > 0:
+        pool.every(ARCHIVE_JOB, settings.ARCHIVE_INTERVAL_SECONDS, {
+            "older_than_days": settings.ARCHIVE_DONE_AFTER_DAYS,
+            "batch_size": settings.ARCHIVE_BATCH_SIZE,
+        })
+    if settings.CHANGES_RETENTION_DAYS > 0:
+        pool.every(PRUNE_CHANGES_JOB, settings.CHANGES_PRUNE_INTERVAL_SECONDS, {
+            "older_than_days": settings.CHANGES_RETENTION_DAYS,
+            "batch_size": settings.CHANGES_PRUNE_BATCH_SIZE,
+        })
+    return pool
+
+
+# Пул создается при первом обращении (jobs.pool)
+_lock = threading.Lock()
+
+def get_pool() -> JobWorkerPool:
+    global pool
+    with _lock:
+        if "pool" not in globals():
+            pool = build_pool(get_settings())
+    return pool
+
+def __getattr__(name: str):
+    if name == "pool":
+        return get_pool()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
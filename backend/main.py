@@ -1,14 +1,58 @@
-from fastapi import FastAPI, Depends, HTTPException
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Body, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List 
+from typing import Annotated, List, Literal
 
 from fastapi.middleware.cors import CORSMiddleware
 
 import schemas
+import auth
 import crud
-from database import SessionLocal
+import database
+import cache
+from cache import params_digest, task_reads
+import events
+from events import sse_stream
+import export
+import idempotency
+import importer
+import jobs
+import metrics
 
-app = FastAPI() 
+#
+# Старт и остановка приложения.
+# Импорт модулей не подключается к БД (см. database.py) - движок создается
+# здесь или при первом запросе. Прогрев пула идет в фоне: сервер начинает
+# принимать запросы сразу, а соединения к этому времени уже открываются.
+# Воркеры фоновых заданий (jobs.py) работают, пока работает приложение
+#
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings = database.settings
+    get_engine = database.get_async_engine if settings.DB_ASYNC else database.get_engine
+    if settings.DB_INIT_SCHEMA:
+        await database.init_schema(get_engine())
+    warmup = None
+    if settings.DB_WARMUP_CONNECTIONS > 0:
+        connections = min(settings.DB_WARMUP_CONNECTIONS, settings.DB_POOL_SIZE)
+        warmup = asyncio.create_task(database.warm_up(get_engine(), connections))
+    if settings.JOBS_WORKERS > 0:
+        await jobs.pool.start()
+    yield
+    if warmup is not None:
+        warmup.cancel()
+    await jobs.pool.stop()
+    await events.close_broker()
+    await database.dispose_engines()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:5173",                       # Для локальної розробки
@@ -22,53 +66,553 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],    # <-- Разрешить все методы (GET, POST, PUT, DELETE)
     allow_headers=["*"],    # <-- Разрешить все заголовки
+    expose_headers=["X-Next-Cursor", "X-Next-Skip", "ETag"],  # <-- Чтобы браузер видел курсор и ETag
+)
+
+# Метрики запросов (задержка, время в БД, число SQL) - см. GET /metrics
+app.add_middleware(
+    metrics.MetricsMiddleware,
+    query_threshold=lambda: database.settings.DB_QUERY_WARN_THRESHOLD,
+    skip_paths=("/metrics",),
+    # SSE - не запрос, а подписка: своя метрика длительности
+    stream_paths=("/tasks/stream",),
 )
 
+# Сессия БД: синхронная или асинхронная - в зависимости от режима
+DbSession = Session | AsyncSession
+
 #
 # "Зависимость" (Dependency)
+# Режим выбирается в Settings (DB_ASYNC):
+#   - async: AsyncSession на async-движке, запросы не занимают потоки
+#   - sync:  обычная Session, CRUD выполняется в threadpool (как раньше)
+# Фабрика сессий - отдельная зависимость: из нее же берут свою сессию
+# операции, которые не должны зависеть от сессии одного запроса
+#
+def get_session_factory():
+    if database.settings.DB_ASYNC:
+        return database.get_async_session_factory()
+    return database.get_session_factory()
+
+async def get_db(session_factory=Depends(get_session_factory)):
+    db = session_factory()
+    if isinstance(db, AsyncSession):
+        async with db:
+            yield db
+    else:
+        try:
+            yield db
+        finally:
+            await run_in_threadpool(db.close)
+
+#
+# Владелец задач (tenant).
+# AUTH_MODE=single - все запросы работают с задачами DEFAULT_OWNER_ID, заголовки не нужны.
+# AUTH_MODE=token - только из подписанного токена (auth.py):
+# Authorization: Bearer <token>. Нет токена или он не проходит проверку - 401
+#
+async def get_owner_id(authorization: str | None = Header(None)) -> int:
+    settings = database.settings
+    if settings.AUTH_MODE == "single":
+        return settings.DEFAULT_OWNER_ID
+    try:
+        return auth.bearer_owner_id(authorization)
+    except auth.InvalidToken:
+        raise HTTPException(
+            status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"}
+        )
+
+OwnerId = Annotated[int, Depends(get_owner_id)]
+
+#
+# Вызов CRUD в режиме сессии: async-вариант ждем на event loop,
+# синхронный отправляем в threadpool, чтобы не блокировать цикл
+#
+async def run_crud(db: DbSession, sync_fn, async_fn, **kwargs):
+    if isinstance(db, AsyncSession):
+        return await async_fn(db=db, **kwargs)
+    return await run_in_threadpool(sync_fn, db=db, **kwargs)
+
+# То же, но в собственной сессии, которая закрывается сразу после вызова
+async def run_crud_in_session(session_factory, sync_fn, async_fn, **kwargs):
+    db = session_factory()
+    if isinstance(db, AsyncSession):
+        async with db:
+            return await async_fn(db=db, **kwargs)
+
+    def call():
+        with db:
+            return sync_fn(db=db, **kwargs)
+
+    return await run_in_threadpool(call)
+
+#
+# ETag и условные запросы.
+# Задача:  "<id>.<version>" - version растет при каждом обновлении строки.
+# Список:  "tasks.<версия таблицы>.<отпечаток параметров>".
+# If-None-Match совпал -> 304 без тела (и без сериализации).
+# If-Match на PUT -> обновление только если задачу никто не изменил (иначе 412).
+#
+def task_etag(db_task) -> str:
+    return f'"{db_task.id}.{db_task.version}"'
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    # Для If-None-Match сравнение "слабое": W/"x" == "x"
+    candidates = [c.strip().removeprefix("W/") for c in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+def if_match_version(header: str | None, task_id: int) -> int | None:
+    """Версия из If-Match для задачи task_id; None - условия нет"""
+    if header is None or header.strip() == "*":
+        return None
+    for candidate in header.split(","):
+        etag_id, _, version = candidate.strip().strip('"').partition(".")
+        if etag_id == str(task_id) and version.isdigit():
+            return int(version)
+    raise HTTPException(status_code=412, detail="Precondition failed")
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+def task_response(db_task) -> Response:
+    body = schemas.Task.model_validate(db_task).model_dump_json()
+    return Response(content=body, media_type="application/json", headers={"ETag": task_etag(db_task)})
+
 #
-def get_db():
-    db = SessionLocal()
+# Идемпотентные записи: повтор запроса с тем же Idempotency-Key получает
+# сохраненный ответ, а handler (и CRUD) не выполняется второй раз.
+# handler возвращает готовый Response - он и сохраняется (см. idempotency.py)
+#
+IdempotencyKey = Annotated[str | None, Header(min_length=1, max_length=255)]
+
+async def idempotent(request: Request, owner_id: int, key: str | None, payload: str,
+                     handler) -> Response:
+    if key is None or idempotency.store is None:
+        return await handler()
+    fingerprint = idempotency.request_fingerprint(request.method, request.url.path, payload)
     try:
-        yield db
-    finally:
-        db.close()
+        return await idempotency.store.run(owner_id, key, fingerprint, handler)
+    except idempotency.IdempotencyMismatch:
+        raise HTTPException(
+            status_code=422, detail="Idempotency-Key was already used for a different request"
+        )
+    except idempotency.IdempotencyInProgress:
+        raise HTTPException(
+            status_code=409, detail="A request with this Idempotency-Key is in progress",
+            headers={"Retry-After": "1"},
+        )
 
 # --- 1. Эндпоинт для СОЗДАНИЯ ЗАДАЧИ ---
+# С заголовком Idempotency-Key повтор (ретрай клиента) не создаст дубликат
 @app.post("/tasks/", response_model=schemas.Task)
-def api_create_task(task: schemas.TaskCreate, db: Session = Depends(get_db)):
-    return crud.create_task(db=db, task=task)
+async def api_create_task(
+    task: schemas.TaskCreate,
+    request: Request,
+    owner_id: OwnerId,
+    idempotency_key: IdempotencyKey = None,
+    db: DbSession = Depends(get_db),
+):
+    async def create():
+        db_task = await run_crud(
+            db, crud.create_task, crud.create_task_async, owner_id=owner_id, task=task
+        )
+        return task_response(db_task)
+
+    return await idempotent(request, owner_id, idempotency_key, task.model_dump_json(), create)
 
 # --- 2. Эндпоинт для ПОЛУЧЕНИЯ СПИСКА ЗАДАЧ ---
+# Старые клиенты продолжают работать через skip/limit.
+# Новые передают cursor из заголовка X-Next-Cursor предыдущего ответа.
+# Фильтры (status, даты, title_prefix) и сортировка выполняются в БД.
+SortOrder = Literal["id", "-id", "created_at", "-created_at", "updated_at", "-updated_at"]
+
 @app.get("/tasks/", response_model=List[schemas.Task]) 
-def api_read_tasks(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    tasks = crud.get_tasks(db=db, skip=skip, limit=limit)
-    return tasks
+async def api_read_tasks(
+    owner_id: OwnerId,
+    filters: schemas.TaskFilter = Depends(),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    sort: SortOrder = "id",
+    if_none_match: str | None = Header(None),
+    db: DbSession = Depends(get_db),
+):
+    if cursor and skip:
+        raise HTTPException(status_code=400, detail="Use either skip or cursor, not both")
+
+    # Кэш: значение = "<etag>\n<next_cursor>\n<JSON-тело>" (ни ETag, ни курсор не содержат \n)
+    digest = params_digest(
+        skip=skip, limit=limit, cursor=cursor, sort=sort, filters=filters.model_dump()
+    )
+    cache_key = cache.task_cache.list_key(owner_id, digest)
+    cached = cache.task_cache.get_list(cache_key)
+    if cached is not None:
+        etag, next_cursor, body = cached.split("\n", 2)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+    else:
+        # Версию таблицы читаем ДО списка (см. crud.get_tasks_version)
+        version = await run_crud(
+            db, crud.get_tasks_version, crud.get_tasks_version_async, owner_id=owner_id
+        )
+        etag = f'"tasks.{version}.{digest}"'
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        try:
+            # Быстрый путь: кортежи колонок -> orjson, без ORM-объектов и моделей
+            rows, next_cursor = await run_crud(
+                db, crud.get_task_rows_page, crud.get_task_rows_page_async,
+                owner_id=owner_id, limit=limit, cursor=cursor, sort=sort, skip=skip,
+                filters=filters,
+            )
+        except crud.InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        next_cursor = next_cursor or ""
+        body = schemas.dump_task_rows(rows).decode()
+        cache.task_cache.set_list(cache_key, f"{etag}\n{next_cursor}\n{body}")
+
+    response = Response(content=body, media_type="application/json", headers={"ETag": etag})
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+# --- Лента изменений для инкрементальной синхронизации ---
+# Клиент хранит next_since и запрашивает только то, что изменилось после него
+# (пока has_more=true, продолжаем с next_since).
+# Первая синхронизация - since=0, а слишком старый токен (журнал уже очищен)
+# тоже получает снимок: reset=true, страницы - по cursor, затем next_since
+@app.get("/tasks/changes", response_model=schemas.TaskChanges)
+async def api_read_changes(
+    owner_id: OwnerId,
+    since: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=10_000),
+    cursor: str | None = None,
+    db: DbSession = Depends(get_db),
+):
+    try:
+        return await run_crud(
+            db, crud.get_changes, crud.get_changes_async,
+            owner_id=owner_id, since=since, limit=limit, cursor=cursor,
+        )
+    except crud.InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# --- Push-уведомления об изменениях (Server-Sent Events) ---
+# События: created/updated (с задачей) и deleted (только id).
+# Получив "resync" (клиент не успевал читать), клиент догоняет
+# изменения через GET /tasks/changes и переподключается.
+# Клиент получает события только своего владельца
+@app.get("/tasks/stream")
+async def api_stream_tasks(owner_id: OwnerId):
+    return StreamingResponse(
+        sse_stream(events.broker, database.settings.SSE_HEARTBEAT_SECONDS, owner_id),
+        media_type="text/event-stream",
+        # no-cache и X-Accel-Buffering: прокси не должен буферизовать поток
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# --- Потоковый экспорт всех задач (NDJSON или CSV) ---
+# Сессия из get_db живет до конца ответа: FastAPI закрывает
+# yield-зависимости только после отправки всего потока
+@app.get("/tasks/export")
+async def api_export_tasks(
+    owner_id: OwnerId,
+    filters: schemas.TaskFilter = Depends(),
+    format: Literal["ndjson", "csv"] = "ndjson",
+    db: DbSession = Depends(get_db),
+):
+    media_type, extension, _ = export.FORMATS[format]
+    if isinstance(db, AsyncSession):
+        body = export.stream_export_async(db, owner_id, format, filters)
+    else:
+        body = export.stream_export(db, owner_id, format, filters)
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="tasks.{extension}"'},
+    )
+
+# --- Потоковый импорт (NDJSON или CSV с заголовком) ---
+# Тело читается по кускам, строки проверяются и загружаются пачками
+# (каждая пачка - своя транзакция). Ошибочные строки не прерывают импорт,
+# а попадают в отчет с номером строки. Строка длиннее IMPORT_MAX_LINE_BYTES
+# прерывает импорт с 413 (загруженные до нее пачки остаются)
+@app.post("/tasks/import", response_model=schemas.ImportResult)
+async def api_import_tasks(
+    owner_id: OwnerId,
+    request: Request,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    db: DbSession = Depends(get_db),
+):
+    async def load(rows):
+        return await run_crud(
+            db, crud.import_tasks, crud.import_tasks_async, owner_id=owner_id, rows=rows
+        )
+
+    async def validate(records, fmt, header):
+        # Проверка пачки - чистый CPU, не держим им event loop
+        return await run_in_threadpool(importer.validate_chunk, records, fmt, header)
+
+    try:
+        return await importer.import_stream(request.stream(), format, load, validate)
+    except importer.RecordTooLarge as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
+
+# --- Сводка по доске: задачи по статусам и активность за 24 часа / 7 дней ---
+# Читает материализованные счетчики - время ответа не зависит от числа задач
+@app.get("/tasks/summary", response_model=schemas.TaskSummary)
+async def api_read_summary(owner_id: OwnerId, db: DbSession = Depends(get_db)):
+    return await run_crud(db, crud.get_summary, crud.get_summary_async, owner_id=owner_id)
+
+# Сверка счетчиков с таблицей и их пересчет (после миграции, сбоев
+# или ручных правок в БД). consistent=false - счетчики расходились
+@app.post("/tasks/summary/rebuild", response_model=schemas.SummaryRebuild)
+async def api_rebuild_summary(owner_id: OwnerId, db: DbSession = Depends(get_db)):
+    return await run_crud(
+        db, crud.rebuild_summary, crud.rebuild_summary_async, owner_id=owner_id
+    )
+
+# --- Полнотекстовый поиск по названию и описанию ---
+# Результаты упорядочены по релевантности. Следующая страница - skip из
+# заголовка X-Next-Skip. fuzzy=true находит и опечатки в названии
+# (PostgreSQL, pg_trgm) или слова по началу (SQLite)
+@app.get("/tasks/search", response_model=List[schemas.Task])
+async def api_search_tasks(
+    owner_id: OwnerId,
+    q: str = Query(min_length=1, max_length=200),
+    filters: schemas.TaskFilter = Depends(),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    fuzzy: bool = False,
+    db: DbSession = Depends(get_db),
+):
+    rows, next_skip = await run_crud(
+        db, crud.search_tasks, crud.search_tasks_async, owner_id=owner_id,
+        q=q, limit=limit, skip=skip, fuzzy=fuzzy, filters=filters,
+    )
+    response = Response(content=schemas.dump_task_rows(rows), media_type="application/json")
+    if next_skip is not None:
+        response.headers["X-Next-Skip"] = str(next_skip)
+    return response
+
+# --- Массовые операции (bulk) ---
+# Объявлены ДО /tasks/{task_id}, иначе "bulk" попадет в task_id.
+# Весь пакет выполняется в одной транзакции, ответ - результат по каждому элементу.
+BulkBody = Body(min_length=1, max_length=schemas.BULK_MAX_ITEMS)
+
+@app.post("/tasks/bulk", response_model=List[schemas.BulkItemResult])
+async def api_create_tasks_bulk(
+    tasks: Annotated[List[schemas.TaskCreate], BulkBody],
+    request: Request,
+    owner_id: OwnerId,
+    idempotency_key: IdempotencyKey = None,
+    db: DbSession = Depends(get_db),
+):
+    async def create():
+        db_tasks = await run_crud(
+            db, crud.create_tasks, crud.create_tasks_async, owner_id=owner_id, tasks=tasks
+        )
+        results = [
+            schemas.BulkItemResult(index=i, id=db_task.id, status="created", task=db_task)
+            for i, db_task in enumerate(db_tasks)
+        ]
+        return Response(content=schemas.BulkItemResultList.dump_json(results), media_type="application/json")
+
+    payload = "\n".join(task.model_dump_json() for task in tasks)
+    return await idempotent(request, owner_id, idempotency_key, payload, create)
+
+@app.patch("/tasks/bulk", response_model=List[schemas.BulkItemResult])
+async def api_update_tasks_bulk(
+    items: Annotated[List[schemas.TaskBulkUpdate], BulkBody],
+    owner_id: OwnerId,
+    db: DbSession = Depends(get_db),
+):
+    updated = await run_crud(
+        db, crud.update_tasks, crud.update_tasks_async, owner_id=owner_id, items=items
+    )
+    return [
+        schemas.BulkItemResult(
+            index=i, id=item.id, task=updated.get(item.id),
+            status="updated" if item.id in updated else "not_found",
+        )
+        for i, item in enumerate(items)
+    ]
+
+@app.delete("/tasks/bulk", response_model=List[schemas.BulkItemResult])
+async def api_delete_tasks_bulk(
+    body: schemas.TaskBulkDelete, owner_id: OwnerId, db: DbSession = Depends(get_db)
+):
+    deleted = await run_crud(
+        db, crud.delete_tasks, crud.delete_tasks_async, owner_id=owner_id, task_ids=body.ids
+    )
+    results = []
+    for i, task_id in enumerate(body.ids):
+        # Повторный id в том же пакете уже нечего удалять
+        db_task = deleted.pop(task_id, None)
+        results.append(schemas.BulkItemResult(
+            index=i, id=task_id, task=db_task,
+            status="deleted" if db_task is not None else "not_found",
+        ))
+    return results
 
 # --- 3. Эндпоинт для ПОЛУЧЕНИЯ ОДНОЙ ЗАДАЧИ ---
 @app.get("/tasks/{task_id}", response_model=schemas.Task)
-def api_read_task(task_id: int, db: Session = Depends(get_db)):
-    db_task = crud.get_task(db=db, task_id=task_id)
-    if db_task is None:
-        raise HTTPException(status_code=404, detail="Task not found")
-    return db_task
+async def api_read_task(
+    task_id: int,
+    owner_id: OwnerId,
+    if_none_match: str | None = Header(None),
+    session_factory=Depends(get_session_factory),
+):
+    # Попадание в кэш отдается без запроса в БД и без сериализации.
+    # Кэш: значение = "<etag>\n<JSON-тело>"
+    cached = cache.task_cache.get_task(owner_id, task_id)
+    if cached is None:
+        # Поколение задачи - ДО запроса в БД: если запись успеет закоммититься
+        # раньше, чем мы положим ответ, старое тело в кэш не попадет
+        token = cache.task_cache.task_token(owner_id, task_id)
+
+        # Промах: одновременные запросы этой задачи ждут один запрос в БД
+        # (single-flight) и получают одно и то же уже сериализованное тело.
+        # Сессия своя: запрос, начавший чтение, может уйти и закрыть свою,
+        # а результат ждут и остальные
+        async def load():
+            db_task = await run_crud_in_session(
+                session_factory, crud.get_task, crud.get_task_async,
+                owner_id=owner_id, task_id=task_id,
+            )
+            if db_task is None:
+                return None
+            value = f"{task_etag(db_task)}\n{schemas.Task.model_validate(db_task).model_dump_json()}"
+            cache.task_cache.set_task(owner_id, task_id, value, token)
+            return value
+
+        # Поколение в ключе: запрос, пришедший после записи, не присоединится
+        # к чтению, начатому до нее
+        cached = await task_reads.do((owner_id, task_id, token), load)
+        if cached is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+
+    etag, body = cached.split("\n", 1)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 # --- 4. Эндпоинт для ОБНОВЛЕНИЯ ЗАДАЧИ ---
+# С заголовком If-Match: "<id>.<version>" обновление выполнится, только если
+# задача не менялась с момента чтения; иначе 412 Precondition Failed
 @app.put("/tasks/{task_id}", response_model=schemas.Task)
-def api_update_task(task_id: int, task: schemas.TaskUpdate, db: Session = Depends(get_db)):
-    db_task = crud.update_task(db=db, task_id=task_id, task=task)
-    if db_task is None:
-        raise HTTPException(status_code=404, detail="Task not found")
-    return db_task
+async def api_update_task(
+    task_id: int,
+    task: schemas.TaskUpdate,
+    request: Request,
+    owner_id: OwnerId,
+    if_match: str | None = Header(None),
+    idempotency_key: IdempotencyKey = None,
+    db: DbSession = Depends(get_db),
+):
+    expected_version = if_match_version(if_match, task_id)
+
+    async def update():
+        db_task = await run_crud(
+            db, crud.update_task, crud.update_task_async, owner_id=owner_id,
+            task_id=task_id, task=task, expected_version=expected_version,
+        )
+        if db_task is None:
+            # Строка есть, но версия другая -> 412; строки нет -> 404
+            if expected_version is not None and await run_crud(
+                db, crud.get_task, crud.get_task_async, owner_id=owner_id, task_id=task_id
+            ) is not None:
+                raise HTTPException(status_code=412, detail="Task was modified")
+            raise HTTPException(status_code=404, detail="Task not found")
+        return task_response(db_task)
+
+    # If-Match - часть запроса: повтор с другим условием - другой запрос
+    payload = f"{if_match}\n{task.model_dump_json(exclude_unset=True)}"
+    return await idempotent(request, owner_id, idempotency_key, payload, update)
 
 # --- 5. Эндпоинт для УДАЛЕНИЯ ЗАДАЧИ ---
 @app.delete("/tasks/{task_id}", response_model=schemas.Task)
-def api_delete_task(task_id: int, db: Session = Depends(get_db)):
-    db_task = crud.delete_task(db=db, task_id=task_id)
+async def api_delete_task(task_id: int, owner_id: OwnerId, db: DbSession = Depends(get_db)):
+    db_task = await run_crud(
+        db, crud.delete_task, crud.delete_task_async, owner_id=owner_id, task_id=task_id
+    )
     if db_task is None:
         raise HTTPException(status_code=404, detail="Task not found")
     return db_task
 
+# --- Проверка БД и пула соединений ---
+# Стан пула снимаем ДО пинга: пинг сам берет соединение из пула
+@app.get("/health/db")
+async def api_health_db(db: DbSession = Depends(get_db)):
+    pool = database.pool_status(db.get_bind())
+    try:
+        if isinstance(db, AsyncSession):
+            await db.execute(text("SELECT 1"))
+        else:
+            await run_in_threadpool(db.execute, text("SELECT 1"))
+    except SQLAlchemyError:
+        raise HTTPException(status_code=503, detail="Database unavailable")
+    return {"status": "ok", "pool": pool}
+
+# --- Статистика кэша чтения (попадания/промахи) ---
+@app.get("/health/cache")
+async def api_health_cache():
+    return cache.task_cache.stats()
+
+# --- Подписчики push-уведомлений в этом воркере ---
+@app.get("/health/events")
+async def api_health_events():
+    return {
+        "backend": type(events.broker.backend).__name__,
+        "subscribers": events.broker.subscriber_count,
+    }
+
+# --- Очередь фоновых заданий (по всей БД) и воркеры этого процесса ---
+@app.get("/health/jobs")
+async def api_health_jobs(db: DbSession = Depends(get_db)):
+    return {
+        "queue": await run_crud(db, jobs.queue_stats, jobs.queue_stats_async),
+        "workers": jobs.pool.workers if jobs.pool.running else 0,
+        "processed": jobs.pool.stats(),
+    }
+
+# --- Метрики в текстовом формате Prometheus ---
+metrics.registry.gauge_callback(
+    "task_cache_requests", "Read cache lookups since start",
+    lambda: {key: cache.task_cache.stats()[key] for key in ("hits", "misses")},
+)
+metrics.registry.gauge_callback(
+    "task_read_single_flight", "GET /tasks/{id} database loads and requests coalesced into them",
+    task_reads.stats,
+)
+metrics.registry.gauge_callback(
+    "task_stream_subscribers", "Open /tasks/stream connections in this worker",
+    lambda: events.broker.subscriber_count,
+)
+metrics.registry.gauge_callback(
+    "jobs_processed", "Background jobs finished by this worker process", lambda: jobs.pool.stats(),
+)
+def db_pool_gauge() -> dict:
+    # Только уже созданный движок: сбор метрик не должен открывать пул.
+    # В async-режиме запросы обслуживает async-движок - он последний в списке
+    engines = database.created_engines()
+    if not engines:
+        return {}
+    status = database.pool_status(getattr(engines[-1], "sync_engine", engines[-1]))
+    return {key: value for key, value in status.items() if key != "class"}
+
+metrics.registry.gauge_callback(
+    "db_pool_connections", "Database pool connections", db_pool_gauge,
+)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def api_metrics():
+    return PlainTextResponse(
+        metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
 # --- 6. старый корневой эндпоинт ---
 @app.get("/")
 def read_root():
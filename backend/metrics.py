@@ -0,0 +1,267 @@
+import bisect
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+#
+# Метрики запросов и БД в текстовом формате Prometheus (GET /metrics).
+#
+#   - MetricsMiddleware: задержка по маршрутам, запросы "в полете",
+#     время в БД и число SQL-запросов на один HTTP-запрос;
+#   - instrument_engine: события before/after_cursor_execute движка
+#     (database.py) - время каждого запроса, журнал медленных запросов.
+#
+# Статистика запроса живет в ContextVar: threadpool (синхронный CRUD)
+# и greenlet async-движка получают копию контекста, а в ней - тот же объект.
+#
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# Длительность SSE-подключений: секунды - часы
+STREAM_BUCKETS = (1, 10, 30, 60, 300, 900, 1800, 3600, 4 * 3600, 12 * 3600)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name, self.documentation, self.labels = name, documentation, labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield self.name, _labels(self.labels, label_values), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *label_values, amount: float = 1) -> None:
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (),
+                 buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.documentation, self.labels = name, documentation, labels
+        self.buckets = tuple(buckets)
+        # label_values -> [счетчики по корзинам..., сумма, количество]
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.setdefault(label_values, [0] * (len(self.buckets) + 2))
+            if index < len(self.buckets):
+                data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def count(self, *label_values) -> int:
+        return self._values.get(label_values, [0])[-1]
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(data)) for key, data in self._values.items()]
+        names = (*self.labels, "le")
+        for label_values, data in items:
+            cumulative = 0
+            for bound, hits in zip(self.buckets, data):
+                cumulative += hits
+                yield f"{self.name}_bucket", _labels(names, (*label_values, bound)), cumulative
+            yield f"{self.name}_bucket", _labels(names, (*label_values, "+Inf")), data[-1]
+            yield f"{self.name}_sum", _labels(self.labels, label_values), data[-2]
+            yield f"{self.name}_count", _labels(self.labels, label_values), data[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        # Значения, которые проще вычислить в момент опроса (кэш, пул, подписчики)
+        self._callbacks = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def gauge_callback(self, name: str, documentation: str, fn) -> None:
+        """fn() -> число или {метка: число} (одна метка: name="...")"""
+        self._callbacks.append((name, documentation, fn))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {value:g}" for name, labels, value in metric.samples())
+        for name, documentation, fn in self._callbacks:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} gauge")
+            value = fn()
+            items = value.items() if isinstance(value, dict) else [(None, value)]
+            for label, number in items:
+                labels = _labels(("name",), (label,)) if label is not None else ""
+                lines.append(f"{name}{labels} {number:g}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+))
+http_latency = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route")
+))
+http_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served"
+))
+http_stream_duration = registry.register(Histogram(
+    "http_stream_duration_seconds", "Duration of long-lived streaming connections (SSE)",
+    ("method", "route"), buckets=STREAM_BUCKETS,
+))
+request_db_time = registry.register(Histogram(
+    "http_request_db_seconds", "Time spent in the database per HTTP request", ("method", "route")
+))
+request_db_queries = registry.register(Histogram(
+    "http_request_db_queries", "SQL statements per HTTP request", ("method", "route"),
+    buckets=QUERY_COUNT_BUCKETS,
+))
+db_query_latency = registry.register(Histogram(
+    "db_query_duration_seconds", "SQL statement latency"
+))
+slow_queries = registry.register(Counter(
+    "db_slow_queries_total", "SQL statements slower than the slow-query threshold"
+))
+n_plus_one = registry.register(Counter(
+    "http_request_query_limit_exceeded_total",
+    "Requests that issued more SQL statements than the N+1 threshold", ("method", "route"),
+))
+
+
+#
+# Статистика одного HTTP-запроса
+#
+class RequestStats:
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+_request_stats: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+
+def current_stats() -> RequestStats | None:
+    return _request_stats.get()
+
+
+def instrument_engine(engine, slow_query_ms: float | None = None) -> None:
+    """Подписывает движок на события курсора (для async-движка - его sync_engine)"""
+    engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        db_query_latency.observe(elapsed)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+        if slow_query_ms is not None and elapsed * 1000 >= slow_query_ms:
+            slow_queries.inc()
+            # Только текст SQL: параметры могут содержать пользовательские данные
+            logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, statement)
+
+
+class MetricsMiddleware:
+    """
+    Чистый ASGI-middleware: время считается до конца ответа (и для потоковых
+    тоже), маршрут берется из шаблона пути (/tasks/{task_id}), а не из URL,
+    чтобы число серий не росло с числом задач.
+
+    Долгие потоки (stream_paths, SSE) открыты минутами и часами: в гистограмме
+    задержки они сдвигали бы p99, а в gauge "в полете" висели бы постоянно.
+    Их длительность пишется в отдельную http_stream_duration_seconds
+    """
+
+    # query_threshold - число или функция без аргументов (читается на каждый запрос)
+    def __init__(self, app, query_threshold=0, skip_paths: tuple = (), stream_paths: tuple = ()):
+        self.app = app
+        self.query_threshold = query_threshold
+        self.skip_paths = set(skip_paths)
+        self.stream_paths = set(stream_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            return await self.app(scope, receive, send)
+
+        status = 500
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        streaming = scope["path"] in self.stream_paths
+        if not streaming:
+            http_in_flight.inc()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not streaming:
+                http_in_flight.dec()
+            _request_stats.reset(token)
+            self._record(scope, status, time.perf_counter() - started, stats, streaming)
+
+    def _record(self, scope, status: int, elapsed: float, stats: RequestStats,
+                streaming: bool = False) -> None:
+        route = getattr(scope.get("route"), "path", "unmatched")
+        method = scope["method"]
+        http_requests.inc(method, route, status)
+        (http_stream_duration if streaming else http_latency).observe(elapsed, method, route)
+        request_db_time.observe(stats.db_time, method, route)
+        request_db_queries.observe(stats.queries, method, route)
+        threshold = self.query_threshold() if callable(self.query_threshold) else self.query_threshold
+        if threshold and stats.queries > threshold:
+            n_plus_one.inc(method, route)
+            logger.warning(
+                "%s %s issued %d SQL statements (threshold %d) - possible N+1",
+                method, route, stats.queries, threshold,
+            )
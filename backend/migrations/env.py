@@ -0,0 +1,52 @@
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine
+
+import models  # noqa: F401  (реєструє таблиці в Base)
+from database import Base, get_settings
+
+#
+# Оточення alembic.
+# URL бази - з налаштувань (DATABASE_URL), як і в застосунку.
+# Застосунок (database.migrate_schema) передає готове з'єднання
+# в config.attributes["connection"] - тоді міграції йдуть у його транзакції
+#
+config = context.config
+connection = config.attributes.get("connection")
+
+# Логування налаштовуємо лише для запуску з командного рядка
+if config.config_file_name is not None and connection is None:
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = Base.metadata
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    # FTS5-індекс пошуку SQLite (tasks_fts і його службові таблиці)
+    # створюється DDL-ом, а не моделями
+    return not (type_ == "table" and name.startswith("tasks_fts"))
+
+
+def run_migrations(bind) -> None:
+    # render_as_batch: SQLite не вміє ALTER для обмежень - таблиця перебудовується
+    context.configure(
+        connection=bind, target_metadata=target_metadata,
+        render_as_batch=True, include_object=include_object,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    # Міграції звіряються з наявною схемою (inspect), тож SQL-скрипт без бази не зібрати
+    raise RuntimeError("Offline (--sql) migrations are not supported: run them against the database")
+elif connection is not None:
+    run_migrations(connection)
+else:
+    engine = create_engine(get_settings().DATABASE_URL)
+    try:
+        with engine.connect() as bind:
+            run_migrations(bind)
+    finally:
+        engine.dispose()
@@ -0,0 +1,108 @@
+"""
+Спільне для ревізій.
+
+Бази, створені до alembic (init_db.py / create_all), можуть бути на будь-якому
+етапі розвитку схеми, тому кожен крок ревізії спершу перевіряє поточну схему
+і пропускає вже зроблене - такі бази теж доходять до head.
+Схема читається заново при кожному виклику: попередні кроки могли її змінити.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import sqlite
+
+# Статуси: у tasks зберігаються імена Enum, у task_counters - значення
+STATUSES = {"TODO": "todo", "IN_PROGRESS": "in_progress", "DONE": "done"}
+
+
+def timestamp() -> sa.DateTime:
+    # Як models.Timestamp: рядки, що переносять ревізії, записуються
+    # в SQLite у тому ж форматі, що й застосунком (без мікросекунд)
+    return sa.DateTime(timezone=True).with_variant(
+        sqlite.DATETIME(truncate_microseconds=True), "sqlite"
+    )
+
+
+def status_enum() -> sa.Enum:
+    return sa.Enum(*STATUSES, name="taskstatus", native_enum=False)
+
+
+def status_value_sql(column: str = "status") -> str:
+    """SQL: ім'я статусу (tasks) -> значення (task_counters)"""
+    cases = " ".join(f"WHEN '{name}' THEN '{value}'" for name, value in STATUSES.items())
+    return f"CASE {column} {cases} END"
+
+
+def has_table(name: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def columns(table: str) -> set[str]:
+    return {column["name"] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def indexes(table: str) -> dict[str, list[str]]:
+    """Ім'я індексу -> його колонки"""
+    return {
+        index["name"]: index["column_names"]
+        for index in sa.inspect(op.get_bind()).get_indexes(table)
+    }
+
+
+def create_index(name: str, table: str, index_columns: list[str], **kw) -> None:
+    if name not in indexes(table):
+        op.create_index(name, table, index_columns, **kw)
+
+
+def drop_index(name: str, table: str) -> None:
+    if name in indexes(table):
+        op.drop_index(name, table_name=table)
+
+
+def owner_sql(owner_id: int) -> sa.TextClause:
+    """server_default для колонки owner_id, що додається до наявних рядків"""
+    return sa.text(str(int(owner_id)))
+
+
+#
+# Повнотекстовий пошук у SQLite (ревізія 0007): FTS5-таблиця з external
+# content і тригери на tasks. Перебудова tasks у batch-режимі (ALTER, якого
+# SQLite не вміє) прибирає тригери - ревізія, що її робить, відновлює їх тут
+#
+SQLITE_SEARCH = {
+    "tasks_fts":
+        "CREATE VIRTUAL TABLE tasks_fts USING fts5"
+        "(title, description, content='tasks', content_rowid='id')",
+    "tasks_fts_insert":
+        """CREATE TRIGGER tasks_fts_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO tasks_fts (rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END""",
+    "tasks_fts_delete":
+        """CREATE TRIGGER tasks_fts_delete AFTER DELETE ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+        END""",
+    "tasks_fts_update":
+        """CREATE TRIGGER tasks_fts_update AFTER UPDATE OF title, description ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+            INSERT INTO tasks_fts (rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END""",
+}
+
+
+def ensure_sqlite_search() -> None:
+    """Створює відсутні об'єкти пошуку і збирає індекс з наявного тексту"""
+    existing = set(op.get_bind().execute(sa.text("SELECT name FROM sqlite_master")).scalars())
+    for name, statement in SQLITE_SEARCH.items():
+        if name not in existing:
+            op.execute(statement)
+    op.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+
+
+def drop_sqlite_search() -> None:
+    for name in reversed(SQLITE_SEARCH):
+        if name != "tasks_fts":
+            op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.execute("DROP TABLE IF EXISTS tasks_fts")
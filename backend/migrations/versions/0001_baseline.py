@@ -0,0 +1,37 @@
+"""Початкова схема: таблиця tasks до появи власників і журналу змін
+
+Бази, створені до alembic (init_db.py / create_all), цю таблицю вже мають -
+тоді міграція нічого не робить.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table("tasks"):
+        return
+    op.create_table(
+        "tasks",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("title", sa.String),
+        sa.Column("description", sa.String),
+        sa.Column("status", sa.Enum("TODO", "IN_PROGRESS", "DONE", name="taskstatus", native_enum=False)),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_tasks_id", "tasks", ["id"])
+    op.create_index("ix_tasks_title", "tasks", ["title"])
+    op.create_index("ix_tasks_description", "tasks", ["description"])
+
+
+def downgrade() -> None:
+    op.drop_table("tasks")
@@ -0,0 +1,20 @@
+"""Індекс (updated_at, id) для курсорної пагінації GET /tasks/
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from migrations.helpers import create_index, drop_index
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    create_index("ix_tasks_updated_at_id", "tasks", ["updated_at", "id"])
+
+
+def downgrade() -> None:
+    drop_index("ix_tasks_updated_at_id", "tasks")
@@ -0,0 +1,40 @@
+"""Складені індекси під фільтри й сортування GET /tasks/
+
+Замість ix_tasks_title / ix_tasks_description: описи не індексуємо,
+назви шукає ix_tasks_title_prefix (LIKE 'abc%').
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from migrations.helpers import create_index, drop_index
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    "ix_tasks_status_id": ["status", "id"],
+    "ix_tasks_status_created_at_id": ["status", "created_at", "id"],
+    "ix_tasks_status_updated_at_id": ["status", "updated_at", "id"],
+    "ix_tasks_created_at_id": ["created_at", "id"],
+}
+
+
+def upgrade() -> None:
+    drop_index("ix_tasks_title", "tasks")
+    drop_index("ix_tasks_description", "tasks")
+    for name, index_columns in INDEXES.items():
+        create_index(name, "tasks", index_columns)
+    create_index(
+        "ix_tasks_title_prefix", "tasks", ["title"], postgresql_ops={"title": "text_pattern_ops"}
+    )
+
+
+def downgrade() -> None:
+    drop_index("ix_tasks_title_prefix", "tasks")
+    for name in reversed(INDEXES):
+        drop_index(name, "tasks")
+    create_index("ix_tasks_description", "tasks", ["description"])
+    create_index("ix_tasks_title", "tasks", ["title"])
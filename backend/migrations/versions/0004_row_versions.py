@@ -0,0 +1,33 @@
+"""Версії рядків і таблиці для ETag: tasks.version і table_versions
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import columns, has_table
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if "version" not in columns("tasks"):
+        # Наявні задачі отримують версію 1
+        op.add_column("tasks", sa.Column("version", sa.Integer, nullable=False, server_default="1"))
+    if not has_table("table_versions"):
+        op.create_table(
+            "table_versions",
+            sa.Column("name", sa.String, primary_key=True),
+            sa.Column("version", sa.Integer, nullable=False),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("table_versions")
+    with op.batch_alter_table("tasks") as batch:
+        batch.drop_column("version")
@@ -0,0 +1,33 @@
+"""Журнал змін tasks для GET /tasks/changes?since=
+
+Журнал починається з цієї ревізії: клієнт отримує наявні задачі
+першою синхронізацією (since=0).
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import has_table, timestamp
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if not has_table("task_changes"):
+        op.create_table(
+            "task_changes",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+            sa.Column("task_id", sa.Integer, nullable=False),
+            sa.Column("op", sa.String(16), nullable=False),
+            sa.Column("changed_at", timestamp(), server_default=sa.func.now()),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("task_changes")
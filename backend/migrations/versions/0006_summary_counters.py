@@ -0,0 +1,49 @@
+"""Лічильники для GET /tasks/summary: tasks.previous_status, task_counters, task_activity
+
+Лічильники статусів заповнюються з наявних задач. Почасова активність
+до цієї ревізії не велася - вона починається з нуля.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import columns, has_table, status_enum, status_value_sql, timestamp
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if "previous_status" not in columns("tasks"):
+        op.add_column("tasks", sa.Column("previous_status", status_enum()))
+    if not has_table("task_counters"):
+        op.create_table(
+            "task_counters",
+            sa.Column("status", sa.String(16), primary_key=True),
+            sa.Column("count", sa.Integer, nullable=False),
+        )
+        op.execute(
+            "INSERT INTO task_counters (status, count) "
+            f"SELECT {status_value_sql()}, count(*) FROM tasks "
+            "WHERE status IS NOT NULL GROUP BY status"
+        )
+    if not has_table("task_activity"):
+        op.create_table(
+            "task_activity",
+            sa.Column("bucket", timestamp(), primary_key=True),
+            sa.Column("created", sa.Integer, nullable=False),
+            sa.Column("updated", sa.Integer, nullable=False),
+            sa.Column("deleted", sa.Integer, nullable=False),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("task_activity")
+    op.drop_table("task_counters")
+    with op.batch_alter_table("tasks") as batch:
+        batch.drop_column("previous_status")
@@ -0,0 +1,49 @@
+"""Повнотекстовий пошук по title + description (GET /tasks/search)
+
+PostgreSQL: згенерована колонка search_vector з GIN-індексом і триграмний
+індекс на title. SQLite: FTS5-таблиця tasks_fts з тригерами; індекс
+збирається з уже наявного тексту.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+from migrations.helpers import columns, drop_sqlite_search, ensure_sqlite_search, indexes
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+# Знімок models.SEARCH_DDL на момент ревізії
+SEARCH_CONFIG = "simple"
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        if "search_vector" not in columns("tasks"):
+            op.execute(
+                "ALTER TABLE tasks ADD COLUMN search_vector tsvector GENERATED ALWAYS AS "
+                f"(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '') || ' ' || coalesce(description, ''))) STORED"
+            )
+        existing = indexes("tasks")
+        if "ix_tasks_search_vector" not in existing:
+            op.execute("CREATE INDEX ix_tasks_search_vector ON tasks USING gin (search_vector)")
+        if "ix_tasks_title_trgm" not in existing:
+            op.execute("CREATE INDEX ix_tasks_title_trgm ON tasks USING gin (title gin_trgm_ops)")
+    elif dialect == "sqlite":
+        ensure_sqlite_search()
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_tasks_title_trgm")
+        op.execute("DROP INDEX IF EXISTS ix_tasks_search_vector")
+        op.execute("ALTER TABLE tasks DROP COLUMN IF EXISTS search_vector")
+    elif dialect == "sqlite":
+        drop_sqlite_search()
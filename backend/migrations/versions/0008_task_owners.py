@@ -0,0 +1,212 @@
+"""Власники задач: users, owner_id у tasks і службових таблицях, індекси за власником
+
+Наявні задачі, журнал змін і лічильники отримують власника DEFAULT_OWNER_ID;
+для кожного власника створюється користувач (і для DEFAULT_OWNER_ID - власника
+режиму AUTH_MODE=single). Індекси списків і пошуку починаються з owner_id.
+Секціонування tasks (TASK_PARTITIONS) задається лише при створенні нової схеми.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from database import get_settings
+from migrations.helpers import (
+    columns, create_index, drop_index, ensure_sqlite_search, has_table, indexes, owner_sql,
+    timestamp,
+)
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+OWNER_FK = "tasks_owner_id_fkey"
+
+# Індекси без власника (ревізії 0002, 0003) -> ті самі з owner_id попереду
+TASK_INDEXES = {
+    "ix_tasks_status_id": "ix_tasks_owner_status_id",
+    "ix_tasks_status_created_at_id": "ix_tasks_owner_status_created_at_id",
+    "ix_tasks_status_updated_at_id": "ix_tasks_owner_status_updated_at_id",
+    "ix_tasks_created_at_id": "ix_tasks_owner_created_at_id",
+    "ix_tasks_updated_at_id": "ix_tasks_owner_updated_at_id",
+}
+INDEX_COLUMNS = {
+    "ix_tasks_status_id": ["status", "id"],
+    "ix_tasks_status_created_at_id": ["status", "created_at", "id"],
+    "ix_tasks_status_updated_at_id": ["status", "updated_at", "id"],
+    "ix_tasks_created_at_id": ["created_at", "id"],
+    "ix_tasks_updated_at_id": ["updated_at", "id"],
+}
+# Пошук у PostgreSQL (ревізія 0007), тепер у межах власника (btree_gin)
+SEARCH_INDEXES = {
+    "ix_tasks_search_vector": "search_vector",
+    "ix_tasks_title_trgm": "title gin_trgm_ops",
+}
+
+
+def _counters_table() -> list:
+    return [
+        sa.Column("owner_id", sa.Integer, primary_key=True),
+        sa.Column("status", sa.String(16), primary_key=True),
+        sa.Column("count", sa.Integer, nullable=False),
+    ]
+
+
+def _activity_table() -> list:
+    return [
+        sa.Column("owner_id", sa.Integer, primary_key=True),
+        sa.Column("bucket", timestamp(), primary_key=True),
+        sa.Column("created", sa.Integer, nullable=False),
+        sa.Column("updated", sa.Integer, nullable=False),
+        sa.Column("deleted", sa.Integer, nullable=False),
+    ]
+
+
+def _recreate(table: str, new_columns: list, convert) -> None:
+    """
+    Перестворює таблицю лічильників з іншим первинним ключем.
+    Рядків у них небагато (статуси, години активності), тож вони
+    переносяться через пам'ять, а імена таблиці й ключа не змінюються
+    """
+    bind = op.get_bind()
+    old = sa.Table(table, sa.MetaData(), autoload_with=bind)
+    rows = [dict(row) for row in bind.execute(sa.select(old)).mappings()]
+    op.drop_table(table)
+    new = op.create_table(table, *new_columns)
+    rows = convert(rows)
+    if rows:
+        op.bulk_insert(new, rows)
+
+
+def _sum_by(rows: list[dict], key: str, fields: tuple[str, ...]) -> list[dict]:
+    totals: dict = {}
+    for row in rows:
+        total = totals.setdefault(row[key], {key: row[key], **dict.fromkeys(fields, 0)})
+        for field in fields:
+            total[field] += row[field]
+    return list(totals.values())
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    default_owner = get_settings().DEFAULT_OWNER_ID
+
+    if not has_table("users"):
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+            sa.Column("name", sa.String(255), nullable=False),
+            sa.Column("created_at", timestamp(), server_default=sa.func.now()),
+        )
+
+    # 1. owner_id додаємо з DEFAULT - наявні задачі отримують власника без окремого UPDATE
+    if "owner_id" not in columns("tasks"):
+        op.add_column("tasks", sa.Column(
+            "owner_id", sa.Integer, nullable=False, server_default=owner_sql(default_owner)
+        ))
+
+    # 2. Користувач для кожного власника, у якого вже є задачі,
+    # і власник режиму AUTH_MODE=single
+    op.execute(sa.text(
+        "INSERT INTO users (id, name) "
+        "SELECT owner_id, 'owner ' || owner_id FROM "
+        "(SELECT owner_id FROM tasks UNION SELECT :default_owner) AS owners "
+        "WHERE owner_id NOT IN (SELECT id FROM users)"
+    ).bindparams(default_owner=default_owner))
+    if bind.dialect.name == "postgresql":
+        # id вставлені явно - послідовність має продовжити після них
+        op.execute(
+            "SELECT setval(pg_get_serial_sequence('users', 'id'), "
+            "coalesce((SELECT max(id) FROM users), 0) + 1, false)"
+        )
+
+    # 3. Власник обов'язковий і без значення за замовчуванням: нова задача
+    # без owner_id - помилка, а не задача "нічийного" власника.
+    # SQLite перебудовує tasks (тригери пошуку відновлюються нижче)
+    foreign_keys = sa.inspect(bind).get_foreign_keys("tasks")
+    with op.batch_alter_table("tasks") as batch:
+        batch.alter_column("owner_id", existing_type=sa.Integer, existing_nullable=False,
+                           server_default=None)
+        if not any(fk["constrained_columns"] == ["owner_id"] for fk in foreign_keys):
+            batch.create_foreign_key(OWNER_FK, "users", ["owner_id"], ["id"])
+
+    # 4. Індекси списків - у межах власника
+    for old, new in TASK_INDEXES.items():
+        drop_index(old, "tasks")
+        create_index(new, "tasks", ["owner_id", *INDEX_COLUMNS[old]])
+    create_index("ix_tasks_owner_id_id", "tasks", ["owner_id", "id"])
+    drop_index("ix_tasks_title_prefix", "tasks")
+    create_index(
+        "ix_tasks_owner_title_prefix", "tasks", ["owner_id", "title"],
+        postgresql_ops={"title": "text_pattern_ops"},
+    )
+
+    # 5. Журнал змін і лічильники - окремо для кожного власника
+    if "owner_id" not in columns("task_changes"):
+        op.add_column("task_changes", sa.Column(
+            "owner_id", sa.Integer, nullable=False, server_default=owner_sql(default_owner)
+        ))
+        with op.batch_alter_table("task_changes") as batch:
+            batch.alter_column("owner_id", existing_type=sa.Integer, existing_nullable=False,
+                               server_default=None)
+    create_index("ix_task_changes_owner_id_id", "task_changes", ["owner_id", "id"])
+
+    def with_owner(rows):
+        return [{**row, "owner_id": default_owner} for row in rows]
+
+    if "owner_id" not in columns("task_counters"):
+        _recreate("task_counters", _counters_table(), with_owner)
+    if "owner_id" not in columns("task_activity"):
+        _recreate("task_activity", _activity_table(), with_owner)
+
+    # 6. Пошук
+    if bind.dialect.name == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+        existing = indexes("tasks")
+        for name, definition in SEARCH_INDEXES.items():
+            if "owner_id" in existing.get(name, []):
+                continue
+            if name in existing:
+                op.drop_index(name, table_name="tasks")
+            op.execute(f"CREATE INDEX {name} ON tasks USING gin (owner_id, {definition})")
+    elif bind.dialect.name == "sqlite":
+        ensure_sqlite_search()
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+
+    if bind.dialect.name == "postgresql":
+        for name, definition in SEARCH_INDEXES.items():
+            op.drop_index(name, table_name="tasks")
+            op.execute(f"CREATE INDEX {name} ON tasks USING gin ({definition})")
+
+    # Лічильники власників підсумовуються в загальні
+    _recreate("task_activity", _activity_table()[1:],
+              lambda rows: _sum_by(rows, "bucket", ("created", "updated", "deleted")))
+    _recreate("task_counters", _counters_table()[1:],
+              lambda rows: _sum_by(rows, "status", ("count",)))
+
+    op.drop_index("ix_task_changes_owner_id_id", table_name="task_changes")
+    with op.batch_alter_table("task_changes") as batch:
+        batch.drop_column("owner_id")
+
+    op.drop_index("ix_tasks_owner_title_prefix", table_name="tasks")
+    op.drop_index("ix_tasks_owner_id_id", table_name="tasks")
+    for new in TASK_INDEXES.values():
+        op.drop_index(new, table_name="tasks")
+    with op.batch_alter_table("tasks") as batch:
+        batch.drop_constraint(OWNER_FK, type_="foreignkey")
+        batch.drop_column("owner_id")
+    for old, index_columns in INDEX_COLUMNS.items():
+        op.create_index(old, "tasks", index_columns)
+    op.create_index(
+        "ix_tasks_title_prefix", "tasks", ["title"], postgresql_ops={"title": "text_pattern_ops"}
+    )
+    op.drop_table("users")
+
+    if bind.dialect.name == "sqlite":
+        ensure_sqlite_search()
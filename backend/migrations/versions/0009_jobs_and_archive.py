@@ -0,0 +1,54 @@
+"""Черга фонових завдань (jobs) і архів виконаних задач (tasks_archive)
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import has_table, status_enum, timestamp
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if not has_table("tasks_archive"):
+        op.create_table(
+            "tasks_archive",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=False),
+            sa.Column("owner_id", sa.Integer, nullable=False),
+            sa.Column("title", sa.String),
+            sa.Column("description", sa.String),
+            sa.Column("status", status_enum()),
+            sa.Column("created_at", timestamp()),
+            sa.Column("updated_at", timestamp()),
+            sa.Column("version", sa.Integer, nullable=False),
+            sa.Column("archived_at", timestamp(), server_default=sa.func.now()),
+        )
+        op.create_index("ix_tasks_archive_owner_id_id", "tasks_archive", ["owner_id", "id"])
+    if not has_table("jobs"):
+        op.create_table(
+            "jobs",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+            sa.Column("kind", sa.String(64), nullable=False),
+            sa.Column("payload", sa.JSON, nullable=False),
+            sa.Column("key", sa.String(255), unique=True),
+            sa.Column("status", sa.Enum("QUEUED", "RUNNING", "FAILED", name="jobstatus",
+                                        native_enum=False), nullable=False),
+            sa.Column("attempts", sa.Integer, nullable=False),
+            sa.Column("max_attempts", sa.Integer, nullable=False),
+            sa.Column("run_at", timestamp(), nullable=False),
+            sa.Column("locked_until", timestamp()),
+            sa.Column("last_error", sa.String),
+            sa.Column("created_at", timestamp(), server_default=sa.func.now()),
+        )
+        op.create_index("ix_jobs_status_run_at_id", "jobs", ["status", "run_at", "id"])
+
+
+def downgrade() -> None:
+    op.drop_table("jobs")
+    op.drop_table("tasks_archive")
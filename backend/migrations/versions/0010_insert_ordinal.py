@@ -0,0 +1,32 @@
+"""Порядковий номер рядка в пакеті (tasks.insert_ordinal)
+
+Багаторядковий INSERT ... RETURNING у POST /tasks/bulk зіставляє рядки
+з елементами пакета за цією колонкою, а не за порядком id.
+Наявні задачі отримують NULL.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import columns, ensure_sqlite_search
+
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if "insert_ordinal" not in columns("tasks"):
+        op.add_column("tasks", sa.Column("insert_ordinal", sa.Integer))
+
+
+def downgrade() -> None:
+    # SQLite перебудовує tasks - тригери пошуку відновлюються
+    with op.batch_alter_table("tasks") as batch:
+        batch.drop_column("insert_ordinal")
+    if op.get_bind().dialect.name == "sqlite":
+        ensure_sqlite_search()
@@ -1,8 +1,20 @@
 import enum
-from sqlalchemy import Column, Integer, String, DateTime, Enum as SqEnum
+from sqlalchemy import (
+    DDL, JSON, Column, ForeignKey, Integer, MetaData, PrimaryKeyConstraint, String, DateTime,
+    Index, Enum as SqEnum, event, insert_sentinel,
+)
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.sql import func
 from database import Base
 
+# SQLite зберігає CURRENT_TIMESTAMP без мікросекунд, а SQLAlchemy за
+# замовчуванням рендерить параметри з ними. Через це порівняння рядків
+# (курсори, фільтри за датою) "губили" б записи з тією ж секундою.
+# Тому для SQLite пишемо/порівнюємо дати в однаковому форматі.
+Timestamp = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(truncate_microseconds=True), "sqlite"
+)
+
 # 1. Створюємо Enum для статусів
 # Це обмежує можливі значення трьома варіантами
 class TaskStatus(str, enum.Enum):
@@ -13,9 +25,15 @@ class TaskStatus(str, enum.Enum):
 class Task(Base):
     __tablename__ = "tasks"
 
-    id = Column(Integer, primary_key=True, index=True)
-    title = Column(String, index=True)
-    description = Column(String, index=True)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    # Власник (tenant): кожен запит crud.py обмежений одним owner_id,
+    # і кожен складений індекс починається з нього - список одного
+    # користувача читається діапазоном індексу, скільки б задач не було в інших.
+    # Власник - користувач із users; його id приходить лише з підписаного токена (auth.py)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    title = Column(String)
+    # Опис не індексуємо: він необмежений і жоден запит по ньому не шукає
+    description = Column(String)
     
     # 2. Використовуємо Enum замість простого String
     # native_enum=False зберігає це як текст у БД (простіше для сумісності),
@@ -24,7 +42,256 @@ class Task(Base):
     
     # 3. Додаємо часові мітки
     # server_default=func.now() -> БД сама поставить час при створенні
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
     
     # onupdate=func.now() -> БД сама оновить час при будь-якій зміні
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
\ No newline at end of file
+    updated_at = Column(Timestamp, server_default=func.now(), onupdate=func.now())
+
+    # Номер версії рядка: +1 при кожному оновленні (див. crud.py).
+    # З нього будується ETag - на відміну від updated_at (у SQLite з точністю
+    # до секунди) він змінюється навіть при двох оновленнях за секунду
+    version = Column(Integer, nullable=False, server_default="1")
+
+    # Статус до останнього оновлення. UPDATE пише сюди старе значення
+    # (SET previous_status = status бачить рядок ДО зміни) і повертає його
+    # через RETURNING - так лічильники статусів (GET /tasks/summary)
+    # оновлюються без окремого SELECT і без гонок
+    previous_status = Column(SqEnum(TaskStatus, native_enum=False))
+
+    # Порядковий номер рядка в пакеті POST /tasks/bulk. SQLAlchemy підставляє
+    # його в багаторядковий INSERT і за ним зіставляє рядки RETURNING із
+    # вхідними елементами: ні SQLite, ні PostgreSQL не обіцяють, що id
+    # видаються в порядку VALUES. Для звичайних INSERT - NULL
+    insert_ordinal = insert_sentinel("insert_ordinal")
+
+    # 4. Складені індекси під фільтри/сортування GET /tasks/.
+    # Кожен починається з owner_id і закінчується на id, як і ключ курсора,
+    # тож відфільтрована та відсортована сторінка власника читається
+    # з індексу діапазоном - без сортування та без зайвих рядків.
+    __table_args__ = (
+        Index("ix_tasks_owner_id_id", "owner_id", "id"),
+        Index("ix_tasks_owner_status_id", "owner_id", "status", "id"),
+        Index("ix_tasks_owner_status_created_at_id", "owner_id", "status", "created_at", "id"),
+        Index("ix_tasks_owner_status_updated_at_id", "owner_id", "status", "updated_at", "id"),
+        Index("ix_tasks_owner_created_at_id", "owner_id", "created_at", "id"),
+        Index("ix_tasks_owner_updated_at_id", "owner_id", "updated_at", "id"),
+        # Пошук за префіксом назви (LIKE 'abc%').
+        # У PostgreSQL для цього потрібен text_pattern_ops
+        Index(
+            "ix_tasks_owner_title_prefix", "owner_id", "title",
+            postgresql_ops={"title": "text_pattern_ops"},
+        ),
+    )
+
+
+# 5. Лічильник версії таблиці - окремий для кожного власника (name = "tasks:<owner_id>").
+# Збільшується в тій самій транзакції, що й будь-який запис у tasks,
+# і служить ETag для списків: незмінний номер = незмінні дані
+class TableVersion(Base):
+    __tablename__ = "table_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+# 6. Журнал змін таблиці tasks (для GET /tasks/changes?since=N).
+# Токени спільні для всіх власників, але кожен бачить лише свої рядки.
+# id - монотонний токен синхронізації; рядки з op="deleted" - це
+# "надгробки" видалених задач, яких у tasks уже немає.
+# Запит "id > N" читає діапазон первинного ключа - пропорційно кількості змін
+class TaskChange(Base):
+    __tablename__ = "task_changes"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    owner_id = Column(Integer, nullable=False)
+    task_id = Column(Integer, nullable=False)
+    op = Column(String(16), nullable=False)   # created | updated | deleted
+    changed_at = Column(Timestamp, server_default=func.now())
+
+    # Журнал власника: "owner_id = ? AND id > N" - діапазон індексу
+    __table_args__ = (
+        Index("ix_task_changes_owner_id_id", "owner_id", "id"),
+    )
+
+
+# 7. Матеріалізовані лічильники для GET /tasks/summary (на кожного власника).
+# Оновлюються в тій самій транзакції, що й запис у tasks (див. crud.py),
+# тож зведення читає кілька рядків замість підрахунку всієї таблиці.
+# Звірити й перерахувати: POST /tasks/summary/rebuild
+class TaskCounter(Base):
+    __tablename__ = "task_counters"
+
+    owner_id = Column(Integer, primary_key=True)
+    status = Column(String(16), primary_key=True)   # значення TaskStatus
+    count = Column(Integer, nullable=False, default=0)
+
+
+# 8. Активність по годинах: скільки задач створено/змінено/видалено.
+# "За останні 24 години" - це сума не більше ніж 24 рядків
+class TaskActivity(Base):
+    __tablename__ = "task_activity"
+
+    owner_id = Column(Integer, primary_key=True)
+    bucket = Column(Timestamp, primary_key=True)    # початок години (UTC)
+    created = Column(Integer, nullable=False, default=0)
+    updated = Column(Integer, nullable=False, default=0)
+    deleted = Column(Integer, nullable=False, default=0)
+
+
+# 9. Повнотекстовий пошук по title + description (GET /tasks/search).
+# Звичайні B-tree індекси не допомагають шукати слово всередині тексту,
+# тому пошукові структури створюються разом з таблицею tasks, під діалект:
+#   - PostgreSQL: згенерована колонка search_vector (tsvector) з GIN-індексом
+#     і триграмний GIN-індекс на title для нечіткого пошуку (pg_trgm);
+#   - SQLite: FTS5-таблиця tasks_fts з external content (тексти не
+#     дублюються), яку синхронізують тригери на tasks.
+# У моделі колонки search_vector немає: ORM-запити її не читають,
+# а пошук (crud.py) звертається до неї напряму
+SEARCH_CONFIG = "simple"   # без стемінгу: тексти задач змішаними мовами
+
+# GIN-індекси теж починаються з owner_id (btree_gin): пошук не торкається
+# документів інших власників
+SEARCH_DDL = {
+    "postgresql": [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE EXTENSION IF NOT EXISTS btree_gin",
+        "ALTER TABLE tasks ADD COLUMN search_vector tsvector GENERATED ALWAYS AS "
+        f"(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '') || ' ' || coalesce(description, ''))) STORED",
+        "CREATE INDEX ix_tasks_search_vector ON tasks USING gin (owner_id, search_vector)",
+        "CREATE INDEX ix_tasks_title_trgm ON tasks USING gin (owner_id, title gin_trgm_ops)",
+    ],
+    "sqlite": [
+        "CREATE VIRTUAL TABLE tasks_fts USING fts5"
+        "(title, description, content='tasks', content_rowid='id')",
+        """CREATE TRIGGER tasks_fts_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO tasks_fts (rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END""",
+        """CREATE TRIGGER tasks_fts_delete AFTER DELETE ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+        END""",
+        """CREATE TRIGGER tasks_fts_update AFTER UPDATE OF title, description ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+            INSERT INTO tasks_fts (rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END""",
+    ],
+}
+
+def _listen_search_ddl(table) -> None:
+    for dialect, statements in SEARCH_DDL.items():
+        for statement in statements:
+            event.listen(table, "after_create", DDL(statement).execute_if(dialect=dialect))
+
+    # Тригери зникають разом з tasks, а FTS5-таблицю треба прибрати окремо
+    event.listen(
+        table, "before_drop",
+        DDL("DROP TABLE IF EXISTS tasks_fts").execute_if(dialect="sqlite"),
+    )
+
+_listen_search_ddl(Task.__table__)
+
+
+# 10. Секціонування tasks за власником (лише PostgreSQL, TASK_PARTITIONS > 0):
+# tasks_p0..tasks_pN-1. Запит з owner_id = ? PostgreSQL відсікає до однієї
+# секції, тож індекси, які він читає, пропорційні задачам одного кошика власників.
+# Вирішується під час створення схеми (create_schema), а не при імпорті:
+# модель і ORM однакові, секціонованою стає лише таблиця в БД
+def partition_ddl(count: int) -> list[str]:
+    return [
+        f"CREATE TABLE tasks_p{remainder} PARTITION OF tasks "
+        f"FOR VALUES WITH (MODULUS {count}, REMAINDER {remainder})"
+        for remainder in range(count)
+    ]
+
+def partitioned_metadata(count: int) -> MetaData:
+    """Копія схеми, де tasks секціонована HASH (owner_id) на count секцій"""
+    metadata = MetaData()
+    for table in Base.metadata.sorted_tables:
+        table.to_metadata(metadata)
+    tasks = metadata.tables[Task.__tablename__]
+    # Ключ секціонування входить у первинний ключ - він стає складеним (id, owner_id)
+    tasks.c.owner_id.primary_key = True
+    tasks.append_constraint(PrimaryKeyConstraint(tasks.c.id, tasks.c.owner_id))
+    tasks.dialect_options["postgresql"]["partition_by"] = "HASH (owner_id)"
+    # Слухачі подій не копіюються разом з таблицею
+    _listen_search_ddl(tasks)
+    # Секції, створені після індексів і згенерованої колонки батьківської
+    # таблиці, успадковують їх автоматично
+    for statement in partition_ddl(count):
+        event.listen(tasks, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+    return metadata
+
+def create_schema(bind, partitions: int = 0) -> None:
+    """Створює відсутні таблиці (create_all) з урахуванням секціонування tasks"""
+    if partitions and bind.dialect.name == "postgresql":
+        partitioned_metadata(partitions).create_all(bind)
+    else:
+        Base.metadata.create_all(bind)
+
+
+# 11. Холодний архів виконаних задач (фонове завдання archive_done_tasks, див. jobs.py).
+# Задачі DONE, що давно не змінювались, переїжджають сюди з tasks - гаряча
+# таблиця та її індекси лишаються маленькими. Один індекс: архів власника
+class TaskArchive(Base):
+    __tablename__ = "tasks_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)   # той самий id, що був у tasks
+    owner_id = Column(Integer, nullable=False)
+    title = Column(String)
+    description = Column(String)
+    status = Column(SqEnum(TaskStatus, native_enum=False))
+    created_at = Column(Timestamp)
+    updated_at = Column(Timestamp)
+    version = Column(Integer, nullable=False)
+    archived_at = Column(Timestamp, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_tasks_archive_owner_id_id", "owner_id", "id"),
+    )
+
+
+# 12. Черга фонових завдань (jobs.py) - у тій самій БД, тож завдання
+# переживають перезапуск і видні всім воркерам.
+# Виконане завдання видаляється; у таблиці лишаються лише ті, що чекають,
+# виконуються або остаточно впали (FAILED, з текстом помилки)
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    FAILED = "failed"
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(64), nullable=False)       # ім'я обробника (jobs.HANDLERS)
+    payload = Column(JSON, nullable=False)          # аргументи обробника
+    # Ключ унікальності: поки завдання з ключем у черзі, друге таке ж
+    # не додається (періодичні завдання з кількох процесів)
+    key = Column(String(255), unique=True)
+    status = Column(SqEnum(JobStatus, native_enum=False), nullable=False, default=JobStatus.QUEUED)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    # Коли запускати (затримка та backoff між спробами)
+    run_at = Column(Timestamp, nullable=False)
+    # "Оренда" воркера: якщо він упав, після цього часу завдання візьме інший
+    locked_until = Column(Timestamp)
+    last_error = Column(String)
+    created_at = Column(Timestamp, server_default=func.now())
+
+    # Вибірка воркера: "status = ? AND run_at <= now ORDER BY run_at, id"
+    __table_args__ = (
+        Index("ix_jobs_status_run_at_id", "status", "run_at", "id"),
+    )
+
+
+# 13. Користувачі - власники задач. Токен API (auth.py) містить id користувача,
+# а tasks.owner_id посилається сюди
+class User(Base):
+    __tablename__ = "users"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(255), nullable=False)
+    created_at = Column(Timestamp, server_default=func.now())
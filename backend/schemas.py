@@ -1,5 +1,8 @@
-from pydantic import BaseModel, ConfigDict
-from datetime import datetime
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, field_validator
+from datetime import datetime, timezone
+from typing import Literal
+
+import orjson
 # Импортируем наш Enum из models, чтобы использовать его в схемах
 from models import TaskStatus
 
@@ -32,4 +35,106 @@ class Task(TaskBase):
     updated_at: datetime | None = None
 
     # Настройка для работы с ORM (SQLAlchemy)
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+# Готовый "адаптер" для списка задач: сериализует сразу в JSON-байты
+TaskList = TypeAdapter(list[Task])
+
+# Поля ответа Task в порядке схемы (для быстрого пути списка, см. crud.TASK_COLUMNS)
+TASK_FIELDS = tuple(Task.model_fields)
+
+def dump_task_rows(rows) -> bytes:
+    """
+    Строки из БД (кортежи в порядке TASK_FIELDS) -> JSON, байт в байт как
+    TaskList.dump_json, но без промежуточных моделей: данные из БД уже валидны.
+    OPT_UTC_Z: pydantic пишет UTC как "Z", а не "+00:00"
+    """
+    return orjson.dumps(
+        [dict(zip(TASK_FIELDS, row)) for row in rows], option=orjson.OPT_UTC_Z
+    )
+
+# 5. Схема Фильтров списка (TaskFilter)
+# Query-параметры GET /tasks/. Все поля опциональны.
+# *_after - включительно (>=), *_before - не включительно (<)
+class TaskFilter(BaseModel):
+    status: TaskStatus | None = None
+    created_after: datetime | None = None
+    created_before: datetime | None = None
+    updated_after: datetime | None = None
+    updated_before: datetime | None = None
+    title_prefix: str | None = None
+
+    # БД хранит время в UTC, поэтому приводим даты с часовым поясом к UTC
+    @field_validator("created_after", "created_before", "updated_after", "updated_before")
+    @classmethod
+    def to_utc(cls, value: datetime | None):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value
+
+
+# 6. Схемы МАССОВЫХ операций (bulk)
+# Максимальный размер пакета в одном запросе
+BULK_MAX_ITEMS = 1000
+
+# Элемент PATCH /tasks/bulk: id + любые поля из TaskUpdate
+class TaskBulkUpdate(TaskUpdate):
+    id: int
+
+# Тело DELETE /tasks/bulk
+class TaskBulkDelete(BaseModel):
+    ids: list[int] = Field(min_length=1, max_length=BULK_MAX_ITEMS)
+
+# Результат по каждому элементу пакета (index - позиция в запросе)
+class BulkItemResult(BaseModel):
+    index: int
+    id: int | None = None
+    status: Literal["created", "updated", "deleted", "not_found"]
+    task: Task | None = None
+
+BulkItemResultList = TypeAdapter(list[BulkItemResult])
+
+
+# 7. Ответ ленты изменений GET /tasks/changes?since=N
+# upserted - созданные/измененные задачи (текущее состояние),
+# deleted - id удаленных задач, next_since - токен для следующего запроса
+# reset/cursor - только для снимка (since=0 или токен старше журнала):
+# reset=true - выбросить локальные задачи; пока есть cursor, передавать его
+class TaskChanges(BaseModel):
+    upserted: list[Task]
+    deleted: list[int]
+    next_since: int
+    has_more: bool
+    reset: bool = False
+    cursor: str | None = None
+
+# 8. Отчет POST /tasks/import
+# line - номер строки во входном файле (для CSV - первая строка записи)
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+class ImportResult(BaseModel):
+    imported: int
+    failed: int
+    errors: list[ImportRowError]
+
+# 9. Сводка по доске GET /tasks/summary
+# Активность - число операций (задача, измененная дважды, считается дважды)
+class ActivityTotals(BaseModel):
+    created: int = 0
+    updated: int = 0
+    deleted: int = 0
+
+class TaskSummary(BaseModel):
+    total: int
+    by_status: dict[TaskStatus, int]
+    last_24h: ActivityTotals
+    last_7d: ActivityTotals
+
+# Результат POST /tasks/summary/rebuild
+# drift - на сколько сохраненный счетчик отличался от факта (только ненулевые)
+class SummaryRebuild(BaseModel):
+    consistent: bool
+    drift: dict[TaskStatus, int]
+    summary: TaskSummary
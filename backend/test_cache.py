@@ -0,0 +1,139 @@
+import asyncio
+import time
+
+import pytest
+
+from cache import MemoryCache, RedisCache, SingleFlight, TaskCache, params_digest
+
+
+class FakeRedis:
+    """Локальная заглушка Redis: только команды, которые использует RedisCache"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at < time.monotonic():
+            return None
+        return value
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and self.get(key) is not None:
+            return None
+        self.data[key] = (value.encode(), time.monotonic() + ex if ex else None)
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def incr(self, key):
+        value = int(self.get(key) or 0) + 1
+        self.data[key] = (str(value).encode(), None)
+        return value
+
+
+def test_memory_cache_lru_and_ttl():
+    """LRU вытесняет самый давний ключ, TTL - просроченные"""
+    backend = MemoryCache(max_entries=2, ttl=60)
+    backend.set("a", "1")
+    backend.set("b", "2")
+    backend.get("a")          # "a" стал самым свежим
+    backend.set("c", "3")     # вытесняется "b"
+
+    assert backend.get("a") == "1"
+    assert backend.get("b") is None
+    assert backend.get("c") == "3"
+
+    expired = MemoryCache(ttl=0)
+    expired.set("a", "1")
+    assert expired.get("a") is None
+
+
+def check_invalidation(cache: TaskCache):
+    cache.set_task(1, 1, '{"id": 1}', cache.task_token(1, 1))
+    cache.set_task(1, 2, '{"id": 2}', cache.task_token(1, 2))
+    digest = params_digest(limit=100, sort="id")
+    list_key = cache.list_key(1, digest)
+    cache.set_list(list_key, '\n[{"id": 1}, {"id": 2}]')
+    cache.set_list(cache.list_key(2, digest), '\n[]')
+
+    assert cache.get_task(1, 1) == '{"id": 1}'
+    assert cache.get_task(2, 1) is None
+    assert cache.get_list(list_key) is not None
+
+    # Запись в задачу 1: сбрасывается только она и все списки ее владельца
+    cache.invalidate(1, [1])
+    assert cache.get_task(1, 1) is None
+    assert cache.get_task(1, 2) == '{"id": 2}'
+    assert cache.get_list(cache.list_key(1, digest)) is None
+    assert cache.get_list(cache.list_key(2, digest)) == '\n[]'
+
+    assert cache.stats()["hits"] == 4
+    assert cache.stats()["misses"] == 3
+
+
+def test_task_cache_invalidation_memory():
+    check_invalidation(TaskCache(MemoryCache()))
+
+
+def test_task_cache_invalidation_redis():
+    check_invalidation(TaskCache(RedisCache(FakeRedis())))
+
+
+@pytest.mark.parametrize("backend", [MemoryCache, lambda: RedisCache(FakeRedis())])
+def test_task_fill_after_write_is_dropped(backend):
+    """Чтение, начатое до записи, не кладет в кэш старое тело"""
+    cache = TaskCache(backend())
+
+    # Запись закоммитилась, пока чтение ходило в БД
+    token = cache.task_token(1, 1)
+    cache.invalidate(1, [1])
+    assert cache.set_task(1, 1, "old", token) is False
+    assert cache.get_task(1, 1) is None
+
+    # ... или между проверкой поколения и set()
+    token = cache.task_token(1, 1)
+    set_value = cache.backend.set
+
+    def set_racing_write(key, value, ttl=None):
+        set_value(key, value, ttl)
+        cache.invalidate(1, [1])
+
+    cache.backend.set = set_racing_write
+    assert cache.set_task(1, 1, "old", token) is False
+    assert cache.get_task(1, 1) is None
+
+    # Без записи ответ кладется
+    del cache.backend.set
+    assert cache.set_task(1, 1, "new", cache.task_token(1, 1)) is True
+    assert cache.get_task(1, 1) == "new"
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    """Конкурентные вызовы с одним ключом - одно выполнение, один результат"""
+    flight = SingleFlight()
+    calls = []
+
+    async def load(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        if key == "missing":
+            raise LookupError(key)
+        return f"value {key}"
+
+    async def scenario():
+        results = await asyncio.gather(
+            *(flight.do(key, lambda key=key: load(key)) for key in ["a"] * 5 + ["b"] * 3)
+        )
+        with pytest.raises(LookupError):
+            await asyncio.gather(*(flight.do("missing", lambda: load("missing")) for _ in range(2)))
+        # После завершения ключ свободен: следующий вызов снова идет в источник
+        await flight.do("a", lambda: load("a"))
+        return results
+
+    results = asyncio.run(scenario())
+    assert results == ["value a"] * 5 + ["value b"] * 3
+    assert calls == ["a", "b", "missing", "a"]
+    assert flight.stats() == {"calls": 4, "coalesced": 7}
@@ -1,5 +1,8 @@
+import re
+from contextlib import contextmanager
+
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 import models
 import schemas
@@ -11,6 +14,8 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+OWNER = 1
+
 
 @pytest.fixture()
 def db_session():
@@ -33,7 +38,7 @@ def test_crud_create_task(db_session):
         description="Проверка crud.py"
     )
 
-    db_task = crud.create_task(db=db_session, task=task_to_create)
+    db_task = crud.create_task(db=db_session, owner_id=OWNER, task=task_to_create)
 
     assert db_task is not None
     assert db_task.title == "Тест CRUD"
@@ -42,4 +47,131 @@ def test_crud_create_task(db_session):
 
     saved_task = db_session.query(models.Task).get(db_task.id)
     assert saved_task is not None
-    assert saved_task.title == "Тест CRUD"
\ No newline at end of file
+    assert saved_task.title == "Тест CRUD"
+
+
+@contextmanager
+def count_statements():
+    """
+    Собирает SQL-запросы к таблице tasks внутри блока with
+    (служебные таблицы, например версия таблицы, не считаются)
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        if re.match(r"(INSERT INTO|UPDATE|DELETE FROM|SELECT .* FROM) tasks\b", statement, re.S):
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_crud_writes_are_single_statements(db_session):
+    import crud
+
+    with count_statements() as statements:
+        db_task = crud.create_task(
+            db=db_session, owner_id=OWNER, task=schemas.TaskCreate(title="Old", description="Old")
+        )
+        # id и даты пришли из INSERT ... RETURNING, без refresh()
+        assert db_task.id is not None
+        assert db_task.created_at is not None
+        assert [s.split()[0] for s in statements] == ["INSERT"]
+
+        updated = crud.update_task(
+            db=db_session, owner_id=OWNER, task_id=db_task.id, task=schemas.TaskUpdate(status="done")
+        )
+        # Поля доступны после commit() без повторного SELECT
+        assert updated.status == "done"
+        assert updated.title == "Old"
+        assert updated.updated_at is not None
+        assert [s.split()[0] for s in statements] == ["INSERT", "UPDATE"]
+
+        deleted = crud.delete_task(db=db_session, owner_id=OWNER, task_id=db_task.id)
+        assert deleted.title == "Old"
+        assert [s.split()[0] for s in statements] == ["INSERT", "UPDATE", "DELETE"]
+
+    # Несуществующая задача -> None (эндпоинт вернет 404)
+    missing = schemas.TaskUpdate(title="X")
+    assert crud.update_task(db=db_session, owner_id=OWNER, task_id=db_task.id, task=missing) is None
+    assert crud.delete_task(db=db_session, owner_id=OWNER, task_id=db_task.id) is None
+
+
+def test_bulk_create_correlates_rows_by_ordinal(db_session):
+    """Пакет - один INSERT; строки RETURNING сопоставлены с элементами по insert_ordinal"""
+    import crud
+
+    titles = ["B", "A", "B", "C"]
+    with count_statements() as statements:
+        created = crud.create_tasks(
+            db_session, OWNER, [schemas.TaskCreate(title=title) for title in titles]
+        )
+    assert len(statements) == 1 and "insert_ordinal" in statements[0]
+    assert [db_task.title for db_task in created] == titles
+    # Каждому элементу - его собственная строка
+    assert [crud.get_task(db_session, OWNER, db_task.id).title for db_task in created] == titles
+    assert len({db_task.id for db_task in created}) == len(titles)
+
+
+def test_task_rows_page_matches_orm_serialization(db_session):
+    """Быстрый путь списка дает тот же JSON и курсор, что и ORM + pydantic"""
+    from datetime import datetime, timezone
+
+    import crud
+
+    crud.create_tasks(db_session, OWNER, [
+        schemas.TaskCreate(title="Первая   <b>", description=None),
+        schemas.TaskCreate(title="Вторая", description="Описание"),
+        schemas.TaskCreate(title="Третья"),
+    ])
+    crud.update_task(db_session, OWNER, 2, schemas.TaskUpdate(status="done"))
+
+    tasks, cursor = crud.get_tasks_page(db_session, OWNER, limit=2, sort="-updated_at")
+    rows, row_cursor = crud.get_task_rows_page(db_session, OWNER, limit=2, sort="-updated_at")
+
+    assert row_cursor == cursor
+    assert schemas.dump_task_rows(rows) == schemas.TaskList.dump_json(
+        schemas.TaskList.validate_python(tasks, from_attributes=True)
+    )
+
+    # PostgreSQL отдает даты с часовым поясом: UTC пишется как "Z"
+    aware = datetime(2025, 1, 2, 3, 4, 5, 6000, tzinfo=timezone.utc)
+    row = ("T", None, 1, "todo", aware, None)
+    assert schemas.dump_task_rows([row]) == schemas.TaskList.dump_json(
+        [schemas.Task(**dict(zip(schemas.TASK_FIELDS, row)))]
+    )
+
+
+def test_owners_do_not_see_each_other(db_session):
+    """Любая операция одного владельца не видит и не меняет задачи другого"""
+    import crud
+
+    (mine,) = crud.create_tasks(db_session, 1, [schemas.TaskCreate(title="Моя")])
+    (theirs,) = crud.create_tasks(db_session, 2, [schemas.TaskCreate(title="Чужая")])
+
+    assert crud.get_task(db_session, 1, theirs.id) is None
+    assert [t.title for t in crud.get_tasks(db_session, 1)] == ["Моя"]
+    assert crud.update_task(db_session, 1, theirs.id, schemas.TaskUpdate(title="X")) is None
+    assert crud.delete_tasks(db_session, 1, [mine.id, theirs.id]).keys() == {mine.id}
+    assert crud.get_task(db_session, 2, theirs.id).title == "Чужая"
+
+    # Версии списков и счетчики у каждого владельца свои
+    assert crud.get_tasks_version(db_session, 1) == 2
+    assert crud.get_tasks_version(db_session, 2) == 1
+    assert crud.get_summary(db_session, 1).total == 0
+    assert crud.get_summary(db_session, 2).total == 1
+    assert crud.rebuild_summary(db_session, 2).consistent
+
+
+def test_import_copy_buffer_escaping():
+    """Текстовый формат COPY: NULL и спецсимволы не ломают строки"""
+    import crud
+
+    buffer = crud._copy_buffer([
+        {"title": "a\tb\\c", "description": None},
+        {"title": "line\nbreak", "description": ""},
+    ])
+    assert buffer.read().splitlines() == ["0\ta\\tb\\\\c\t\\N", "1\tline\\nbreak\t"]
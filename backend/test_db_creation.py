@@ -33,4 +33,98 @@ def test_tasks_table_is_created():
 
     # --- Шаг 4: УТВЕРЖДЕНИЕ ---
     # Мы утверждаем, что в этом списке ЕСТЬ таблица 'tasks'
-    assert "tasks" in table_names
\ No newline at end of file
+    assert "tasks" in table_names
+
+def test_engine_options_from_settings():
+    """
+    Проверяем, что настройки пула и statement_timeout
+    попадают в параметры движка, а для PgBouncer
+    отключается кэш prepared statements asyncpg.
+    """
+    from database import Settings, engine_options, pool_status
+
+    settings = Settings(
+        DATABASE_URL="postgresql://u:p@db/app",
+        DB_POOL_SIZE=20, DB_MAX_OVERFLOW=5, DB_STATEMENT_TIMEOUT_MS=2000,
+    )
+    options = engine_options(settings, settings.DATABASE_URL)
+    assert options["pool_size"] == 20
+    assert options["max_overflow"] == 5
+    assert options["pool_pre_ping"] is True
+    assert options["connect_args"] == {"options": "-c statement_timeout=2000"}
+
+    pgbouncer = settings.model_copy(update={"DB_PGBOUNCER": True})
+    options = engine_options(pgbouncer, "postgresql+asyncpg://u:p@db/app")
+    assert options["connect_args"]["statement_cache_size"] == 0
+    assert options["connect_args"]["prepared_statement_cache_size"] == 0
+    assert "server_settings" not in options["connect_args"]
+
+    # SQLite: только pre-ping/recycle, без размеров пула
+    assert "pool_size" not in engine_options(settings, "sqlite://")
+
+    # Счетчики пула есть у QueuePool
+    file_engine = create_engine("sqlite:///file.db", **engine_options(settings, "sqlite:///file.db"))
+    assert pool_status(file_engine) == {
+        "class": "QueuePool", "size": 5, "checked_in": 0, "checked_out": 0, "overflow": -5,
+    }
+
+def test_import_does_not_connect():
+    """
+    Холодный старт: импорт приложения не создает движок
+    и не импортирует драйвер БД - это происходит лениво.
+    """
+    import os
+    import subprocess
+    import sys
+
+    code = (
+        "import sys, database, main; "
+        "print('engine' in vars(database), 'async_engine' in vars(database), "
+        "'psycopg2' in sys.modules, 'asyncpg' in sys.modules)"
+    )
+    # Недоступный сервер: импорт не должен даже пытаться к нему подключиться
+    env = {**os.environ, "DATABASE_URL": "postgresql://u:p@127.0.0.1:1/app", "DB_ASYNC": "true"}
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True, env=env
+    )
+    assert result.stdout.split() == ["False"] * 4
+
+def test_init_schema_and_warm_up(tmp_path):
+    """Старт (lifespan): создание таблиц и прогрев пула соединений"""
+    import asyncio
+
+    from database import init_schema, warm_up
+
+    file_engine = create_engine(f"sqlite:///{tmp_path / 'start.db'}")
+    asyncio.run(init_schema(file_engine))
+    assert "tasks" in inspect(file_engine).get_table_names()
+
+    # Повторный старт ничего не ломает: существующие таблицы пропускаются
+    asyncio.run(init_schema(file_engine))
+
+    asyncio.run(warm_up(file_engine, 3))
+    assert file_engine.pool.checkedin() == 3
+    file_engine.dispose()
+
+def test_import_does_not_read_settings(tmp_path):
+    """
+    Импорт приложения не читает настройки (.env) и ничего не создает:
+    ни движок, ни кэш, ни брокер событий, ни пул фоновых заданий
+    """
+    import os
+    import subprocess
+    import sys
+
+    backend = os.path.dirname(os.path.abspath(__file__))
+    code = (
+        "import sys; sys.path.insert(0, %r)\n"
+        "import main, database, cache, events, idempotency, jobs\n"
+        "assert database.get_settings.cache_info().currsize == 0\n"
+        "assert not {'task_cache', 'broker', 'store', 'pool'} & (\n"
+        "    vars(cache).keys() | vars(events).keys() | vars(idempotency).keys() | vars(jobs).keys())\n"
+    ) % backend
+    # Без DATABASE_URL и без .env: Settings() здесь упал бы
+    env = {key: value for key, value in os.environ.items() if key != "DATABASE_URL"}
+    result = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env,
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
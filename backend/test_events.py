@@ -0,0 +1,241 @@
+import asyncio
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import crud
+import events
+import schemas
+from database import Base
+from events import EventBroker, LocalBackend, PostgresNotifyBackend, sse_stream
+
+
+class ChannelStandIn:
+    """
+    Заглушка LISTEN/NOTIFY для тестов: общий "канал" для нескольких
+    брокеров (воркеров). Как и в PostgreSQL, событие доставляется
+    всем воркерам, включая отправителя, и только после commit
+    """
+
+    def __init__(self):
+        self.brokers = []
+
+    def backend(self):
+        channel = self
+
+        class Backend(LocalBackend):
+            always_active = True
+
+            def attach(self, broker):
+                super().attach(broker)
+                channel.brokers.append(broker)
+
+            def after_commit(self, task_events):
+                for broker in channel.brokers:
+                    broker.dispatch(task_events)
+
+        return Backend()
+
+
+async def _receive(subscription, count):
+    return [await asyncio.wait_for(subscription.get(), timeout=1) for _ in range(count)]
+
+
+def test_broker_fans_out_from_worker_thread():
+    """Событие из threadpool (синхронный CRUD) доходит до всех подписчиков"""
+    broker = EventBroker()
+
+    async def scenario():
+        async with broker.subscribe(1) as first, broker.subscribe(1) as second:
+            assert broker.subscriber_count == 2
+            thread = threading.Thread(
+                target=broker.after_commit, args=([{"op": "deleted", "id": 1, "owner_id": 1}],)
+            )
+            thread.start()
+            thread.join()
+            return await _receive(first, 1), await _receive(second, 1)
+
+    assert asyncio.run(scenario()) == ([{"op": "deleted", "id": 1, "owner_id": 1}],) * 2
+    assert broker.subscriber_count == 0
+
+
+def test_slow_subscriber_gets_resync():
+    """Переполненная очередь не растет: клиент получает сигнал resync (None)"""
+    broker = EventBroker(queue_size=2)
+
+    async def scenario():
+        async with broker.subscribe(1) as subscription:
+            broker.dispatch([{"op": "deleted", "id": i, "owner_id": 1} for i in range(5)])
+            received = await _receive(subscription, 2)
+            assert subscription.queue.empty()
+            return received
+
+    received = asyncio.run(scenario())
+    assert received == [{"op": "deleted", "id": 1, "owner_id": 1}, None]
+
+
+def test_events_reach_only_owner_subscribers():
+    broker = EventBroker()
+
+    async def scenario():
+        async with broker.subscribe(1) as mine, broker.subscribe(2) as theirs:
+            broker.dispatch([
+                {"op": "deleted", "id": 1, "owner_id": 2},
+                {"op": "deleted", "id": 2, "owner_id": 1},
+            ])
+            received = await _receive(mine, 1), await _receive(theirs, 1)
+            assert mine.queue.empty() and theirs.queue.empty()
+            return received
+
+    assert asyncio.run(scenario()) == (
+        [{"op": "deleted", "id": 2, "owner_id": 1}], [{"op": "deleted", "id": 1, "owner_id": 2}]
+    )
+    assert broker.subscriber_count == 0
+
+
+def test_crud_writes_reach_other_workers(monkeypatch):
+    """Запись в одном "воркере" видна подписчику другого через общий канал"""
+    channel = ChannelStandIn()
+    writer, reader = EventBroker(channel.backend()), EventBroker(channel.backend())
+    monkeypatch.setattr(events, "broker", writer)
+
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autoflush=False, bind=engine)()
+
+    async def scenario():
+        async with reader.subscribe(1) as subscription:
+            task = await asyncio.to_thread(
+                crud.create_task, db, 1, schemas.TaskCreate(title="Push")
+            )
+            await asyncio.to_thread(crud.delete_task, db, 1, task.id)
+            return await _receive(subscription, 2)
+
+    try:
+        created, deleted = asyncio.run(scenario())
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+
+    assert created["op"] == "created"
+    assert created["task"]["title"] == "Push"
+    assert deleted == {"op": "deleted", "id": created["id"], "owner_id": 1}
+
+
+def test_sse_stream_heartbeat_and_events():
+    broker = EventBroker()
+
+    async def scenario():
+        stream = sse_stream(broker, heartbeat=0.01, owner_id=1)
+        chunks = [await anext(stream)]            # retry: ...
+        chunks.append(await anext(stream))        # keepalive
+        broker.dispatch([{"op": "deleted", "id": 7, "owner_id": 1}])
+        chunks.append(await anext(stream))
+        await stream.aclose()
+        return chunks
+
+    retry, keepalive, event = asyncio.run(scenario())
+    assert retry.startswith("retry:")
+    assert keepalive == ": keepalive\n\n"
+    assert event == 'event: deleted\ndata: {"op":"deleted","id":7,"owner_id":1}\n\n'
+    assert broker.subscriber_count == 0
+
+
+@pytest.mark.parametrize("size, truncated", [(10, False), (10_000, True)])
+def test_postgres_notify_payload_limit(size, truncated):
+    backend = PostgresNotifyBackend("postgresql://localhost/test")
+    event = {"op": "created", "id": 1, "owner_id": 1, "task": {"description": "x" * size}}
+    (stmt,) = backend.before_commit([event])
+    channel, payload = stmt.compile().params.values()
+    assert channel == "task_events"
+    assert ('"truncated": true' in payload) is truncated
+
+
+class FakeListenConnection:
+    def __init__(self):
+        self.listeners = {}
+        self.termination_listeners = []
+        self.closed = False
+
+    async def add_listener(self, channel, callback):
+        self.listeners[channel] = callback
+
+    def add_termination_listener(self, callback):
+        self.termination_listeners.append(callback)
+
+    async def close(self):
+        self.closed = True
+
+    def terminate(self):
+        """Обрыв соединения: как asyncpg, вызываем слушателей завершения"""
+        for callback in self.termination_listeners:
+            callback(self)
+
+
+class FlakyNotifyBackend(PostgresNotifyBackend):
+    """PostgresNotifyBackend без сети: первые fail_times подключений падают"""
+    RECONNECT_MIN = 0.01
+
+    def __init__(self, fail_times: int = 0):
+        super().__init__("postgresql://localhost/test")
+        self.connections = []
+        self.fail_times = fail_times
+
+    async def _open_connection(self):
+        if self.connections and self.fail_times > 0:
+            self.fail_times -= 1
+            raise OSError("connection refused")
+        self.connections.append(FakeListenConnection())
+        return self.connections[-1]
+
+
+def test_listen_connection_reconnects_and_resyncs():
+    """Оборванный LISTEN переоткрывается, подписчики получают resync"""
+    backend = FlakyNotifyBackend(fail_times=2)
+    broker = EventBroker(backend)
+
+    async def scenario():
+        async with broker.subscribe(1) as subscription:
+            first = backend.connections[0]
+            first.terminate()
+            assert not backend.connected
+            # Пока соединения нет, новая подписка не пытается открыть второе
+            async with broker.subscribe(2):
+                pass
+            received = await _receive(subscription, 1)
+
+            second = backend.connections[-1]
+            assert backend.connected and second is not first
+            # Новые NOTIFY снова доходят до подписчиков
+            async with broker.subscribe(1) as fresh:
+                second.listeners["task_events"](second, 1, "task_events", '{"op":"deleted","id":3,"owner_id":1}')
+                assert await _receive(fresh, 1) == [{"op": "deleted", "id": 3, "owner_id": 1}]
+        await broker.close()
+        return received, second
+
+    received, second = asyncio.run(scenario())
+    assert received == [None]
+    assert len(backend.connections) == 2 and backend.fail_times == 0
+    assert second.closed and not backend.connected
+
+
+def test_closing_listen_connection_does_not_reconnect():
+    backend = FlakyNotifyBackend()
+    broker = EventBroker(backend)
+
+    async def scenario():
+        await backend.start()
+        connection = backend.connections[0]
+        await broker.close()
+        # Свое закрытие asyncpg тоже сообщает слушателям завершения
+        connection.terminate()
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert len(backend.connections) == 1 and backend.connections[0].closed
+    assert not backend.connected
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+from fastapi import Response
+
+from cache import MemoryCache, RedisCache
+from idempotency import (
+    REPLAYED_HEADER, IdempotencyInProgress, IdempotencyMismatch, IdempotencyStore,
+    request_fingerprint,
+)
+from test_cache import FakeRedis
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request):
+    if request.param == "redis":
+        return IdempotencyStore(RedisCache(FakeRedis(), ttl=60))
+    return IdempotencyStore(MemoryCache(max_entries=100, ttl=60))
+
+
+def test_replay_returns_stored_response(store):
+    """Повтор с тем же ключом получает сохраненный ответ, handler не вызывается"""
+    calls = []
+    fingerprint = request_fingerprint("POST", "/tasks/", '{"title":"A"}')
+
+    async def handler():
+        calls.append(1)
+        return Response(content=b'{"id":1}', status_code=200, media_type="application/json",
+                        headers={"ETag": '"1.1"', "X-Other": "x"})
+
+    first = asyncio.run(store.run(1, "key", fingerprint, handler))
+    replay = asyncio.run(store.run(1, "key", fingerprint, handler))
+
+    assert calls == [1]
+    assert REPLAYED_HEADER not in first.headers
+    assert replay.body == b'{"id":1}'
+    assert replay.headers["ETag"] == '"1.1"'
+    assert replay.headers[REPLAYED_HEADER] == "true"
+    assert "X-Other" not in replay.headers
+
+    # Ключи разделены по владельцу
+    asyncio.run(store.run(2, "key", fingerprint, handler))
+    assert calls == [1, 1]
+
+
+def test_mismatch_and_in_progress(store):
+    fingerprint = request_fingerprint("POST", "/tasks/", "a")
+    assert store.begin(1, "key", fingerprint) is None
+
+    # Первый запрос еще выполняется
+    with pytest.raises(IdempotencyInProgress):
+        store.begin(1, "key", fingerprint)
+    # Тот же ключ, другое тело
+    with pytest.raises(IdempotencyMismatch):
+        store.begin(1, "key", request_fingerprint("POST", "/tasks/", "b"))
+
+
+def test_failures_are_not_stored(store):
+    """Исключение или 5xx освобождают ключ: повтор выполнится заново"""
+    fingerprint = request_fingerprint("PUT", "/tasks/1", "a")
+
+    async def failing():
+        raise RuntimeError("db down")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(store.run(1, "key", fingerprint, failing))
+
+    async def unavailable():
+        return Response(status_code=503)
+
+    asyncio.run(store.run(1, "key", fingerprint, unavailable))
+    assert store.begin(1, "key", fingerprint) is None
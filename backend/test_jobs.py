@@ -0,0 +1,244 @@
+import asyncio
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import crud
+import jobs
+import models
+import schemas
+from database import Base
+
+# Файл, а не память: воркеры работают в своих потоках, и каждому нужно
+# свое соединение (с общим StaticPool-соединением закрытие сессии одного
+# потока откатывает транзакцию другого)
+engine = create_engine(
+    f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'jobs.db')}",
+    connect_args={"check_same_thread": False},
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture()
+def db_session():
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture(params=["sync", "async"])
+def make_pool(request, db_session):
+    """Пул воркеров на тестовой БД: синхронные сессии или aiosqlite"""
+    if request.param == "sync":
+        factory, is_async = TestingSessionLocal, False
+    else:
+        async_engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        asyncio.run(_create_schema(async_engine))
+        factory, is_async = async_sessionmaker(async_engine, expire_on_commit=False), True
+
+    def make(**options):
+        options = {"retry_base": 0, "retry_max": 0, **options}
+        return jobs.JobWorkerPool(lambda: factory, is_async, **options)
+
+    return make
+
+
+async def _create_schema(async_engine):
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+@pytest.fixture()
+def flaky_job(monkeypatch):
+    """Задание "flaky": падает, пока не исчерпает fail_times попыток"""
+    calls = []
+
+    def run(db, fail_times: int = 0):
+        calls.append(fail_times)
+        if len(calls) <= fail_times:
+            raise RuntimeError(f"boom {len(calls)}")
+
+    async def run_async(db, fail_times: int = 0):
+        run(db, fail_times)
+
+    monkeypatch.setitem(jobs.HANDLERS, "flaky", (run, run_async))
+    return calls
+
+
+def _age_task(db, task_id: int, days: int):
+    db.execute(
+        update(models.Task).where(models.Task.id == task_id)
+        .values(updated_at=datetime.now(timezone.utc) - timedelta(days=days))
+    )
+    db.commit()
+
+
+def test_archive_moves_old_done_tasks(db_session):
+    done = schemas.TaskUpdate(status=models.TaskStatus.DONE)
+    old_done, recent_done, old_todo = [], [], []
+    for owner in (1, 2):
+        tasks = crud.create_tasks(db_session, owner, [schemas.TaskCreate(title=f"t{i}") for i in range(4)])
+        for db_task in tasks[:3]:
+            crud.update_task(db_session, owner, db_task.id, done)
+        for db_task in tasks[:2]:
+            _age_task(db_session, db_task.id, days=40)
+        _age_task(db_session, tasks[3].id, days=40)
+        old_done += [db_task.id for db_task in tasks[:2]]
+        recent_done.append(tasks[2].id)
+        old_todo.append(tasks[3].id)
+    since = crud.get_changes(db_session, 1, since=0).next_since
+
+    # Пачки по одной задаче: каждая - своя транзакция
+    assert crud.archive_done_tasks(db_session, older_than_days=30, batch_size=1) == 4
+
+    remaining = set(db_session.scalars(select(models.Task.id)))
+    assert remaining == set(recent_done + old_todo)
+    archived = db_session.scalars(select(models.TaskArchive).order_by(models.TaskArchive.id)).all()
+    assert [row.id for row in archived] == sorted(old_done)
+    assert {row.owner_id for row in archived} == {1, 2}
+    assert all(row.status == models.TaskStatus.DONE and row.archived_at for row in archived)
+
+    # Для клиентов архивирование - удаление: журнал и счетчики согласованы
+    for owner in (1, 2):
+        changes = crud.get_changes(db_session, owner, since=since)
+        assert len(changes.deleted) == 2
+        assert crud.get_summary(db_session, owner).by_status["done"] == 1
+        assert crud.rebuild_summary(db_session, owner).consistent
+
+    assert crud.archive_done_tasks(db_session, older_than_days=30) == 0
+
+
+def _age_changes(db, days: int):
+    db.execute(
+        update(models.TaskChange)
+        .values(changed_at=datetime.now(timezone.utc) - timedelta(days=days))
+    )
+    db.commit()
+
+
+def test_prune_changes_sends_stale_tokens_to_snapshot(db_session):
+    tasks = crud.create_tasks(db_session, 1, [schemas.TaskCreate(title=f"t{i}") for i in range(3)])
+    stale = crud.get_changes(db_session, 1, since=0).next_since
+    crud.delete_task(db_session, 1, tasks[0].id)
+    _age_changes(db_session, days=3)
+
+    # Журнал за окно активности сводки (7 дней) нужен пересчету - его не трогаем
+    assert crud.prune_changes(db_session, older_than_days=1) == 0
+    _age_changes(db_session, days=40)
+    crud.update_task(db_session, 1, tasks[1].id, schemas.TaskUpdate(title="fresh"))
+    fresh = crud.get_changes(db_session, 1, since=0).next_since
+
+    assert crud.prune_changes(db_session, older_than_days=30, batch_size=2) == 4
+    assert [row.op for row in db_session.scalars(select(models.TaskChange))] == ["updated"]
+
+    # Tombstone удаленной задачи очищен: старый токен получает снимок
+    snapshot = crud.get_changes(db_session, 1, since=stale)
+    assert snapshot.reset and snapshot.deleted == []
+    assert [db_task.id for db_task in snapshot.upserted] == [tasks[1].id, tasks[2].id]
+    assert snapshot.next_since == fresh
+    # Токен после границы очистки - обычная лента
+    assert not crud.get_changes(db_session, 1, since=fresh).reset
+    assert crud.get_changes(db_session, 1, since=snapshot.next_since).upserted == []
+
+
+def test_enqueue_key_deduplicates(db_session):
+    first = jobs.enqueue(db_session, jobs.ARCHIVE_JOB, key="archive")
+    assert first is not None
+    assert jobs.enqueue(db_session, jobs.ARCHIVE_JOB, key="archive") is None
+    assert jobs.enqueue(db_session, jobs.ARCHIVE_JOB) is not None
+    assert jobs.queue_stats(db_session) == {"queued": 2, "running": 0, "failed": 0}
+
+    with pytest.raises(ValueError):
+        jobs.enqueue(db_session, "no_such_job")
+
+
+def test_retry_delay_is_exponential_and_capped():
+    assert [jobs.retry_delay(attempt, 10, 60) for attempt in (1, 2, 3, 4)] == [10, 20, 40, 60]
+
+
+def test_pool_retries_then_succeeds(make_pool, flaky_job, db_session):
+    pool = make_pool(batch_size=5)
+    asyncio.run(pool.enqueue("flaky", {"fail_times": 2}, max_attempts=3))
+
+    # Каждая неудача возвращает задание в очередь (retry_base=0 - без паузы)
+    assert asyncio.run(pool.run_once()) == 1
+    assert asyncio.run(pool.run_once()) == 1
+    assert asyncio.run(pool.queue_stats())["queued"] == 1
+    assert asyncio.run(pool.run_once()) == 1
+
+    assert len(flaky_job) == 3
+    assert asyncio.run(pool.queue_stats()) == {"queued": 0, "running": 0, "failed": 0}
+    assert pool.stats() == {"succeeded": 1, "retried": 2, "failed": 0}
+
+
+def test_pool_backs_off_between_attempts(make_pool, flaky_job):
+    pool = make_pool(retry_base=3600, retry_max=3600)
+    asyncio.run(pool.enqueue("flaky", {"fail_times": 5}, key="flaky", max_attempts=2))
+
+    assert asyncio.run(pool.run_once()) == 1
+    # Backoff: следующая попытка еще не наступила
+    assert asyncio.run(pool.run_once()) == 0
+
+
+def test_failed_job_keeps_error_and_releases_key(make_pool, flaky_job, db_session):
+    pool = make_pool()
+    asyncio.run(pool.enqueue("flaky", {"fail_times": 5}, key="flaky", max_attempts=2))
+    asyncio.run(pool.run_once())
+    asyncio.run(pool.run_once())
+
+    assert asyncio.run(pool.queue_stats())["failed"] == 1
+    assert pool.stats()["failed"] == 1
+    if not pool.is_async:
+        job = db_session.scalars(select(models.Job)).one()
+        assert (job.attempts, job.key, job.last_error) == (2, None, "RuntimeError: boom 2")
+    # Ключ свободен - задание снова можно поставить в очередь
+    assert asyncio.run(pool.enqueue("flaky", key="flaky")) is not None
+
+
+def test_expired_lease_is_reclaimed(make_pool, flaky_job):
+    pool = make_pool(lease_seconds=-1)
+    asyncio.run(pool.enqueue("flaky"))
+
+    async def claim_and_crash():
+        # Воркер забрал задание и "упал", не отчитавшись
+        return await pool._call(jobs.claim, jobs.claim_async, 10, pool.lease_seconds)
+
+    assert len(asyncio.run(claim_and_crash())) == 1
+    assert asyncio.run(pool.run_once()) == 1
+    assert flaky_job == [0]
+    assert asyncio.run(pool.queue_stats())["running"] == 0
+
+
+def test_workers_run_scheduled_archive(make_pool, db_session):
+    db_task = crud.create_task(db_session, 1, schemas.TaskCreate(title="old"))
+    crud.update_task(db_session, 1, db_task.id, schemas.TaskUpdate(status=models.TaskStatus.DONE))
+    _age_task(db_session, db_task.id, days=40)
+
+    pool = make_pool(workers=2, poll_seconds=0.01)
+    pool.every(jobs.ARCHIVE_JOB, 3600, {"older_than_days": 30})
+
+    async def run_until_idle():
+        await pool.start()
+        try:
+            for _ in range(500):
+                await asyncio.sleep(0.01)
+                if pool.stats()["succeeded"]:
+                    break
+        finally:
+            await pool.stop()
+
+    asyncio.run(run_until_idle())
+    assert pool.stats()["succeeded"] == 1
+    assert not pool.running
+    if not pool.is_async:
+        assert db_session.scalars(select(models.TaskArchive.id)).all() == [db_task.id]
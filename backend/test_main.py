@@ -1,3 +1,7 @@
+import csv
+import io
+import json
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
@@ -5,7 +9,12 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
 # Импортируем наше приложение и зависимость
-from main import app, get_db
+from main import app, get_session_factory
+from cache import task_cache
+import auth
+import database
+import idempotency
+import metrics
 # Нам нужна Base из твоего файла database.py, чтобы создать таблицы
 from database import Base 
 # Нам нужны 'models', чтобы "зарегистрировать" таблицы в 'Base'
@@ -24,6 +33,9 @@ engine = create_engine(
     poolclass=StaticPool,
 )
 
+# Считаем SQL-запросы тестовой БД в метриках, как у настоящего движка
+metrics.instrument_engine(engine)
+
 # Создаем тестовую "фабрику сессий"
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -32,14 +44,18 @@ TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engin
 # 2. ПОДМЕНА ЗАВИСИМОСТИ (Dependency Override)
 # -------------------------------------------------------------------
 
-def override_get_db():
-    db = TestingSessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def override_get_session_factory():
+    return TestingSessionLocal
+
+app.dependency_overrides[get_session_factory] = override_get_session_factory
+
+# Режим токенов: владелец - только из подписанного токена, тестовый
+# клиент ходит от пользователя 1, другие владельцы - через owner_headers()
+database.settings.AUTH_MODE = "token"
+database.settings.AUTH_SECRET = "test-secret"
 
-app.dependency_overrides[get_db] = override_get_db
+def owner_headers(owner_id: int) -> dict:
+    return {"Authorization": f"Bearer {auth.issue_token(owner_id)}"}
 
 
 # -------------------------------------------------------------------
@@ -50,16 +66,50 @@ app.dependency_overrides[get_db] = override_get_db
 def client():
 
     # 2. Создаем ВСЕ таблицы в нашей пустой БД в памяти
+    #    и очищаем кэш (id задач в новой БД снова начнутся с 1)
     Base.metadata.create_all(bind=engine)
+    task_cache.clear()
+    idempotency.store.backend.clear()
     
     # 3. "yield" (возвращаем) клиента, чтобы тест мог его использовать
-    with TestClient(app) as c:
+    with TestClient(app, headers=owner_headers(1)) as c:
         yield c
         
     # После каждого теста:
     # 4. Уничтожаем ВСЕ таблицы, чтобы следующий тест начал с чистого листа
     Base.metadata.drop_all(bind=engine)
 
+# Тот же клиент, но в асинхронном режиме: get_db отдает AsyncSession
+# (aiosqlite), и эндпоинты вызывают *_async функции из crud.py
+@pytest.fixture(scope="function")
+def async_client():
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    AsyncTestingSessionLocal = async_sessionmaker(
+        async_engine, autoflush=False, expire_on_commit=False
+    )
+
+    def override_get_async_session_factory():
+        return AsyncTestingSessionLocal
+
+    async def create_tables():
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    app.dependency_overrides[get_session_factory] = override_get_async_session_factory
+    task_cache.clear()
+    idempotency.store.backend.clear()
+    try:
+        with TestClient(app, headers=owner_headers(1)) as c:
+            # Таблицы создаем в том же event loop, где работает приложение
+            c.portal.call(create_tables)
+            yield c
+            c.portal.call(async_engine.dispose)
+    finally:
+        app.dependency_overrides[get_session_factory] = override_get_session_factory
+
 # -------------------------------------------------------------------
 # 4. НАШИ ТЕСТЫ
 # -------------------------------------------------------------------
@@ -184,3 +234,817 @@ def test_delete_task_not_found(client):
     response = client.delete("/tasks/999")
     assert response.status_code == 404
     assert response.json() == {"detail": "Task not found"}
+
+def test_read_tasks_cursor_pagination(client):
+    """Тестируем курсорную пагинацию: проходим все страницы по X-Next-Cursor"""
+    for i in range(5):
+        client.post("/tasks/", json={"title": f"Task {i}"})
+
+    titles = []
+    response = client.get("/tasks/", params={"limit": 2})
+    while True:
+        assert response.status_code == 200
+        titles += [t["title"] for t in response.json()]
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if not next_cursor:
+            break
+        response = client.get("/tasks/", params={"limit": 2, "cursor": next_cursor})
+
+    # Ни одна задача не повторилась и не пропала
+    assert titles == [f"Task {i}" for i in range(5)]
+
+def test_read_tasks_cursor_by_updated_at(client):
+    """Тестируем курсор по (updated_at, id): задачи с одинаковым временем не теряются"""
+    for i in range(3):
+        client.post("/tasks/", json={"title": f"Task {i}"})
+
+    first = client.get("/tasks/", params={"limit": 2, "sort": "updated_at"})
+    second = client.get(
+        "/tasks/",
+        params={"limit": 2, "sort": "updated_at", "cursor": first.headers["X-Next-Cursor"]},
+    )
+    assert [t["id"] for t in first.json() + second.json()] == [1, 2, 3]
+    assert "X-Next-Cursor" not in second.headers
+
+def test_read_tasks_invalid_cursor(client):
+    """Тестируем, что поврежденный курсор дает 400, а не 500"""
+    response = client.get("/tasks/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+
+def test_read_tasks_rejects_out_of_range_paging(client):
+    """Тестируем, что limit/skip вне диапазона дают 422, а не 500"""
+    client.post("/tasks/", json={"title": "Task"})
+    for params in ({"limit": 0}, {"limit": -1}, {"limit": 1001}, {"skip": -1}):
+        assert client.get("/tasks/", params=params).status_code == 422
+
+def test_read_tasks_skip_still_works(client):
+    """Тестируем, что старые клиенты со skip/limit получают стабильный порядок"""
+    for i in range(3):
+        client.post("/tasks/", json={"title": f"Task {i}"})
+
+    response = client.get("/tasks/", params={"skip": 1, "limit": 1})
+    assert response.status_code == 200
+    assert [t["title"] for t in response.json()] == ["Task 1"]
+    # Даже в режиме skip ответ подсказывает курсор для перехода на keyset
+    assert "X-Next-Cursor" in response.headers
+
+def test_read_tasks_filter_by_status(client):
+    """Тестируем фильтр по статусу на стороне сервера"""
+    for i in range(4):
+        task_id = client.post("/tasks/", json={"title": f"Task {i}"}).json()["id"]
+        if i % 2:
+            client.put(f"/tasks/{task_id}", json={"status": "done"})
+
+    response = client.get("/tasks/", params={"status": "done"})
+    assert response.status_code == 200
+    assert [t["title"] for t in response.json()] == ["Task 1", "Task 3"]
+
+    # Некорректный статус отклоняется валидацией
+    assert client.get("/tasks/", params={"status": "archived"}).status_code == 422
+
+def test_read_tasks_title_prefix(client):
+    """Тестируем поиск по префиксу названия (спецсимволы LIKE экранируются)"""
+    for title in ["Report Q1", "Report Q2", "Meeting", "100% done"]:
+        client.post("/tasks/", json={"title": title})
+
+    response = client.get("/tasks/", params={"title_prefix": "Report"})
+    assert [t["title"] for t in response.json()] == ["Report Q1", "Report Q2"]
+
+    response = client.get("/tasks/", params={"title_prefix": "100%"})
+    assert [t["title"] for t in response.json()] == ["100% done"]
+    assert client.get("/tasks/", params={"title_prefix": "%"}).json() == []
+
+def test_read_tasks_sort_desc_with_cursor(client):
+    """Тестируем сортировку по убыванию вместе с курсором"""
+    for i in range(3):
+        client.post("/tasks/", json={"title": f"Task {i}"})
+
+    first = client.get("/tasks/", params={"limit": 2, "sort": "-id"})
+    second = client.get(
+        "/tasks/",
+        params={"limit": 2, "sort": "-id", "cursor": first.headers["X-Next-Cursor"]},
+    )
+    assert [t["id"] for t in first.json() + second.json()] == [3, 2, 1]
+
+    # Курсор от другой сортировки не принимается
+    response = client.get(
+        "/tasks/", params={"sort": "id", "cursor": first.headers["X-Next-Cursor"]}
+    )
+    assert response.status_code == 400
+
+def test_read_tasks_date_range(client):
+    """Тестируем фильтр по диапазону дат создания"""
+    client.post("/tasks/", json={"title": "Task"})
+
+    assert len(client.get("/tasks/", params={"created_after": "2000-01-01T00:00:00Z"}).json()) == 1
+    assert client.get("/tasks/", params={"created_before": "2000-01-01T00:00:00Z"}).json() == []
+
+def test_bulk_create_tasks(client):
+    """Тестируем массовое создание: один запрос - много задач"""
+    response = client.post(
+        "/tasks/bulk",
+        json=[{"title": "Bulk 1"}, {"title": "Bulk 2", "description": "Desc"}],
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["status"] for item in data] == ["created", "created"]
+    assert [item["index"] for item in data] == [0, 1]
+    assert data[1]["task"]["description"] == "Desc"
+    assert data[0]["task"]["status"] == "todo"
+
+    assert [t["title"] for t in client.get("/tasks/").json()] == ["Bulk 1", "Bulk 2"]
+
+    # Пустой пакет отклоняется валидацией
+    assert client.post("/tasks/bulk", json=[]).status_code == 422
+
+def test_bulk_update_tasks(client):
+    """Тестируем массовое обновление с отчетом по каждому элементу"""
+    client.post("/tasks/bulk", json=[{"title": "A"}, {"title": "B"}])
+
+    response = client.patch(
+        "/tasks/bulk",
+        json=[
+            {"id": 1, "status": "done"},
+            {"id": 2, "title": "B2", "status": "in_progress"},
+            {"id": 999, "status": "done"},
+        ],
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["status"] for item in data] == ["updated", "updated", "not_found"]
+    assert data[0]["task"]["status"] == "done"
+    assert data[0]["task"]["title"] == "A"
+    assert data[1]["task"]["title"] == "B2"
+    assert data[2]["task"] is None
+
+    assert client.get("/tasks/2").json()["status"] == "in_progress"
+
+def test_bulk_delete_tasks(client):
+    """Тестируем массовое удаление (повторный id - уже not_found)"""
+    client.post("/tasks/bulk", json=[{"title": "A"}, {"title": "B"}, {"title": "C"}])
+
+    response = client.request("DELETE", "/tasks/bulk", json={"ids": [1, 3, 3, 42]})
+    assert response.status_code == 200
+    assert [item["status"] for item in response.json()] == [
+        "deleted", "deleted", "not_found", "not_found"
+    ]
+    assert [t["title"] for t in client.get("/tasks/").json()] == ["B"]
+
+def test_export_tasks(client, monkeypatch):
+    """Тестируем потоковый экспорт: NDJSON и CSV, несколько пачек, фильтры"""
+    import crud
+    monkeypatch.setattr(crud, "EXPORT_BATCH_SIZE", 2)
+    client.post("/tasks/bulk", json=[{"title": f"T{i}"} for i in range(5)])
+    client.put("/tasks/3", json={"status": "done", "description": 'a "quoted", text'})
+
+    response = client.get("/tasks/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.text.splitlines()
+    assert [json.loads(line) for line in lines] == client.get("/tasks/").json()
+
+    response = client.get("/tasks/export", params={"format": "csv", "status": "done"})
+    assert response.headers["content-disposition"] == 'attachment; filename="tasks.csv"'
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == ["title", "description", "id", "status", "created_at", "updated_at"]
+    assert rows[1][:4] == ["T2", 'a "quoted", text', "3", "done"]
+    assert len(rows) == 2
+
+def test_import_tasks_ndjson(client, monkeypatch):
+    """Тестируем потоковый импорт NDJSON: пачки, отчет об ошибочных строках"""
+    import importer
+    monkeypatch.setattr(importer, "IMPORT_CHUNK_SIZE", 2)
+    body = "\n".join([
+        '{"title": "I1", "description": "D1"}',
+        '{"title": "I2"}',
+        "",
+        "not json",
+        '{"description": "no title"}',
+        '{"title": "I3"}',
+    ])
+    response = client.post("/tasks/import", content=body.encode())
+    assert response.status_code == 200
+    assert response.json() == {
+        "imported": 3,
+        "failed": 2,
+        "errors": [
+            {"line": 4, "error": "Invalid JSON"},
+            {"line": 5, "error": "title: Field required"},
+        ],
+    }
+    tasks = client.get("/tasks/").json()
+    assert [(t["title"], t["status"]) for t in tasks] == [
+        ("I1", "todo"), ("I2", "todo"), ("I3", "todo")
+    ]
+    # Импорт попадает в ленту изменений, как и обычное создание
+    assert len(client.get("/tasks/changes").json()["upserted"]) == 3
+
+def test_import_tasks_csv_roundtrip(client):
+    """CSV-экспорт можно загрузить обратно (лишние колонки игнорируются)"""
+    client.post("/tasks/bulk", json=[
+        {"title": "Multi", "description": 'line 1\nline "2"'},
+        {"title": "Plain"},
+    ])
+    exported = client.get("/tasks/export", params={"format": "csv"}).content
+
+    response = client.post("/tasks/import", params={"format": "csv"}, content=exported)
+    assert response.json() == {"imported": 2, "failed": 0, "errors": []}
+    titles = [(t["title"], t["description"]) for t in client.get("/tasks/").json()]
+    assert titles[2:] == titles[:2] == [("Multi", 'line 1\nline "2"'), ("Plain", None)]
+
+    bad = "title,description\n,no title\nA,B,C\n"
+    response = client.post("/tasks/import", params={"format": "csv"}, content=bad)
+    assert response.json()["errors"] == [
+        {"line": 2, "error": "title: Field required"},
+        {"line": 3, "error": "Expected 2 columns, got 3"},
+    ]
+
+def test_import_reports_invalid_utf8_per_line(client):
+    """Строка не в UTF-8 - ошибка в отчете, а не 500 посреди импорта"""
+    body = b'{"title": "ok"}\n{"title": "bad \xff"}\n{"title": "ok 2"}\n'
+    assert client.post("/tasks/import", content=body).json() == {
+        "imported": 2, "failed": 1, "errors": [{"line": 2, "error": "Invalid UTF-8"}],
+    }
+
+    # CSV: битая строка обрывает незакрытую многострочную запись
+    body = b'title,description\nA,"multi\nbad \xff\nB,\n'
+    assert client.post("/tasks/import", params={"format": "csv"}, content=body).json() == {
+        "imported": 1, "failed": 1, "errors": [{"line": 2, "error": "Invalid UTF-8"}],
+    }
+    assert [t["title"] for t in client.get("/tasks/").json()] == ["ok", "ok 2", "B"]
+
+def test_import_rejects_oversized_line(client, monkeypatch):
+    """Слишком длинная строка не копится в памяти целиком: импорт прерывается с 413"""
+    import asyncio
+
+    import importer
+    monkeypatch.setattr(importer, "IMPORT_MAX_LINE_BYTES", 64)
+
+    async def endless_line():
+        # Перевода строки нет вовсе - предел срабатывает по мере чтения
+        yield b'{"title": "ok"}\n'
+        while True:
+            yield b"x" * 32
+
+    async def read_all():
+        return [item async for item in importer.iter_records(endless_line(), "ndjson")]
+
+    with pytest.raises(importer.RecordTooLarge) as exc:
+        asyncio.run(read_all())
+    assert exc.value.line == 2
+
+    body = b'{"title": "ok"}\n{"title": "' + b"x" * 100 + b'"}\n'
+    response = client.post("/tasks/import", content=body)
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Line 2 exceeds 64 bytes"}
+
+    # CSV: предел действует на всю многострочную запись
+    body = 'title,description\nA,"' + "line\n" * 20 + '"\n'
+    response = client.post("/tasks/import", params={"format": "csv"}, content=body)
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Line 2 exceeds 64 bytes"}
+
+def test_summary_counters(client):
+    """Тестируем сводку: счетчики следуют за каждой записью, без пересчета таблицы"""
+    client.post("/tasks/bulk", json=[{"title": f"T{i}"} for i in range(4)])
+    client.put("/tasks/1", json={"status": "done"})
+    client.put("/tasks/1", json={"title": "same status"})
+    client.patch("/tasks/bulk", json=[{"id": 2, "status": "in_progress"}, {"id": 3, "status": "done"}])
+    client.delete("/tasks/4")
+    client.post("/tasks/import", content=b'{"title": "Imported"}')
+
+    summary = client.get("/tasks/summary").json()
+    assert summary["total"] == 4
+    assert summary["by_status"] == {"todo": 1, "in_progress": 1, "done": 2}
+    assert summary["last_24h"] == {"created": 5, "updated": 4, "deleted": 1}
+    assert summary["last_7d"] == summary["last_24h"]
+
+    # Счетчики согласованы - пересчет ничего не меняет
+    rebuilt = client.post("/tasks/summary/rebuild").json()
+    assert rebuilt == {"consistent": True, "drift": {}, "summary": summary}
+
+def test_summary_rebuild_fixes_drift(client):
+    """Счетчики, испорченные в обход API, восстанавливаются пересчетом"""
+    import models
+    client.post("/tasks/bulk", json=[{"title": "A"}, {"title": "B"}])
+    with TestingSessionLocal() as db:
+        db.query(models.TaskCounter).delete()
+        db.query(models.TaskActivity).delete()
+        db.commit()
+    assert client.get("/tasks/summary").json()["total"] == 0
+
+    rebuilt = client.post("/tasks/summary/rebuild").json()
+    assert rebuilt["consistent"] is False
+    assert rebuilt["drift"] == {"todo": -2}
+    assert rebuilt["summary"]["by_status"]["todo"] == 2
+    assert rebuilt["summary"]["last_24h"]["created"] == 2
+    assert client.get("/tasks/summary").json() == rebuilt["summary"]
+
+def test_search_tasks(client):
+    """Тестируем полнотекстовый поиск: ранжирование, страницы, синхронизация индекса"""
+    client.post("/tasks/bulk", json=[
+        {"title": "Fix login bug", "description": "Login fails on mobile"},
+        {"title": "Write docs", "description": "Mention the login flow"},
+        {"title": "Deploy", "description": "Release 1.2"},
+        {"title": "Login page redesign"},
+    ])
+    client.put("/tasks/4", json={"status": "done"})
+
+    def search(**params):
+        response = client.get("/tasks/search", params=params)
+        assert response.status_code == 200
+        return [task["title"] for task in response.json()], response.headers.get("X-Next-Skip")
+
+    # "login" дважды в задаче 1 - она релевантнее; слова объединяются через AND
+    titles, _ = search(q="login")
+    assert titles[0] == "Fix login bug"
+    assert sorted(titles) == ["Fix login bug", "Login page redesign", "Write docs"]
+    assert search(q="login mobile") == (["Fix login bug"], None)
+    assert search(q="login", status="done") == (["Login page redesign"], None)
+
+    first, next_skip = search(q="login", limit=2)
+    assert next_skip == "2"
+    assert first + search(q="login", limit=2, skip=2)[0] == titles
+
+    # Операторы FTS5 во вводе - просто слова; fuzzy на SQLite ищет по префиксу
+    assert search(q='deploy" OR "docs') == ([], None)
+    assert search(q="redes") == ([], None)
+    assert search(q="redes", fuzzy=True) == (["Login page redesign"], None)
+    assert search(q="!!!") == ([], None)
+
+    # Индекс следует за обновлениями и удалениями
+    client.put("/tasks/3", json={"title": "Deploy login service"})
+    client.delete("/tasks/1")
+    assert sorted(search(q="login")[0]) == ["Deploy login service", "Login page redesign", "Write docs"]
+    assert client.get("/tasks/search").status_code == 422
+
+def test_owners_are_isolated(client):
+    """Тестируем разделение по владельцам: владелец - из токена"""
+    alice, bob = owner_headers(1), owner_headers(2)
+    mine = client.post("/tasks/", json={"title": "Alice task"}, headers=alice).json()
+    theirs = client.post("/tasks/", json={"title": "Bob task"}, headers=bob).json()
+
+    assert [t["title"] for t in client.get("/tasks/", headers=alice).json()] == ["Alice task"]
+    assert [t["title"] for t in client.get("/tasks/", headers=bob).json()] == ["Bob task"]
+
+    # Чужая задача для владельца не существует: 404, а не 403
+    assert client.get(f"/tasks/{theirs['id']}", headers=alice).status_code == 404
+    assert client.put(f"/tasks/{theirs['id']}", json={"title": "X"}, headers=alice).status_code == 404
+    assert client.delete(f"/tasks/{theirs['id']}", headers=alice).status_code == 404
+    bulk = client.request("DELETE", "/tasks/bulk", json={"ids": [theirs["id"]]}, headers=alice)
+    assert bulk.json()[0]["status"] == "not_found"
+    assert client.get(f"/tasks/{theirs['id']}", headers=bob).json()["title"] == "Bob task"
+
+    assert client.get("/tasks/summary", headers=bob).json()["total"] == 1
+    found = client.get("/tasks/search", params={"q": "task"}, headers=bob).json()
+    assert [t["id"] for t in found] == [theirs["id"]]
+    changes = client.get("/tasks/changes", headers=alice).json()
+    assert [t["id"] for t in changes["upserted"]] == [mine["id"]]
+    export = client.get("/tasks/export", headers=bob).text.splitlines()
+    assert [json.loads(line)["id"] for line in export] == [theirs["id"]]
+
+    # Запись Боба не меняет ETag списка Алисы
+    etag = client.get("/tasks/", headers=alice).headers["ETag"]
+    client.post("/tasks/", json={"title": "Bob again"}, headers=bob)
+    assert client.get("/tasks/", headers={**alice, "If-None-Match": etag}).status_code == 304
+
+
+def test_owner_requires_verified_token(client):
+    """Без токена или с неподписанным/чужим токеном - 401, заголовку владельца не верим"""
+    client.post("/tasks/", json={"title": "Alice task"})
+    forged = auth.issue_token(1, secret="attacker-secret")
+    token = auth.issue_token(1)
+    for authorization in ("", "Bearer", f"Basic {token}", f"Bearer {forged}",
+                          f"Bearer {token[:-2]}xx", f"Bearer {auth.issue_token(0)}"):
+        response = client.get("/tasks/", headers={"Authorization": authorization, "X-Owner-Id": "1"})
+        assert response.status_code == 401, authorization
+        assert response.headers["WWW-Authenticate"] == "Bearer"
+
+    # Просроченный токен
+    with pytest.raises(auth.InvalidToken):
+        auth.verify_token(token, "test-secret", max_age=-1)
+
+    # Сервер без секрета не пускает никого
+    database.settings.AUTH_SECRET = None
+    try:
+        assert client.get("/tasks/").status_code == 401
+    finally:
+        database.settings.AUTH_SECRET = "test-secret"
+    assert [t["title"] for t in client.get("/tasks/").json()] == ["Alice task"]
+
+def test_single_owner_mode_needs_no_token(client):
+    """AUTH_MODE=single: все запросы - задачи DEFAULT_OWNER_ID, токены не нужны и не учитываются"""
+    client.post("/tasks/", json={"title": "Shared"})
+    database.settings.AUTH_MODE = "single"
+    try:
+        for headers in ({"Authorization": ""}, owner_headers(2)):
+            response = client.get("/tasks/", headers=headers)
+            assert [t["title"] for t in response.json()] == ["Shared"]
+        client.post("/tasks/", json={"title": "Also shared"}, headers=owner_headers(2))
+    finally:
+        database.settings.AUTH_MODE = "token"
+    assert len(client.get("/tasks/").json()) == 2
+
+def test_idempotency_key_replays_writes(client, monkeypatch):
+    """Тестируем Idempotency-Key: повтор не создает дубликат и не вызывает CRUD"""
+    import crud
+
+    calls = []
+    create_task = crud.create_task
+    monkeypatch.setattr(
+        crud, "create_task", lambda *args, **kwargs: calls.append(1) or create_task(*args, **kwargs)
+    )
+
+    key = {"Idempotency-Key": "create-1"}
+    first = client.post("/tasks/", json={"title": "Once"}, headers=key)
+    replay = client.post("/tasks/", json={"title": "Once"}, headers=key)
+    assert replay.status_code == 200
+    assert replay.json() == first.json()
+    assert replay.headers["ETag"] == first.headers["ETag"]
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert calls == [1]
+    assert len(client.get("/tasks/").json()) == 1
+
+    # Тот же ключ для другого запроса - ошибка клиента
+    assert client.post("/tasks/", json={"title": "Other"}, headers=key).status_code == 422
+    # У другого владельца свои ключи; без ключа - обычная запись
+    other_owner = {**key, **owner_headers(2)}
+    assert client.post("/tasks/", json={"title": "Once"}, headers=other_owner).json()["id"] == 2
+    client.post("/tasks/", json={"title": "Once"})
+    assert calls == [1, 1, 1]
+
+    # PUT: повтор отдает тот же ответ, даже если задачу успели изменить
+    task_id = first.json()["id"]
+    put_key = {"Idempotency-Key": "put-1"}
+    updated = client.put(f"/tasks/{task_id}", json={"status": "done"}, headers=put_key).json()
+    client.put(f"/tasks/{task_id}", json={"title": "Changed"})
+    assert client.put(f"/tasks/{task_id}", json={"status": "done"}, headers=put_key).json() == updated
+
+    # Ошибки не сохраняются: 404 на повторе вычисляется заново
+    missing_key = {"Idempotency-Key": "put-404"}
+    assert client.put("/tasks/999", json={"title": "X"}, headers=missing_key).status_code == 404
+    assert client.put("/tasks/999", json={"title": "X"}, headers=missing_key).status_code == 404
+
+    bulk_key = {"Idempotency-Key": "bulk-1"}
+    batch = [{"title": "B1"}, {"title": "B2"}]
+    assert client.post("/tasks/bulk", json=batch, headers=bulk_key).json() == \
+        client.post("/tasks/bulk", json=batch, headers=bulk_key).json()
+    assert len(client.get("/tasks/").json()) == 4
+
+def test_metrics_endpoint(client):
+    """Тестируем /metrics: маршрут - шаблон пути, счетчики, SQL на запрос"""
+    # Реестр общий на процесс - сравниваем прирост, а не абсолютные значения
+    before = metrics.http_requests.value("GET", "/tasks/{task_id}", 200)
+    client.post("/tasks/", json={"title": "M"})
+    client.get("/tasks/1")
+    client.get("/tasks/1")
+    client.get("/nope")
+
+    body = client.get("/metrics").text
+    assert metrics.http_requests.value("GET", "/tasks/{task_id}", 200) == before + 2
+    assert 'http_requests_total{method="GET",route="/tasks/{task_id}",status="200"}' in body
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"}' in body
+    assert 'http_request_db_queries_count{method="POST",route="/tasks/"}' in body
+    assert "http_requests_in_flight 0" in body
+    assert 'task_cache_requests{name="hits"}' in body
+    # Сам /metrics не учитывается
+    assert 'route="/metrics"' not in body
+
+
+def test_metrics_keep_streams_out_of_latency():
+    """SSE-подключение не попадает ни в задержку, ни в "в полете" - только в свою метрику"""
+    import asyncio
+    from types import SimpleNamespace
+
+    seen_in_flight = []
+
+    async def stream_app(scope, receive, send):
+        scope["route"] = SimpleNamespace(path=scope["path"])
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        seen_in_flight.append(metrics.http_in_flight.value())
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def noop(message):
+        pass
+
+    middleware = metrics.MetricsMiddleware(stream_app, stream_paths=("/tasks/stream",))
+    before = (metrics.http_latency.count("GET", "/tasks/stream"),
+              metrics.http_stream_duration.count("GET", "/tasks/stream"))
+    in_flight = metrics.http_in_flight.value()
+    asyncio.run(middleware({"type": "http", "method": "GET", "path": "/tasks/stream"}, None, noop))
+
+    assert seen_in_flight == [in_flight]
+    assert metrics.http_latency.count("GET", "/tasks/stream") == before[0]
+    assert metrics.http_stream_duration.count("GET", "/tasks/stream") == before[1] + 1
+    assert metrics.http_requests.value("GET", "/tasks/stream", 200) >= 1
+
+    # Обычный запрос по-прежнему "в полете" и в гистограмме задержки
+    asyncio.run(middleware({"type": "http", "method": "GET", "path": "/tasks/"}, None, noop))
+    assert seen_in_flight[-1] == in_flight + 1
+    assert metrics.http_latency.count("GET", "/tasks/") >= 1
+
+
+def test_async_mode_crud_flow(async_client):
+    """Тестируем полный цикл CRUD через AsyncSession"""
+    created = async_client.post("/tasks/", json={"title": "Async", "description": "Desc"})
+    assert created.status_code == 200
+    task_id = created.json()["id"]
+
+    updated = async_client.put(f"/tasks/{task_id}", json={"status": "done"})
+    assert updated.json()["status"] == "done"
+    assert updated.json()["title"] == "Async"
+
+    bulk = async_client.post("/tasks/bulk", json=[{"title": "B1"}, {"title": "B2"}])
+    assert [item["status"] for item in bulk.json()] == ["created", "created"]
+
+    page = async_client.get("/tasks/", params={"limit": 2, "status": "todo"})
+    assert [t["title"] for t in page.json()] == ["B1", "B2"]
+
+    assert async_client.get(f"/tasks/{task_id}").json()["status"] == "done"
+    exported = async_client.get("/tasks/export").text.splitlines()
+    assert [json.loads(line)["title"] for line in exported] == ["Async", "B1", "B2"]
+    imported = async_client.post("/tasks/import", content="\n".join(exported))
+    assert imported.json()["imported"] == 3
+    summary = async_client.get("/tasks/summary").json()
+    assert summary["by_status"] == {"todo": 5, "in_progress": 0, "done": 1}
+    assert async_client.post("/tasks/summary/rebuild").json()["consistent"] is True
+    found = async_client.get("/tasks/search", params={"q": "desc", "fuzzy": True}).json()
+    assert [t["id"] for t in found] == [task_id, 4]
+    assert async_client.delete(f"/tasks/{task_id}").status_code == 200
+    assert async_client.get(f"/tasks/{task_id}").status_code == 404
+
+def test_health_db(client):
+    """Тестируем /health/db: пинг БД и состояние пула"""
+    response = client.get("/health/db")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "ok"
+    # В тестах пул - StaticPool (без счетчиков), но класс отдается всегда
+    assert data["pool"]["class"] == "StaticPool"
+
+def test_health_jobs(client):
+    """Тестируем /health/jobs: очередь пуста, воркеры в тестах не запущены"""
+    response = client.get("/health/jobs")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["queue"] == {"queued": 0, "running": 0, "failed": 0}
+    assert data["workers"] == 0
+
+def test_read_task_is_cached_and_invalidated(client):
+    """Тестируем кэш чтения: второй GET - попадание, запись сбрасывает кэш"""
+    task_id = client.post("/tasks/", json={"title": "Cached"}).json()["id"]
+
+    client.get(f"/tasks/{task_id}")
+    client.get(f"/tasks/{task_id}")
+    client.get("/tasks/")
+    client.get("/tasks/")
+    stats = client.get("/health/cache").json()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+
+    # После обновления и одиночная задача, и список отдают новые данные
+    client.put(f"/tasks/{task_id}", json={"title": "Updated"})
+    assert client.get(f"/tasks/{task_id}").json()["title"] == "Updated"
+    assert client.get("/tasks/").json()[0]["title"] == "Updated"
+
+    client.delete(f"/tasks/{task_id}")
+    assert client.get(f"/tasks/{task_id}").status_code == 404
+    assert client.get("/tasks/").json() == []
+
+def test_read_racing_write_does_not_cache_stale_task(client, monkeypatch):
+    """GET прочитал строку до PUT, а ответ положил после: в кэш она не попадает"""
+    import crud
+    task_id = client.post("/tasks/", json={"title": "Old"}).json()["id"]
+    get_task = crud.get_task
+
+    def get_task_then_write(db, owner_id, task_id):
+        db_task = get_task(db, owner_id, task_id)
+        # Конкурентный PUT коммитится, пока чтение еще не заполнило кэш
+        monkeypatch.setattr(crud, "get_task", get_task)
+        client.put(f"/tasks/{task_id}", json={"title": "New"})
+        return db_task
+
+    monkeypatch.setattr(crud, "get_task", get_task_then_write)
+    assert client.get(f"/tasks/{task_id}").json()["title"] == "Old"
+
+    response = client.get(f"/tasks/{task_id}")
+    assert response.json()["title"] == "New"
+    assert response.headers["ETag"] == f'"{task_id}.2"'
+
+def test_read_flight_outlives_initiator_and_splits_on_write(client, monkeypatch):
+    """Схлопнутое чтение идет в своей сессии; GET после записи ждет новое чтение"""
+    import asyncio
+    import threading
+
+    import httpx
+
+    import crud
+    task_id = client.post("/tasks/", json={"title": "Old"}).json()["id"]
+    get_task = crud.get_task
+    release = threading.Event()
+    loads = []
+
+    def slow_get_task(db, owner_id, task_id):
+        db_task = get_task(db, owner_id, task_id)
+        loads.append(db_task.title)
+        # Первое чтение "зависает", пока тест его не отпустит
+        if len(loads) == 1:
+            release.wait(5)
+        return db_task
+
+    monkeypatch.setattr(crud, "get_task", slow_get_task)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test", headers=owner_headers(1)
+        ) as http:
+            first = asyncio.create_task(http.get(f"/tasks/{task_id}"))
+            while not loads:
+                await asyncio.sleep(0.01)
+            joined = asyncio.create_task(http.get(f"/tasks/{task_id}"))
+            await asyncio.sleep(0.05)
+            # Клиент, начавший чтение, ушел - остальные все равно получат ответ
+            first.cancel()
+            await asyncio.gather(first, return_exceptions=True)
+
+            await http.put(f"/tasks/{task_id}", json={"title": "New"})
+            after_write = await http.get(f"/tasks/{task_id}")
+            release.set()
+            return await joined, after_write
+
+    joined, after_write = asyncio.run(scenario())
+    assert joined.json()["title"] == "Old"
+    assert after_write.json()["title"] == "New"
+    assert loads == ["Old", "New"]
+
+def test_task_etag_not_modified(client):
+    """Тестируем ETag задачи: If-None-Match -> 304 без тела"""
+    task_id = client.post("/tasks/", json={"title": "ETag"}).json()["id"]
+
+    response = client.get(f"/tasks/{task_id}")
+    etag = response.headers["ETag"]
+    assert etag == f'"{task_id}.1"'
+
+    # И из БД, и из кэша - 304 без тела
+    for _ in range(2):
+        response = client.get(f"/tasks/{task_id}", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+
+    # После изменения ETag другой - снова 200
+    client.put(f"/tasks/{task_id}", json={"status": "done"})
+    response = client.get(f"/tasks/{task_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == f'"{task_id}.2"'
+
+def test_list_etag_changes_on_write(client):
+    """Тестируем ETag списка: он меняется при любой записи в таблицу"""
+    client.post("/tasks/", json={"title": "A"})
+    etag = client.get("/tasks/").headers["ETag"]
+
+    assert client.get("/tasks/", headers={"If-None-Match": etag}).status_code == 304
+    # Другие параметры - другое представление и другой ETag
+    assert client.get("/tasks/?limit=1", headers={"If-None-Match": etag}).status_code == 200
+
+    client.post("/tasks/", json={"title": "B"})
+    response = client.get("/tasks/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert len(response.json()) == 2
+
+def test_update_task_if_match(client):
+    """Тестируем оптимистичную блокировку через If-Match"""
+    created = client.post("/tasks/", json={"title": "Shared"})
+    etag = created.headers["ETag"]
+    task_id = created.json()["id"]
+
+    # Первый клиент обновляет по своему ETag - успешно
+    first = client.put(f"/tasks/{task_id}", json={"title": "Mine"}, headers={"If-Match": etag})
+    assert first.status_code == 200
+    assert first.headers["ETag"] != etag
+
+    # Второй клиент с тем же (устаревшим) ETag получает 412
+    second = client.put(f"/tasks/{task_id}", json={"title": "Theirs"}, headers={"If-Match": etag})
+    assert second.status_code == 412
+    assert client.get(f"/tasks/{task_id}").json()["title"] == "Mine"
+
+    # ETag другой задачи или мусор - тоже 412, несуществующая задача - 404
+    assert client.put(f"/tasks/{task_id}", json={}, headers={"If-Match": '"999.1"'}).status_code == 412
+    assert client.put("/tasks/999", json={"title": "X"}, headers={"If-Match": '"999.1"'}).status_code == 404
+
+def test_changes_feed(client):
+    """Тестируем ленту изменений: только то, что изменилось после токена"""
+    client.post("/tasks/bulk", json=[{"title": "A"}, {"title": "B"}, {"title": "C"}])
+
+    # Первая синхронизация с нуля
+    initial = client.get("/tasks/changes", params={"since": 0}).json()
+    assert [t["title"] for t in initial["upserted"]] == ["A", "B", "C"]
+    assert initial["deleted"] == []
+    assert initial["has_more"] is False
+    assert initial["reset"] is True
+    token = initial["next_since"]
+
+    # Без изменений - пустой ответ и тот же токен
+    empty = client.get("/tasks/changes", params={"since": token}).json()
+    assert empty == {
+        "upserted": [], "deleted": [], "next_since": token, "has_more": False,
+        "reset": False, "cursor": None,
+    }
+
+    client.put("/tasks/1", json={"status": "done"})
+    client.put("/tasks/1", json={"title": "A2"})
+    client.delete("/tasks/2")
+    client.post("/tasks/", json={"title": "D"})
+
+    changes = client.get("/tasks/changes", params={"since": token}).json()
+    # Два обновления задачи 1 схлопнулись в одно текущее состояние
+    assert [(t["id"], t["title"], t["status"]) for t in changes["upserted"]] == [
+        (1, "A2", "done"), (4, "D", "todo")
+    ]
+    assert changes["deleted"] == [2]
+    assert changes["next_since"] > token
+
+def test_changes_feed_paging(client):
+    """Тестируем постраничную выдачу ленты (has_more / next_since)"""
+    client.post("/tasks/bulk", json=[{"title": f"T{i}"} for i in range(5)])
+    token = client.get("/tasks/changes", params={"since": 0}).json()["next_since"]
+    client.post("/tasks/bulk", json=[{"title": f"U{i}"} for i in range(5)])
+
+    seen, since = [], token
+    while True:
+        page = client.get("/tasks/changes", params={"since": since, "limit": 2}).json()
+        seen += [t["title"] for t in page["upserted"]]
+        since = page["next_since"]
+        if not page["has_more"]:
+            break
+    assert seen == [f"U{i}" for i in range(5)]
+
+def test_changes_snapshot_paging(client):
+    """Первая синхронизация - снимок по курсору; изменения во время него - в ленте после"""
+    ids = [t["id"] for t in client.post("/tasks/bulk", json=[{"title": f"T{i}"} for i in range(5)]).json()]
+
+    page = client.get("/tasks/changes", params={"since": 0, "limit": 2}).json()
+    assert page["reset"] is True and page["has_more"] is True
+    seen, watermark = [t["title"] for t in page["upserted"]], page["next_since"]
+
+    # Пока клиент листает снимок, уже прочитанную задачу меняют, а непрочитанную удаляют
+    client.put(f"/tasks/{ids[0]}", json={"title": "T0 new"})
+    client.delete(f"/tasks/{ids[4]}")
+
+    while page["has_more"]:
+        page = client.get("/tasks/changes", params={"cursor": page["cursor"], "limit": 2}).json()
+        assert page["reset"] is False and page["next_since"] == watermark
+        seen += [t["title"] for t in page["upserted"]]
+    assert seen == ["T0", "T1", "T2", "T3"]
+
+    changes = client.get("/tasks/changes", params={"since": watermark}).json()
+    assert [t["title"] for t in changes["upserted"]] == ["T0 new"]
+    assert changes["deleted"] == [ids[4]]
+
+    assert client.get("/tasks/changes", params={"cursor": "garbage"}).status_code == 400
+
+def test_changes_snapshot_watermark_is_per_owner(client):
+    """
+    Граница снимка - последний id журнала своего владельца: запись другого
+    владельца с большим id не "перепрыгивает" еще не закоммиченную свою
+    """
+    from sqlalchemy import insert, update
+
+    import models
+
+    task_id = client.post("/tasks/", json={"title": "Mine"}).json()["id"]
+    with TestingSessionLocal() as db:
+        # Другой владелец закоммитил запись с id 10 ...
+        db.execute(insert(models.TaskChange).values(id=10, owner_id=2, task_id=999, op="created"))
+        db.commit()
+
+    snapshot = client.get("/tasks/changes", params={"since": 0}).json()
+    assert snapshot["reset"] is True and snapshot["next_since"] < 5
+
+    with TestingSessionLocal() as db:
+        # ... а запись первого владельца с id 5 закоммитилась уже после снимка
+        db.execute(update(models.Task).where(models.Task.id == task_id).values(title="Late"))
+        db.execute(insert(models.TaskChange).values(id=5, owner_id=1, task_id=task_id, op="updated"))
+        db.commit()
+
+    changes = client.get("/tasks/changes", params={"since": snapshot["next_since"]}).json()
+    assert [t["title"] for t in changes["upserted"]] == ["Late"]
+
+def test_auth_cli_issues_token_for_new_user(monkeypatch, capsys):
+    """python auth.py create-user: пользователь в БД и токен, который принимает API"""
+    import sys
+
+    import crud
+    Base.metadata.create_all(bind=engine)
+    try:
+        monkeypatch.setattr(database, "SessionLocal", TestingSessionLocal, raising=False)
+        monkeypatch.setattr(sys, "argv", ["auth.py", "create-user", "Alice"])
+        auth.main()
+        lines = dict(line.split(":", 1) for line in capsys.readouterr().out.splitlines())
+        user_id = int(lines["user_id"])
+        with TestingSessionLocal() as db:
+            assert crud.get_user(db, user_id).name == "Alice"
+        assert auth.verify_token(lines["token"].strip(), "test-secret") == user_id
+    finally:
+        Base.metadata.drop_all(bind=engine)
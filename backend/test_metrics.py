@@ -0,0 +1,73 @@
+import logging
+
+from sqlalchemy import create_engine, text
+
+import metrics
+from metrics import Counter, Histogram, Registry
+
+
+def test_histogram_and_counter_render():
+    """Текстовый формат Prometheus: накопительные корзины, _sum, _count, экранирование"""
+    registry = Registry()
+    latency = registry.register(Histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1)))
+    requests = registry.register(Counter("requests_total", "Requests", ("route",)))
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value, "/tasks/")
+    requests.inc('/a"b')
+    registry.gauge_callback("pool", "Pool", lambda: {"size": 5})
+
+    lines = registry.render().splitlines()
+    assert "# TYPE latency_seconds histogram" in lines
+    assert 'latency_seconds_bucket{route="/tasks/",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/tasks/",le="1"} 3' in lines
+    assert 'latency_seconds_bucket{route="/tasks/",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{route="/tasks/"} 3.65' in lines
+    assert 'latency_seconds_count{route="/tasks/"} 4' in lines
+    assert 'requests_total{route="/a\\"b"} 1' in lines
+    assert 'pool{name="size"} 5' in lines
+
+
+def test_engine_events_count_queries_and_log_slow(caplog):
+    """События курсора: статистика запроса и журнал медленных SQL"""
+    engine = create_engine("sqlite://")
+    # Порог 0 мс: медленным считается любой запрос
+    metrics.instrument_engine(engine, slow_query_ms=0)
+
+    stats = metrics.RequestStats()
+    token = metrics._request_stats.set(stats)
+    try:
+        with caplog.at_level(logging.WARNING, logger="metrics"), engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 2"))
+    finally:
+        metrics._request_stats.reset(token)
+
+    assert stats.queries == 2
+    assert stats.db_time > 0
+    assert [r.getMessage().split(": ", 1)[1] for r in caplog.records] == ["SELECT 1", "SELECT 2"]
+
+
+def test_middleware_warns_about_n_plus_one(caplog):
+    """Больше query_threshold SQL-запросов на один HTTP-запрос - предупреждение"""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine)
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware, query_threshold=2)
+
+    @app.get("/items/{count}")
+    def read_items(count: int):
+        with engine.connect() as conn:
+            for _ in range(count):
+                conn.execute(text("SELECT 1"))
+
+    with caplog.at_level(logging.WARNING, logger="metrics"):
+        client = TestClient(app)
+        client.get("/items/2")
+        assert caplog.text == ""
+        client.get("/items/5")
+
+    assert "GET /items/{count} issued 5 SQL statements (threshold 2)" in caplog.text
+    assert metrics.n_plus_one.value("GET", "/items/{count}") == 1
@@ -0,0 +1,145 @@
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from alembic.config import Config
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+
+import crud
+import database
+import schemas
+from database import Base, migrate_schema
+from models import TaskStatus
+
+# Схема tasks до появы владельцев (первый коммит) - так ее создавал старый init_db.py
+BASELINE_DDL = [
+    """CREATE TABLE tasks (
+        id INTEGER NOT NULL PRIMARY KEY,
+        title VARCHAR,
+        description VARCHAR,
+        status VARCHAR(11),
+        created_at DATETIME DEFAULT (CURRENT_TIMESTAMP),
+        updated_at DATETIME DEFAULT (CURRENT_TIMESTAMP)
+    )""",
+    "CREATE INDEX ix_tasks_id ON tasks (id)",
+    "CREATE INDEX ix_tasks_title ON tasks (title)",
+    "CREATE INDEX ix_tasks_description ON tasks (description)",
+]
+
+HEAD = ScriptDirectory.from_config(Config(database.ALEMBIC_INI)).get_current_head()
+
+
+def _engine(tmp_path):
+    return create_engine(f"sqlite:///{tmp_path / 'migrate.db'}")
+
+
+def _migrate(engine):
+    with engine.begin() as conn:
+        migrate_schema(conn)
+
+
+def _revision(engine):
+    with engine.connect() as conn:
+        return MigrationContext.configure(conn).get_current_revision()
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    # Как в migrations/env.py: FTS5-таблицы поиска создаются DDL, а не моделями
+    return not (type_ == "table" and name.startswith("tasks_fts"))
+
+
+def _schema_diff(engine):
+    with engine.connect() as conn:
+        context = MigrationContext.configure(conn, opts={"include_object": include_object})
+        return compare_metadata(context, Base.metadata)
+
+
+def test_baseline_database_is_migrated(tmp_path):
+    """Старая база (без владельцев) доводится до моделей, данные сохраняются"""
+    engine = _engine(tmp_path)
+    with engine.begin() as conn:
+        for statement in BASELINE_DDL:
+            conn.execute(text(statement))
+        conn.execute(text(
+            "INSERT INTO tasks (title, description, status) VALUES "
+            "('Old todo', 'legacy notes', 'TODO'), ('Old done', NULL, 'DONE'), "
+            "('Another done', NULL, 'DONE')"
+        ))
+
+    _migrate(engine)
+    assert _revision(engine) == HEAD
+    assert _schema_diff(engine) == []
+    inspector = inspect(engine)
+    assert {"ix_tasks_title", "ix_tasks_description"}.isdisjoint(
+        index["name"] for index in inspector.get_indexes("tasks")
+    )
+
+    db = sessionmaker(autoflush=False, bind=engine)()
+    try:
+        owner = database.get_settings().DEFAULT_OWNER_ID
+        tasks = crud.get_tasks(db, owner)
+        assert [(t.title, t.version) for t in tasks] == [
+            ("Old todo", 1), ("Old done", 1), ("Another done", 1)
+        ]
+        assert crud.get_user(db, owner) is not None
+
+        # Счетчики заполнены из существующих задач
+        summary = crud.get_summary(db, owner)
+        assert summary.total == 3
+        assert summary.by_status[TaskStatus.DONE] == 2
+        assert crud.rebuild_summary(db, owner).consistent
+
+        # Поиск видит старый текст, новые записи индексируются триггерами
+        found, _ = crud.search_tasks(db, owner, "legacy")
+        assert [row.title for row in found] == ["Old todo"]
+        crud.create_task(db, owner, schemas.TaskCreate(title="Fresh", description="legacy too"))
+        found, _ = crud.search_tasks(db, owner, "legacy")
+        assert len(found) == 2
+    finally:
+        db.close()
+
+    # Повторный запуск ничего не меняет
+    _migrate(engine)
+    assert _revision(engine) == HEAD
+    engine.dispose()
+
+
+def test_pre_owner_database_moves_to_default_owner(tmp_path):
+    """База до появы владельцев (ревизия 0007): задачи, журнал и счетчики переходят к DEFAULT_OWNER_ID"""
+    engine = _engine(tmp_path)
+    config = Config(database.ALEMBIC_INI)
+    with engine.begin() as conn:
+        config.attributes["connection"] = conn
+        command.upgrade(config, "0007")
+        conn.execute(text(
+            "INSERT INTO tasks (title, description, status) VALUES ('Old', 'before owners', 'DONE')"
+        ))
+        conn.execute(text("INSERT INTO task_counters (status, count) VALUES ('done', 1)"))
+        conn.execute(text("INSERT INTO task_changes (task_id, op) VALUES (1, 'created')"))
+
+    _migrate(engine)
+    assert _revision(engine) == HEAD
+    assert _schema_diff(engine) == []
+
+    owner = database.get_settings().DEFAULT_OWNER_ID
+    with sessionmaker(autoflush=False, bind=engine)() as db:
+        assert crud.get_summary(db, owner).by_status[TaskStatus.DONE] == 1
+        assert crud.rebuild_summary(db, owner).consistent
+        # Журнал владельца: граница первой синхронизации - его последнее изменение
+        snapshot = crud.get_changes(db, owner)
+        assert [t.title for t in snapshot.upserted] == ["Old"] and snapshot.next_since == 1
+        found, _ = crud.search_tasks(db, owner, "owners")
+        assert [row.title for row in found] == ["Old"]
+    engine.dispose()
+
+
+def test_empty_database_is_created_and_stamped(tmp_path):
+    engine = _engine(tmp_path)
+    _migrate(engine)
+    assert _revision(engine) == HEAD
+    assert _schema_diff(engine) == []
+    # Владелец режима AUTH_MODE=single
+    with sessionmaker(bind=engine)() as db:
+        assert crud.get_user(db, database.get_settings().DEFAULT_OWNER_ID) is not None
+    engine.dispose()
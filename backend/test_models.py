@@ -39,4 +39,52 @@ def test_task_model_creates_table_correctly():
     assert "status" in column_names
 
     # --- Шаг 5: (Опционально) Чистим за собой ---
-    Base.metadata.drop_all(bind=engine)
\ No newline at end of file
+    Base.metadata.drop_all(bind=engine)
+
+def test_task_model_has_composite_indexes():
+    """
+    Проверяем, что фильтры списка обслуживаются составными
+    индексами, а необъятное поле description не индексируется.
+    """
+    Base.metadata.create_all(bind=engine)
+
+    indexes = {ix["name"]: ix["column_names"] for ix in inspect(engine).get_indexes("tasks")}
+
+    assert indexes["ix_tasks_owner_status_updated_at_id"] == ["owner_id", "status", "updated_at", "id"]
+    assert indexes["ix_tasks_owner_updated_at_id"] == ["owner_id", "updated_at", "id"]
+    assert not any("description" in cols for cols in indexes.values())
+    # Каждый запрос ограничен владельцем: составные индексы начинаются с owner_id
+    assert all(cols[0] == "owner_id" for cols in indexes.values() if len(cols) > 1)
+
+    Base.metadata.drop_all(bind=engine)
+
+def test_partition_ddl():
+    """HASH-секционирование по владельцу: по одной секции на каждый остаток"""
+    import models
+
+    assert models.partition_ddl(2) == [
+        "CREATE TABLE tasks_p0 PARTITION OF tasks FOR VALUES WITH (MODULUS 2, REMAINDER 0)",
+        "CREATE TABLE tasks_p1 PARTITION OF tasks FOR VALUES WITH (MODULUS 2, REMAINDER 1)",
+    ]
+    assert models.partition_ddl(0) == []
+
+def test_partitioned_schema_is_decided_at_create_time():
+    """Секционирование - свойство схемы в БД: модель и ORM от него не зависят"""
+    from sqlalchemy import create_mock_engine
+
+    import models
+
+    statements = []
+    mock = create_mock_engine(
+        "postgresql://", lambda sql, *args, **kwargs: statements.append(str(sql.compile(dialect=mock.dialect)))
+    )
+    models.partitioned_metadata(2).create_all(mock, checkfirst=False)
+
+    create_tasks = next(sql for sql in statements if sql.strip().startswith("CREATE TABLE tasks "))
+    assert "PRIMARY KEY (id, owner_id)" in create_tasks
+    assert "PARTITION BY HASH (owner_id)" in create_tasks
+    assert any("tasks_p1 PARTITION OF tasks" in sql for sql in statements)
+    assert any("search_vector" in sql for sql in statements)
+    # Общая схема (и маппинг Task) не изменилась
+    assert [column.name for column in models.Task.__table__.primary_key] == ["id"]
+    assert models.Task.__table__.dialect_options["postgresql"]["partition_by"] is None